@@ -0,0 +1,276 @@
+"""
+Agregación de resultados en memoria constante - Modelo Publisher-Subscriber
+Mantiene totales, conteos y resúmenes de distribución por cliente y por cola
+sin guardar cada resultado. Opcionalmente conserva los resultados crudos en
+un arreglo compacto de enteros de 64 bits.
+
+Los resultados que traen marcas de tiempo alimentan además histogramas de
+latencia por etapa (ver latencias.py), por cliente y por cola.
+
+Los clientes con la opción de agregados envían resúmenes por cola (cantidad,
+suma, mínimo y máximo) en lugar de cada resultado; se combinan igual que los
+lotes, salvo que no alimentan el histograma ni el arreglo de resultados crudos.
+
+AgregadorFragmentado reparte las conexiones entre varios fragmentos, cada uno
+con su propio lock, para que los hilos de resultados no compitan por un único
+lock global; los fragmentos se combinan solo al generar el reporte.
+"""
+
+import itertools
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from latencias import LatenciasEtapas, latencias_por_etapa
+
+# Cubetas del histograma: la cubeta i cuenta valores con i bits (0, 1, 2-3, 4-7, ...)
+CUBETAS_HISTOGRAMA = 65
+
+
+class EstadisticasFlujo:
+    """Conteo, suma, mínimo, máximo e histograma opcional de una serie de enteros."""
+
+    __slots__ = ('cantidad', 'suma', 'minimo', 'maximo', 'histograma')
+
+    def __init__(self, con_histograma: bool = False):
+        self.cantidad = 0
+        self.suma = 0
+        self.minimo = None
+        self.maximo = None
+        self.histograma = [0] * CUBETAS_HISTOGRAMA if con_histograma else None
+
+    def agregar_lote(self, valores: List[int]):
+        """Incorpora un lote de valores."""
+        if not valores:
+            return
+        self.cantidad += len(valores)
+        self.suma += sum(valores)
+        minimo = min(valores)
+        maximo = max(valores)
+        if self.minimo is None or minimo < self.minimo:
+            self.minimo = minimo
+        if self.maximo is None or maximo > self.maximo:
+            self.maximo = maximo
+        if self.histograma is not None:
+            histograma = self.histograma
+            for valor in valores:
+                histograma[abs(valor).bit_length()] += 1
+
+    def agregar_resumen(self, cantidad: int, suma: int, minimo: int, maximo: int):
+        """Incorpora una serie de la que solo se conoce el resumen."""
+        if cantidad == 0:
+            return
+        self.cantidad += cantidad
+        self.suma += suma
+        if self.minimo is None or minimo < self.minimo:
+            self.minimo = minimo
+        if self.maximo is None or maximo > self.maximo:
+            self.maximo = maximo
+
+    def combinar(self, otra: 'EstadisticasFlujo'):
+        """Suma a estas estadísticas las de otra serie."""
+        if otra.cantidad == 0:
+            return
+        self.agregar_resumen(otra.cantidad, otra.suma, otra.minimo, otra.maximo)
+        if self.histograma is not None and otra.histograma is not None:
+            self.histograma = [a + b for a, b in zip(self.histograma, otra.histograma)]
+
+    @property
+    def media(self) -> float:
+        return self.suma / self.cantidad if self.cantidad else 0.0
+
+    def resumen(self) -> str:
+        """Texto de una línea con mínimo, máximo y media."""
+        if not self.cantidad:
+            return "sin datos"
+        return f"mín {self.minimo:,}, máx {self.maximo:,}, media {self.media:,.1f}"
+
+    def lineas_histograma(self) -> List[str]:
+        """Líneas de texto con las cubetas no vacías del histograma."""
+        if self.histograma is None:
+            return []
+        lineas = []
+        for bits, cantidad in enumerate(self.histograma):
+            if cantidad:
+                desde = 0 if bits == 0 else 1 << (bits - 1)
+                hasta = (1 << bits) - 1
+                lineas.append(f"[{desde:,} - {hasta:,}]: {cantidad:,}")
+        return lineas
+
+
+class AlmacenResultados:
+    """Resultados crudos en un arreglo compacto (8 bytes por resultado)."""
+
+    def __init__(self):
+        self.valores = array('q')
+
+    def agregar_lote(self, valores: Iterable[int]):
+        self.valores.extend(valores)
+
+    def combinar(self, otro: 'AlmacenResultados'):
+        self.valores.extend(otro.valores)
+
+    def __len__(self):
+        return len(self.valores)
+
+
+class AgregadorResultados:
+    """
+    Estadísticas de resultados globales, por cliente y por cola.
+    No es seguro entre hilos: quien lo usa debe serializar el acceso.
+    """
+
+    def __init__(self, con_histograma: bool = False, guardar_resultados: bool = False):
+        self.con_histograma = con_histograma
+        self.total = EstadisticasFlujo(con_histograma)
+        self.por_cliente: Dict[str, EstadisticasFlujo] = {}
+        self.por_cola: Dict[str, EstadisticasFlujo] = {}
+        self.suscripciones: Dict[str, Set[str]] = defaultdict(set)
+        self.almacen = AlmacenResultados() if guardar_resultados else None
+        self.latencias_por_cliente: Dict[str, LatenciasEtapas] = {}
+        self.latencias_por_cola: Dict[str, LatenciasEtapas] = {}
+        # Resultados que llegaron resumidos en agregados y registros de agregado recibidos
+        self.resultados_agregados = 0
+        self.registros_agregados = 0
+
+    def _estadisticas(self, tabla: Dict[str, EstadisticasFlujo], clave: str) -> EstadisticasFlujo:
+        estadisticas = tabla.get(clave)
+        if estadisticas is None:
+            estadisticas = tabla[clave] = EstadisticasFlujo(self.con_histograma)
+        return estadisticas
+
+    @staticmethod
+    def _latencias(tabla: Dict[str, LatenciasEtapas], clave: str) -> LatenciasEtapas:
+        latencias = tabla.get(clave)
+        if latencias is None:
+            latencias = tabla[clave] = LatenciasEtapas()
+        return latencias
+
+    def registrar(self, cliente_id: str, resultados: List[int], colas_suscritas: Set[str],
+                  colas_resultado: Optional[List[str]] = None,
+                  tiempos: Optional[List[Tuple[int, int, int]]] = None, llegada: int = 0):
+        """
+        Registra un lote de resultados de un cliente.
+
+        Args:
+            cliente_id: Cliente que envió los resultados
+            resultados: Valores de los resultados
+            colas_suscritas: Colas a las que está suscrito el cliente
+            colas_resultado: Cola de origen de cada resultado, si se conoce
+            tiempos: Marcas (timestamp, envío, procesamiento) de cada resultado, si
+                las trae; requiere colas_resultado
+            llegada: Instante de llegada del lote (time.monotonic_ns())
+        """
+        self.total.agregar_lote(resultados)
+        self._estadisticas(self.por_cliente, cliente_id).agregar_lote(resultados)
+        self.suscripciones[cliente_id].update(colas_suscritas)
+
+        if colas_resultado is not None:
+            por_cola = defaultdict(list)
+            for cola, resultado in zip(colas_resultado, resultados):
+                por_cola[cola].append(resultado)
+            for cola, valores in por_cola.items():
+                self._estadisticas(self.por_cola, cola).agregar_lote(valores)
+
+            if tiempos is not None:
+                latencias_cliente = self._latencias(self.latencias_por_cliente, cliente_id)
+                for (cola, marcas), cantidad in Counter(zip(colas_resultado, tiempos)).items():
+                    LatenciasEtapas.registrar_en(
+                        [latencias_cliente, self._latencias(self.latencias_por_cola, cola)],
+                        latencias_por_etapa(*marcas, llegada), cantidad
+                    )
+
+        if self.almacen is not None:
+            self.almacen.agregar_lote(resultados)
+
+    def registrar_agregados(self, cliente_id: str, agregados: List[Tuple[str, int, int, int, int]],
+                            colas_suscritas: Set[str]):
+        """
+        Registra los resúmenes que envió un cliente con la opción de agregados.
+
+        Args:
+            cliente_id: Cliente que envió los agregados
+            agregados: Tuplas (cola, cantidad, suma, mínimo, máximo)
+            colas_suscritas: Colas a las que está suscrito el cliente
+        """
+        por_cliente = self._estadisticas(self.por_cliente, cliente_id)
+        self.suscripciones[cliente_id].update(colas_suscritas)
+        for cola, cantidad, suma, minimo, maximo in agregados:
+            self.total.agregar_resumen(cantidad, suma, minimo, maximo)
+            por_cliente.agregar_resumen(cantidad, suma, minimo, maximo)
+            self._estadisticas(self.por_cola, cola).agregar_resumen(cantidad, suma, minimo, maximo)
+            self.resultados_agregados += cantidad
+        self.registros_agregados += len(agregados)
+
+    def combinar(self, otro: 'AgregadorResultados'):
+        """Suma a este agregador los datos de otro."""
+        self.total.combinar(otro.total)
+        self.resultados_agregados += otro.resultados_agregados
+        self.registros_agregados += otro.registros_agregados
+        for cliente_id, estadisticas in otro.por_cliente.items():
+            self._estadisticas(self.por_cliente, cliente_id).combinar(estadisticas)
+        for cola, estadisticas in otro.por_cola.items():
+            self._estadisticas(self.por_cola, cola).combinar(estadisticas)
+        for cliente_id, colas in otro.suscripciones.items():
+            self.suscripciones[cliente_id].update(colas)
+        if self.almacen is not None and otro.almacen is not None:
+            self.almacen.combinar(otro.almacen)
+        for cliente_id, latencias in otro.latencias_por_cliente.items():
+            self._latencias(self.latencias_por_cliente, cliente_id).combinar(latencias)
+        for cola, latencias in otro.latencias_por_cola.items():
+            self._latencias(self.latencias_por_cola, cola).combinar(latencias)
+
+    def latencias_totales(self) -> LatenciasEtapas:
+        """Latencias de todos los resultados (cada uno pertenece a exactamente una cola)."""
+        totales = LatenciasEtapas()
+        for latencias in self.latencias_por_cola.values():
+            totales.combinar(latencias)
+        return totales
+
+
+class AgregadorFragmentado:
+    """
+    Agregador repartido en fragmentos independientes, seguro entre hilos.
+    Cada conexión registra siempre en el mismo fragmento.
+    """
+
+    def __init__(self, fragmentos: int = 16, con_histograma: bool = False, guardar_resultados: bool = False):
+        self.con_histograma = con_histograma
+        self.guardar_resultados = guardar_resultados
+        self.locks = [threading.Lock() for _ in range(max(1, fragmentos))]
+        self.fragmentos = [AgregadorResultados(con_histograma, guardar_resultados) for _ in self.locks]
+        self._siguiente = itertools.count()
+
+    def asignar_fragmento(self) -> int:
+        """Fragmento para una nueva conexión (round-robin)."""
+        return next(self._siguiente) % len(self.fragmentos)
+
+    def registrar(self, fragmento: int, cliente_id: str, resultados: List[int], colas_suscritas: Set[str],
+                  colas_resultado: Optional[List[str]] = None,
+                  tiempos: Optional[List[Tuple[int, int, int]]] = None, llegada: int = 0):
+        """Registra un lote de resultados en el fragmento indicado."""
+        with self.locks[fragmento]:
+            self.fragmentos[fragmento].registrar(cliente_id, resultados, colas_suscritas, colas_resultado,
+                                                 tiempos, llegada)
+
+    def registrar_agregados(self, fragmento: int, cliente_id: str, agregados: List[Tuple[str, int, int, int, int]],
+                            colas_suscritas: Set[str]):
+        """Registra los agregados de un cliente en el fragmento indicado."""
+        with self.locks[fragmento]:
+            self.fragmentos[fragmento].registrar_agregados(cliente_id, agregados, colas_suscritas)
+
+    def total(self) -> int:
+        """
+        Resultados registrados en todos los fragmentos. Se lee sin locks:
+        cada conteo es un entero, así que la suma nunca excede el valor real.
+        """
+        return sum(agregador.total.cantidad for agregador in self.fragmentos)
+
+    def combinar(self) -> AgregadorResultados:
+        """Combina todos los fragmentos en un único agregador para el reporte."""
+        combinado = AgregadorResultados(self.con_histograma, self.guardar_resultados)
+        for lock, agregador in zip(self.locks, self.fragmentos):
+            with lock:
+                combinado.combinar(agregador)
+        return combinado
@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del sistema Publisher-Subscriber.
+Cada subcomando mide un componente de forma aislada.
+
+Uso:
+    python3 benchmark.py codec [--mensajes N]
+    python3 benchmark.py despacho [--mensajes N] [--suscriptores N]
+    python3 benchmark.py generacion [--mensajes N]
+    python3 benchmark.py contadores [--lotes N] [--lote N]
+    python3 benchmark.py tramas [--tramas N]
+    python3 benchmark.py persistencia [--mensajes N]
+    python3 benchmark.py confirmaciones [--objetivo N] [--clientes N]
+    python3 benchmark.py ventana [--objetivo N] [--rapidos N] [--demora S]
+    python3 benchmark.py transporte [--mensajes N]
+    python3 benchmark.py funciones [--mensajes N] [--funciones NOMBRE,...]
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import pickle
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from queue import Queue, Empty
+
+from agregacion import AgregadorResultados, AgregadorFragmentado
+from despachador import Despachador
+from generador import GeneradorLotes, CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL, np
+from topicos import REGISTRO_PREDETERMINADO
+from memoria_compartida import AnilloMensajes, AVISO, MEMORIA_COMPARTIDA_DISPONIBLE
+from protocolo import (
+    COLAS, CODIGO_COLA, CABECERA, LectorTramas, enviar_tramas, empaquetar_trama,
+    codificar_mensajes, decodificar_mensajes, codificar_resultados, decodificar_resultados,
+)
+
+
+def medir(funcion, repeticiones: int) -> float:
+    """Ejecuta la función `repeticiones` veces y devuelve los segundos transcurridos."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return time.perf_counter() - inicio
+
+
+def benchmark_codec(args):
+    """Compara tamaño y coste de codificación pickle vs. binario por mensaje."""
+    n = args.mensajes
+    mensajes = []
+    for i in range(n):
+        cantidad = random.choice([2, 3])
+        mensajes.append({
+            'id': i,
+            'numeros': [random.randint(1, 100) for _ in range(cantidad)],
+            'cola': random.choice(COLAS),
+            'timestamp': time.monotonic_ns()
+        })
+    resultados = [(m['id'], CODIGO_COLA[m['cola']], sum(m['numeros']) ** 2) for m in mensajes]
+    colas_suscritas = {COLAS[0], COLAS[1]}
+
+    # Formato anterior: un dict con pickle por mensaje y por resultado
+    pickles_msg = [pickle.dumps(m) for m in mensajes]
+    pickles_res = [pickle.dumps({'cliente_id': 'cliente_1', 'resultado': r, 'colas_suscritas': colas_suscritas})
+                   for _, _, r in resultados]
+    t_cod_msg_p = medir(lambda: [pickle.dumps(m) for m in mensajes], 1)
+    t_dec_msg_p = medir(lambda: [pickle.loads(d) for d in pickles_msg], 1)
+    t_cod_res_p = medir(lambda: [pickle.dumps({'cliente_id': 'cliente_1', 'resultado': r,
+                                               'colas_suscritas': colas_suscritas})
+                                 for _, _, r in resultados], 1)
+    t_dec_res_p = medir(lambda: [pickle.loads(d) for d in pickles_res], 1)
+
+    # Formato binario: una trama por mensaje (como envía el servidor) y lotes de resultados
+    binarios_msg = [codificar_mensajes([m]) for m in mensajes]
+    lote = 100
+    lotes_res = [resultados[i:i + lote] for i in range(0, n, lote)]
+    binarios_res = [codificar_resultados(l) for l in lotes_res]
+    t_cod_msg_b = medir(lambda: [codificar_mensajes([m]) for m in mensajes], 1)
+    t_dec_msg_b = medir(lambda: [decodificar_mensajes(d) for d in binarios_msg], 1)
+    t_cod_res_b = medir(lambda: [codificar_resultados(l) for l in lotes_res], 1)
+    t_dec_res_b = medir(lambda: [decodificar_resultados(d) for d in binarios_res], 1)
+
+    def fila(nombre, bytes_total, t_cod, t_dec):
+        print(f"{nombre:<28}{bytes_total / n:>12.1f}{t_cod / n * 1e6:>14.2f}{t_dec / n * 1e6:>14.2f}")
+
+    print(f"Codec ({n:,} mensajes, lotes de {lote} resultados)")
+    print("-" * 68)
+    print(f"{'Formato':<28}{'bytes/msg':>12}{'codif. µs':>14}{'decodif. µs':>14}")
+    print("-" * 68)
+    fila("mensaje pickle", sum(map(len, pickles_msg)) + 4 * n, t_cod_msg_p, t_dec_msg_p)
+    fila("mensaje binario", sum(map(len, binarios_msg)) + 4 * n, t_cod_msg_b, t_dec_msg_b)
+    fila("resultado pickle", sum(map(len, pickles_res)) + 4 * n, t_cod_res_p, t_dec_res_p)
+    fila("resultado binario (lote)", sum(map(len, binarios_res)) + 4 * len(binarios_res),
+         t_cod_res_b, t_dec_res_b)
+
+
+def benchmark_despacho(args):
+    """
+    Mide la latencia añadida al despertar a un suscriptor de dos colas cuando
+    llega un mensaje a la segunda, y el consumo de CPU con suscriptores inactivos.
+    Compara el despachador con el sondeo anterior (Queue.get(timeout=0.1) por cola).
+    """
+    colas = ('a', 'b')
+
+    def latencias_despachador(n):
+        despachador = Despachador(colas)
+        suscripcion = despachador.suscribir(colas)
+        latencias = []
+
+        def consumidor():
+            while len(latencias) < n:
+                for enviado in despachador.obtener(suscripcion, 1, 1.0):
+                    latencias.append(time.perf_counter_ns() - enviado)
+
+        hilo = threading.Thread(target=consumidor)
+        hilo.start()
+        for _ in range(n):
+            time.sleep(0.0005)  # el consumidor vuelve a dormir
+            despachador.publicar('b', time.perf_counter_ns())
+        hilo.join()
+        return latencias
+
+    def latencias_sondeo(n):
+        queues = {cola: Queue() for cola in colas}
+        latencias = []
+
+        def consumidor():
+            while len(latencias) < n:
+                orden = list(colas)
+                random.shuffle(orden)
+                for cola in orden:
+                    try:
+                        enviado = queues[cola].get(timeout=0.1)
+                        latencias.append(time.perf_counter_ns() - enviado)
+                        break
+                    except Empty:
+                        continue
+
+        hilo = threading.Thread(target=consumidor)
+        hilo.start()
+        for _ in range(n):
+            time.sleep(0.0005)
+            queues['b'].put(time.perf_counter_ns())
+            while queues['b'].qsize():
+                time.sleep(0.0005)
+        hilo.join()
+        return latencias
+
+    def cpu_inactivo(esperar, segundos=1.0):
+        detener = threading.Event()
+        hilos = [threading.Thread(target=esperar, args=(detener,)) for _ in range(args.suscriptores)]
+        for hilo in hilos:
+            hilo.start()
+        inicio = time.process_time()
+        time.sleep(segundos)
+        consumo = time.process_time() - inicio
+        detener.set()
+        return consumo, hilos
+
+    despachador = Despachador(colas)
+
+    def esperar_despachador(detener):
+        suscripcion = despachador.suscribir(colas)
+        while not detener.is_set():
+            despachador.obtener(suscripcion, 1, 0.5)
+
+    queues = {cola: Queue() for cola in colas}
+
+    def esperar_sondeo(detener):
+        while not detener.is_set():
+            for cola in colas:
+                try:
+                    queues[cola].get(timeout=0.1)
+                except Empty:
+                    continue
+
+    def resumen(nombre, latencias):
+        latencias = sorted(latencias)
+        p50 = latencias[len(latencias) // 2] / 1000
+        p99 = latencias[int(len(latencias) * 0.99)] / 1000
+        print(f"{nombre:<24}{len(latencias):>10}{p50:>14.1f}{p99:>14.1f}{statistics.mean(latencias) / 1000:>14.1f}")
+
+    print("Latencia al despertar (mensaje en la segunda cola suscrita)")
+    print("-" * 76)
+    print(f"{'Modo':<24}{'muestras':>10}{'p50 µs':>14}{'p99 µs':>14}{'media µs':>14}")
+    print("-" * 76)
+    resumen("despachador", latencias_despachador(args.mensajes))
+    resumen("sondeo get(timeout)", latencias_sondeo(min(args.mensajes, 50)))
+
+    print(f"\nCPU con {args.suscriptores} suscriptores inactivos durante 1 s")
+    print("-" * 76)
+    for nombre, esperar in (("despachador", esperar_despachador), ("sondeo get(timeout)", esperar_sondeo)):
+        consumo, hilos = cpu_inactivo(esperar)
+        if esperar is esperar_despachador:
+            despachador.cerrar()
+        print(f"{nombre:<24}{consumo * 1000:>10.1f} ms de CPU")
+        for hilo in hilos:
+            hilo.join()
+
+
+def benchmark_generacion(args):
+    """
+    Compara la generación mensaje a mensaje (PublisherServer.generar_mensaje)
+    con la generación por lotes, y muestra la proporción de mensajes por cola
+    para comprobar que ambas siguen la misma distribución.
+    """
+    from server_integrated import PublisherServer
+
+    n = args.mensajes
+    lote = 1000
+    print(f"Generación de {n:,} mensajes (lotes de {lote})")
+    print("-" * 84)
+    print(f"{'Criterio':<14}{'Modo':<16}{'msgs/s':>14}" + "".join(f"{cola:>13}" for cola in COLAS))
+    print("-" * 84)
+
+    for criterio in (CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL):
+        servidor = PublisherServer.__new__(PublisherServer)
+        servidor.criterio = criterio
+        servidor.topicos = REGISTRO_PREDETERMINADO
+        modos = [("por mensaje", None), ("lotes python", GeneradorLotes(criterio, usar_numpy=False))]
+        if np is not None:
+            modos.append(("lotes numpy", GeneradorLotes(criterio)))
+
+        for nombre, generador in modos:
+            conteo = {cola: 0 for cola in COLAS}
+            inicio = time.perf_counter()
+            if generador is None:
+                for i in range(n):
+                    conteo[servidor.generar_mensaje(i)['cola']] += 1
+            else:
+                for primer_id in range(0, n, lote):
+                    for cola, mensajes in generador.generar(primer_id, lote).items():
+                        conteo[cola] += len(mensajes)
+            segundos = time.perf_counter() - inicio
+            total = sum(conteo.values())
+            print(f"{criterio:<14}{nombre:<16}{total / segundos:>14,.0f}"
+                  + "".join(f"{conteo[cola] / total:>13.3f}" for cola in COLAS))
+
+
+def benchmark_contadores(args):
+    """
+    Compara el registro de resultados bajo un único lock global (como antes)
+    con el agregador fragmentado, con 1 a 16 hilos registrando a la vez.
+    Cada hilo simula una conexión de resultados que envía lotes ya decodificados.
+    """
+    colas_suscritas = {COLAS[0]}
+    resultados = [random.randint(4, 90_000) for _ in range(args.lote)]
+    colas_resultado = [COLAS[0]] * args.lote
+
+    def ingesta_global(hilos):
+        agregador = AgregadorResultados()
+        lock = threading.Lock()
+        estado = {'total': 0}
+
+        def registrar(cliente_id):
+            with lock:
+                agregador.registrar(cliente_id, resultados, colas_suscritas, colas_resultado)
+                estado['total'] += len(resultados)
+
+        return registrar, lambda: estado['total']
+
+    def ingesta_fragmentada(hilos):
+        agregador = AgregadorFragmentado()
+        fragmentos = {}
+
+        def registrar(cliente_id):
+            fragmento = fragmentos.get(cliente_id)
+            if fragmento is None:
+                fragmento = fragmentos[cliente_id] = agregador.asignar_fragmento()
+            agregador.registrar(fragmento, cliente_id, resultados, colas_suscritas, colas_resultado)
+            agregador.total()  # verificación del objetivo tras cada lote
+
+        return registrar, agregador.total
+
+    def medir_ingesta(crear, hilos):
+        registrar, total = crear(hilos)
+        lotes_por_hilo = args.lotes // hilos
+        barrera = threading.Barrier(hilos + 1)
+
+        def trabajador(cliente_id):
+            barrera.wait()
+            for _ in range(lotes_por_hilo):
+                registrar(cliente_id)
+
+        trabajadores = [threading.Thread(target=trabajador, args=(f'cliente_{i}',)) for i in range(hilos)]
+        for hilo in trabajadores:
+            hilo.start()
+        barrera.wait()
+        inicio = time.perf_counter()
+        for hilo in trabajadores:
+            hilo.join()
+        return total() / (time.perf_counter() - inicio)
+
+    print(f"Registro de {args.lotes:,} lotes de {args.lote} resultados")
+    print("-" * 54)
+    print(f"{'Hilos':<10}{'lock global res/s':>22}{'fragmentado res/s':>22}")
+    print("-" * 54)
+    for hilos in (1, 2, 4, 8, 16):
+        global_ = medir_ingesta(ingesta_global, hilos)
+        fragmentado = medir_ingesta(ingesta_fragmentada, hilos)
+        print(f"{hilos:<10}{global_:>22,.0f}{fragmentado:>22,.0f}")
+
+
+class SocketContado:
+    """Envoltorio de un socket que cuenta las llamadas de lectura y escritura."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.llamadas = 0
+
+    def recv(self, n):
+        self.llamadas += 1
+        return self.sock.recv(n)
+
+    def recv_into(self, bufer):
+        self.llamadas += 1
+        return self.sock.recv_into(bufer)
+
+    def sendall(self, datos):
+        self.llamadas += 1
+        return self.sock.sendall(datos)
+
+    def sendmsg(self, partes):
+        self.llamadas += 1
+        return self.sock.sendmsg(partes)
+
+
+def benchmark_tramas(args):
+    """
+    Compara la lectura de tramas anterior (recv(4) y luego recv del cuerpo
+    concatenando con +=) y el envío cabecera+cuerpo concatenados, con
+    LectorTramas (recv_into sobre un búfer reutilizable) y enviar_tramas
+    (sendmsg). Cuenta llamadas al socket por trama y tramas por segundo.
+    """
+    n = args.tramas
+    cuerpos = [codificar_mensajes([{'id': i, 'cola': COLAS[0], 'numeros': [1, 2, 3], 'timestamp': 0}] * 64)
+               for i in range(64)]
+
+    def leer_anterior(sock):
+        tamaño_data = sock.recv(4)
+        if len(tamaño_data) < 4:
+            return None
+        tamaño = CABECERA.unpack(tamaño_data)[0]
+        datos = b''
+        while len(datos) < tamaño:
+            chunk = sock.recv(tamaño - len(datos))
+            if not chunk:
+                return None
+            datos += chunk
+        return datos
+
+    def escribir_anterior(sock, cuerpo):
+        sock.sendall(empaquetar_trama(cuerpo))
+
+    def medir_modo(nuevo):
+        a, b = socket.socketpair()
+        emisor, receptor = SocketContado(a), SocketContado(b)
+
+        def enviar():
+            for i in range(0, n, 8):
+                grupo = [cuerpos[(i + j) % len(cuerpos)] for j in range(min(8, n - i))]
+                if nuevo:
+                    enviar_tramas(emisor, grupo)
+                else:
+                    for cuerpo in grupo:
+                        escribir_anterior(emisor, cuerpo)
+            a.shutdown(socket.SHUT_WR)
+
+        hilo = threading.Thread(target=enviar)
+        inicio = time.perf_counter()
+        hilo.start()
+        recibidas = 0
+        if nuevo:
+            lector = LectorTramas(receptor)
+            while True:
+                tramas = lector.leer_tramas()
+                if not tramas:
+                    break
+                recibidas += len(tramas)
+        else:
+            while leer_anterior(receptor) is not None:
+                recibidas += 1
+        hilo.join()
+        segundos = time.perf_counter() - inicio
+        a.close()
+        b.close()
+        return recibidas, segundos, emisor.llamadas, receptor.llamadas
+
+    print(f"Tramas de {len(cuerpos[0]):,} bytes ({n:,} tramas, grupos de 8 por envío)")
+    print("-" * 78)
+    print(f"{'Modo':<26}{'tramas/s':>14}{'lecturas/trama':>18}{'escrituras/trama':>20}")
+    print("-" * 78)
+    for nombre, nuevo in (("recv(4) + recv, sendall", False), ("recv_into + sendmsg", True)):
+        recibidas, segundos, escrituras, lecturas = medir_modo(nuevo)
+        print(f"{nombre:<26}{recibidas / segundos:>14,.0f}{lecturas / recibidas:>18.2f}{escrituras / recibidas:>20.2f}")
+
+
+def benchmark_persistencia(args):
+    """
+    Compara el rendimiento del despachador solo en memoria con el registro
+    en disco para varios intervalos de fsync (group commit), con un productor
+    y un consumidor suscrito a las tres colas. Mide además el tiempo de
+    recuperación de colas llenas al reiniciar.
+    """
+    n = args.mensajes
+    lote = 1000
+    generador = GeneradorLotes(CRITERIO_ALEATORIO, semilla=1)
+    lotes = [generador.generar(primer_id, lote) for primer_id in range(0, n, lote)]
+
+    def medir_despachador(directorio, intervalo):
+        despachador = Despachador(COLAS, directorio_persistencia=directorio, intervalo_fsync=intervalo)
+        suscripcion = despachador.suscribir(COLAS)
+        total = sum(len(mensajes) for grupo in lotes for mensajes in grupo.values())
+
+        def consumidor():
+            recibidos = 0
+            while recibidos < total:
+                recibidos += len(despachador.obtener(suscripcion, 64, 1.0))
+
+        hilo = threading.Thread(target=consumidor)
+        inicio = time.perf_counter()
+        hilo.start()
+        for grupo in lotes:
+            for cola, mensajes in grupo.items():
+                despachador.publicar_lote(cola, mensajes)
+        hilo.join()
+        despachador.cerrar_persistencia()
+        segundos = time.perf_counter() - inicio
+        sincronizaciones = despachador.persistencia.sincronizaciones if despachador.persistencia else 0
+        return total / segundos, sincronizaciones
+
+    print(f"Despachador con {n:,} mensajes (1 productor, 1 consumidor)")
+    print("-" * 60)
+    print(f"{'Modo':<28}{'msgs/s':>16}{'confirmaciones':>16}")
+    print("-" * 60)
+    tasa_memoria, _ = medir_despachador(None, 0.1)
+    print(f"{'memoria':<28}{tasa_memoria:>16,.0f}{'-':>16}")
+    for intervalo in (1.0, 0.1, 0.01):
+        with tempfile.TemporaryDirectory() as directorio:
+            tasa, sincronizaciones = medir_despachador(directorio, intervalo)
+        nombre = f"disco, fsync cada {intervalo * 1000:g} ms"
+        print(f"{nombre:<28}{tasa:>16,.0f}{sincronizaciones:>16,}"
+              f"   ({tasa / tasa_memoria:.0%} de memoria)")
+
+    # Reinicio: colas llenas sin consumidores, cerrar y volver a abrir
+    with tempfile.TemporaryDirectory() as directorio:
+        despachador = Despachador(COLAS, directorio_persistencia=directorio)
+        for grupo in lotes:
+            for cola, mensajes in grupo.items():
+                despachador.publicar_lote(cola, mensajes)
+        despachador.cerrar_persistencia()
+        inicio = time.perf_counter()
+        despachador = Despachador(COLAS, directorio_persistencia=directorio)
+        segundos = time.perf_counter() - inicio
+        despachador.cerrar_persistencia()
+    print(f"\nRecuperación al reiniciar: {despachador.recuperados:,} mensajes en {segundos * 1000:.1f} ms")
+
+
+def benchmark_confirmaciones(args):
+    """
+    Compara la entrega sin confirmación con la entrega al menos una vez de
+    extremo a extremo: servidor en proceso y clientes suscritos a las tres
+    colas, midiendo el tiempo hasta alcanzar el objetivo de resultados.
+    """
+    from server_integrated import PublisherServer, ENTREGA_SIN_CONFIRMACION, ENTREGA_AL_MENOS_UNA_VEZ
+    from client_integrated import SubscriberClient
+
+    def medir_entrega(entrega):
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            puerto = sock.getsockname()[1]
+        server = PublisherServer(CRITERIO_ALEATORIO, 'localhost', puerto, objetivo=args.objetivo, entrega=entrega)
+        server.mostrar_progreso = False
+        hilo_servidor = threading.Thread(target=server.servir, daemon=True)
+        hilo_servidor.start()
+        time.sleep(0.3)
+
+        clientes = [SubscriberClient(f"bench-{i}", 'localhost', puerto, confirmar=True)
+                    for i in range(args.clientes)]
+        hilos = [threading.Thread(target=cliente.ejecutar, daemon=True) for cliente in clientes]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        while server.running and server.total_resultados < args.objetivo and any(h.is_alive() for h in hilos):
+            time.sleep(0.01)
+        segundos = time.perf_counter() - inicio
+        server.detener()
+        hilo_servidor.join(10)
+        for hilo in hilos:
+            hilo.join(5)
+        return args.objetivo / segundos, sum(server.despachador.reencolados.values())
+
+    print(f"Entrega de extremo a extremo: {args.objetivo:,} resultados, {args.clientes} clientes")
+    print("-" * 60)
+    print(f"{'Modo':<28}{'resultados/s':>16}{'reencolados':>16}")
+    print("-" * 60)
+    for entrega in (ENTREGA_SIN_CONFIRMACION, ENTREGA_AL_MENOS_UNA_VEZ):
+        mejor, reencolados = 0.0, 0
+        for _ in range(3):
+            with contextlib.redirect_stdout(io.StringIO()):
+                tasa, reencolados_ronda = medir_entrega(entrega)
+            if tasa > mejor:
+                mejor, reencolados = tasa, reencolados_ronda
+        print(f"{entrega:<28}{mejor:>16,.0f}{reencolados:>16,}")
+
+
+def benchmark_ventana(args):
+    """
+    Clientes heterogéneos con y sin ventana de crédito: varios clientes
+    rápidos y uno lento (con una demora fija por mensaje) suscritos a las
+    tres colas. Mide el ritmo hasta el objetivo y cuántos mensajes retiene
+    el cliente lento (entregados y aún sin procesar) al terminar.
+    """
+    from server_integrated import PublisherServer
+    from client_integrated import SubscriberClient
+
+    class ClienteLento(SubscriberClient):
+        def procesar_mensajes(self, mensajes):
+            time.sleep(args.demora * len(mensajes))
+            return super().procesar_mensajes(mensajes)
+
+    def medir_ventana(ventana):
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            puerto = sock.getsockname()[1]
+        server = PublisherServer(CRITERIO_ALEATORIO, 'localhost', puerto, objetivo=args.objetivo)
+        server.mostrar_progreso = False
+        hilo_servidor = threading.Thread(target=server.servir, daemon=True)
+        hilo_servidor.start()
+        time.sleep(0.3)
+
+        clientes = [SubscriberClient(f"rapido-{i}", 'localhost', puerto, ventana=ventana)
+                    for i in range(args.rapidos)]
+        lento = ClienteLento('lento', 'localhost', puerto, ventana=ventana)
+        clientes.append(lento)
+        for cliente in clientes:
+            cliente.colas_suscritas = set(COLAS)
+        hilos = [threading.Thread(target=cliente.ejecutar, daemon=True) for cliente in clientes]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        while server.running and server.total_resultados < args.objetivo and any(h.is_alive() for h in hilos):
+            time.sleep(0.01)
+        segundos = time.perf_counter() - inicio
+        utilizacion = server.despachador.utilizacion_clientes()
+        retenidos = utilizacion['lento']['entregados'] - lento.mensajes_procesados
+        server.detener()
+        hilo_servidor.join(10)
+        return args.objetivo / segundos, utilizacion['lento']['entregados'], retenidos
+
+    print(f"{args.rapidos} clientes rápidos y 1 lento ({args.demora * 1000:g} ms por mensaje), "
+          f"{args.objetivo:,} resultados")
+    print("-" * 76)
+    print(f"{'Ventana':<16}{'resultados/s':>16}{'entregados al lento':>22}{'retenidos':>22}")
+    print("-" * 76)
+    for ventana in (0, 4096, 1024, 256, 32):
+        with contextlib.redirect_stdout(io.StringIO()):
+            tasa, entregados, retenidos = medir_ventana(ventana)
+        nombre = f"{ventana}" if ventana else "sin ventana"
+        print(f"{nombre:<16}{tasa:>16,.0f}{entregados:>22,}{retenidos:>22,}")
+
+
+def productor_transporte(puerto: int, segmento: str, n: int):
+    """
+    Proceso productor del benchmark de transporte: publica `n` mensajes
+    como lo hace el servidor, en tramas de MAX_MENSAJES_POR_TRAMA por TCP o
+    en el anillo de memoria compartida `segmento` (con avisos por TCP).
+    """
+    from server_integrated import MAX_MENSAJES_POR_TRAMA, MAX_MENSAJES_POR_ESCRITURA_ANILLO, ESPERA_ANILLO_LLENO
+    mensajes = [{'id': i, 'cola': COLAS[i % len(COLAS)], 'numeros': [i % 100, 7, 3][:2 + i % 2], 'timestamp': i}
+                for i in range(MAX_MENSAJES_POR_ESCRITURA_ANILLO)]
+    sock = socket.create_connection(('localhost', puerto))
+    anillo = AnilloMensajes.abrir(segmento) if segmento else None
+    enviados = 0
+    while enviados < n:
+        if anillo is None:
+            lote = min(MAX_MENSAJES_POR_TRAMA, n - enviados)
+            enviar_tramas(sock, [codificar_mensajes(mensajes[:lote], time.monotonic_ns())])
+        else:
+            lote = min(anillo.libres(), MAX_MENSAJES_POR_ESCRITURA_ANILLO, n - enviados)
+            if not lote:
+                time.sleep(ESPERA_ANILLO_LLENO)
+                continue
+            if anillo.escribir(mensajes[:lote], time.monotonic_ns(), CODIGO_COLA):
+                sock.sendall(AVISO)
+        enviados += lote
+    if anillo is not None:
+        anillo.cerrar()
+    sock.close()
+
+
+def benchmark_transporte(args):
+    """
+    Compara la entrega de mensajes de un productor en otro proceso por TCP
+    (codificar, sendmsg, recv_into y decodificar tramas) con el anillo de
+    memoria compartida (copiar registros y decodificarlos en el lugar).
+    Solo mide el transporte: sin procesamiento ni resultados.
+    """
+    from client_integrated import SubscriberClient, INTERVALO_ESPERA_ANILLO
+    n = args.mensajes
+    contexto = multiprocessing.get_context('spawn')
+
+    def medir_transporte(memoria_compartida):
+        anillo = AnilloMensajes.crear() if memoria_compartida else None
+        with socket.socket() as servidor:
+            servidor.bind(('localhost', 0))
+            servidor.listen(1)
+            productor = contexto.Process(target=productor_transporte,
+                                         args=(servidor.getsockname()[1], anillo and anillo.nombre, n))
+            productor.start()
+            sock, _ = servidor.accept()
+        inicio = time.perf_counter()
+        recibidos = 0
+        if anillo is None:
+            lector = LectorTramas(sock)
+            while True:
+                tramas = lector.leer_tramas()
+                if not tramas:
+                    break
+                for datos in tramas:
+                    recibidos += len(decodificar_mensajes(datos))
+        else:
+            while True:
+                mensajes = anillo.leer(COLAS, con_tiempos=True)
+                recibidos += len(mensajes)
+                if not mensajes and not anillo.esperar(sock, INTERVALO_ESPERA_ANILLO):
+                    recibidos += len(anillo.leer(COLAS, con_tiempos=True))
+                    break
+            anillo.cerrar()
+        segundos = time.perf_counter() - inicio
+        productor.join()
+        sock.close()
+        return recibidos, segundos
+
+    modos = [("TCP (tramas)", False)]
+    if MEMORIA_COMPARTIDA_DISPONIBLE:
+        modos.append(("memoria compartida", True))
+    print(f"Transporte de {n:,} mensajes de un proceso a otro en la misma máquina")
+    print("-" * 60)
+    print(f"{'Modo':<24}{'mensajes/s':>16}{'µs/mensaje':>16}")
+    print("-" * 60)
+    for nombre, memoria_compartida in modos:
+        recibidos, segundos = medir_transporte(memoria_compartida)
+        print(f"{nombre:<24}{recibidos / segundos:>16,.0f}{segundos / recibidos * 1e6:>16.2f}")
+
+
+def benchmark_funciones(args):
+    """
+    Coste de las funciones de procesamiento sin caché, con caché LRU y con
+    la tabla precalculada, sobre los mismos mensajes (2 o 3 números de 1 a
+    100, como los del generador). La tabla se construye antes de medir; su
+    coste se muestra aparte.
+    """
+    from funciones import Procesador, CACHES
+    rng = random.Random(0)
+    lote = [[rng.randint(1, 100) for _ in range(rng.choice([2, 3]))] for _ in range(args.mensajes)]
+    nombres = [nombre.strip() for nombre in args.funciones.split(',')]
+
+    print(f"Procesamiento de {len(lote):,} mensajes")
+    print("-" * 84)
+    print(f"{'Función':<16}{'Caché':<10}{'construcción (s)':>18}{'mensajes/s':>14}{'aciertos':>14}{'entradas':>12}")
+    print("-" * 84)
+    for nombre in nombres:
+        for cache in CACHES:
+            inicio = time.perf_counter()
+            procesador = Procesador(nombre, cache)
+            construccion = time.perf_counter() - inicio
+            segundos = medir(lambda: [procesador(numeros) for numeros in lote], 1)
+            datos = procesador.estadisticas()
+            consultas = datos['aciertos'] + datos['fallos']
+            aciertos = f"{datos['aciertos'] / consultas:.1%}" if consultas else "-"
+            print(f"{nombre:<16}{cache:<10}{construccion:>18.2f}{len(lote) / segundos:>14,.0f}"
+                  f"{aciertos:>14}{datos['entradas']:>12,}")
+            del procesador
+
+
+def main():
+    """Función principal de los benchmarks."""
+    parser = argparse.ArgumentParser(description='Benchmarks Publisher-Subscriber')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    parser_codec = subparsers.add_parser('codec', help='Tamaño y coste del codec pickle vs. binario')
+    parser_codec.add_argument('--mensajes', type=int, default=100_000, help='Mensajes a codificar')
+    parser_codec.set_defaults(funcion=benchmark_codec)
+
+    parser_despacho = subparsers.add_parser('despacho', help='Latencia y CPU inactiva del despachador de colas')
+    parser_despacho.add_argument('--mensajes', type=int, default=2000, help='Mensajes para medir latencia')
+    parser_despacho.add_argument('--suscriptores', type=int, default=100, help='Suscriptores inactivos')
+    parser_despacho.set_defaults(funcion=benchmark_despacho)
+
+    parser_generacion = subparsers.add_parser('generacion', help='Generación por mensaje vs. por lotes')
+    parser_generacion.add_argument('--mensajes', type=int, default=200_000, help='Mensajes a generar')
+    parser_generacion.set_defaults(funcion=benchmark_generacion)
+
+    parser_contadores = subparsers.add_parser('contadores', help='Registro de resultados: lock global vs. fragmentos')
+    parser_contadores.add_argument('--lotes', type=int, default=20_000, help='Lotes de resultados a registrar')
+    parser_contadores.add_argument('--lote', type=int, default=100, help='Resultados por lote')
+    parser_contadores.set_defaults(funcion=benchmark_contadores)
+
+    parser_tramas = subparsers.add_parser('tramas', help='Lectura y escritura de tramas: recv vs. recv_into/sendmsg')
+    parser_tramas.add_argument('--tramas', type=int, default=50_000, help='Tramas a transmitir')
+    parser_tramas.set_defaults(funcion=benchmark_tramas)
+
+    parser_persistencia = subparsers.add_parser('persistencia', help='Colas en memoria vs. registradas en disco')
+    parser_persistencia.add_argument('--mensajes', type=int, default=300_000, help='Mensajes a publicar')
+    parser_persistencia.set_defaults(funcion=benchmark_persistencia)
+
+    parser_confirmaciones = subparsers.add_parser('confirmaciones', help='Entrega sin confirmación vs. al menos una vez')
+    parser_confirmaciones.add_argument('--objetivo', type=int, default=200_000, help='Resultados por ejecución')
+    parser_confirmaciones.add_argument('--clientes', type=int, default=4, help='Clientes suscritos a todas las colas')
+    parser_confirmaciones.set_defaults(funcion=benchmark_confirmaciones)
+
+    parser_ventana = subparsers.add_parser('ventana', help='Clientes heterogéneos con y sin ventana de crédito')
+    parser_ventana.add_argument('--objetivo', type=int, default=100_000, help='Resultados por ejecución')
+    parser_ventana.add_argument('--rapidos', type=int, default=3, help='Clientes rápidos')
+    parser_ventana.add_argument('--demora', type=float, default=0.001, help='Segundos por mensaje del cliente lento')
+    parser_ventana.set_defaults(funcion=benchmark_ventana)
+
+    parser_transporte = subparsers.add_parser('transporte', help='Entrega local por TCP vs. memoria compartida')
+    parser_transporte.add_argument('--mensajes', type=int, default=1_000_000, help='Mensajes a transmitir')
+    parser_transporte.set_defaults(funcion=benchmark_transporte)
+
+    parser_funciones = subparsers.add_parser('funciones', help='Funciones de procesamiento sin caché, LRU y tabla')
+    parser_funciones.add_argument('--mensajes', type=int, default=500_000, help='Mensajes a procesar')
+    parser_funciones.add_argument('--funciones', type=str, default='suma_cuadrado,collatz',
+                                  help='Funciones a medir, separadas por comas')
+    parser_funciones.set_defaults(funcion=benchmark_funciones)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+
+if __name__ == "__main__":
+    main()
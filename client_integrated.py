@@ -5,30 +5,83 @@ Se conecta al servidor, se suscribe a colas y procesa mensajes.
 """
 
 import argparse
+import multiprocessing
 import random
+import select
 import time
 import threading
 import socket
 import pickle
-import struct
-from typing import List, Set
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from queue import Queue
+from typing import Dict, List, Optional, Set, Tuple
 
-# Colas disponibles
-COLA_PRINCIPAL = "principal"
-COLA_SECUNDARIA = "secundaria"
-COLA_TERCIARIA = "terciaria"
+from protocolo import (
+    VERSION_PICKLE, VERSION_BINARIO, OPCION_CONFIRMACIONES, OPCION_VENTANA, OPCION_LATENCIAS,
+    OPCION_MEMORIA_COMPARTIDA, OPCION_AGREGADOS,
+    LectorTramas, enviar_tramas, codificar_saludo, decodificar_aceptacion, decodificar_segmento_aceptacion,
+    decodificar_mensajes, codificar_resultados, codificar_agregados, codificar_confirmacion,
+)
+from agregacion import EstadisticasFlujo
+from funciones import (
+    FUNCIONES, FUNCION_PREDETERMINADA, CACHES, CACHE_NINGUNA, CAPACIDAD_CACHE, buscar_funcion, obtener_procesador,
+)
+from memoria_compartida import AnilloMensajes
+from perfilado import TiemposEtapas, Perfilador, crear_hilo, texto_tiempos, DIRECTORIO_PERFILES
+from topicos import RegistroTopicos, REGISTRO_PREDETERMINADO, cargar_registro
 
 # Configuración de red
 SERVER_HOST = "localhost"
 SERVER_PORT = 8888
 
+# Envío de resultados por lotes sobre una conexión persistente
+TAMAÑO_LOTE_RESULTADOS = 100
+INTERVALO_ENVIO_RESULTADOS = 0.05  # segundos máximos que un resultado espera en el buffer
+
+# Resultados que resume cada envío de agregados si --agregar no indica otro valor
+RESULTADOS_POR_AGREGADO = 10000
+
+# Modos de procesamiento
+MODO_SECUENCIAL = "secuencial"
+MODO_PIPELINE = "pipeline"
+POOL_HILOS = "hilos"
+POOL_PROCESOS = "procesos"
+
+# Pipeline: mensajes por lote de procesamiento y lotes en vuelo entre etapas
+TAMAÑO_LOTE_PIPELINE = 256
+PROFUNDIDAD_PIPELINE = 8
+
+# Espera máxima sobre un anillo vacío antes de volver a comprobarlo (por si se perdió un aviso)
+INTERVALO_ESPERA_ANILLO = 0.05
+
+
+def procesar_lote_numeros(lote: List[Tuple[int, List[int]]],
+                          especificaciones: Tuple[Tuple[str, str, int], ...]) -> List[int]:
+    """
+    Procesa un lote de pares (índice de procesador, números). Cada
+    especificación es (función, caché, capacidad); los procesadores se crean
+    una vez por proceso (ver funciones.obtener_procesador), así que la caché
+    persiste entre lotes. Es una función de módulo para poder ejecutarse en
+    un pool de procesos.
+    """
+    procesadores = [obtener_procesador(*especificacion) for especificacion in especificaciones]
+    return [procesadores[indice](numeros) for indice, numeros in lote]
+
 
 class SubscriberClient:
     """
     Cliente que actúa como Subscriber en el modelo Publisher-Subscriber.
     """
     
-    def __init__(self, cliente_id: str, server_host: str = SERVER_HOST, server_port: int = SERVER_PORT):
+    def __init__(self, cliente_id: str, server_host: str = SERVER_HOST, server_port: int = SERVER_PORT,
+                 tamaño_lote: int = TAMAÑO_LOTE_RESULTADOS, version_protocolo: int = VERSION_BINARIO,
+                 modo: str = MODO_SECUENCIAL, trabajadores: int = 2, pool: str = POOL_HILOS,
+                 confirmar: bool = False, ventana: int = 0, topicos: RegistroTopicos = REGISTRO_PREDETERMINADO,
+                 suscripciones: Optional[List[str]] = None, memoria_compartida: bool = False,
+                 agregar: int = 0, funcion: str = FUNCION_PREDETERMINADA,
+                 funciones_colas: Optional[Dict[str, str]] = None, cache: str = CACHE_NINGUNA,
+                 capacidad_cache: int = CAPACIDAD_CACHE, perfilar: Optional[str] = None):
         """
         Inicializa el cliente Subscriber.
         
@@ -36,145 +89,570 @@ class SubscriberClient:
             cliente_id: Identificador único del cliente
             server_host: Dirección del servidor
             server_port: Puerto del servidor
+            tamaño_lote: Número de resultados que se envían juntos en una trama
+            version_protocolo: VERSION_BINARIO o VERSION_PICKLE (compatibilidad)
+            modo: secuencial (recibir, procesar y enviar uno a uno) o pipeline
+            trabajadores: Tamaño del pool de procesamiento en modo pipeline
+            pool: Tipo de pool en modo pipeline (hilos o procesos)
+            confirmar: Ofrecer confirmaciones al servidor (entrega al menos una vez)
+            ventana: Mensajes sin confirmar que el cliente admite a la vez (0: sin ventana)
+            topicos: Registro de tópicos (el mismo que usa el servidor)
+            suscripciones: Patrones de tópicos ('pedidos.*', '*'); sin patrones, 1 o 2 colas al azar
+            memoria_compartida: Pedir los mensajes por memoria compartida (si el servidor
+                está en esta máquina y lo acepta; si no, TCP)
+            agregar: Enviar en lugar de cada resultado un resumen por cola cada
+                `agregar` resultados (0: cada resultado; sin opción en el servidor, también)
+            funcion: Función de procesamiento (ver funciones.py)
+            funciones_colas: Función para las colas que coinciden con cada patrón
+                ({'alertas': 'collatz'}); las demás usan `funcion`
+            cache: Caché de los resultados de las funciones (ninguna, lru o tabla)
+            capacidad_cache: Entradas de la caché LRU
+            perfilar: Directorio donde guardar un perfil de cProfile por rol de hilo (None: sin perfilar)
         """
         self.cliente_id = cliente_id
         self.server_host = server_host
         self.server_port = server_port
+        self.tamaño_lote = max(1, tamaño_lote)
+        self.version_protocolo = version_protocolo
+        self.modo = modo
+        self.trabajadores = max(1, trabajadores)
+        self.pool = pool
+        self.confirmar = confirmar and version_protocolo == VERSION_BINARIO
+        self.ventana = max(0, ventana) if version_protocolo == VERSION_BINARIO else 0
+        self.topicos = topicos
         self.running = True
+        self.mensajes_procesados = 0
+        
+        # Canal persistente de resultados (se abre una sola vez por cliente)
+        self.socket_resultados = None
+        self.resultados_pendientes = []
+        self.lock_resultados = threading.Lock()
+        
+        # Confirmaciones acumulativas por el canal de mensajes (si el servidor acepta
+        # confirmaciones o la ventana de crédito)
+        self.socket_mensajes = None
+        self.confirmaciones = False
+        
+        # Devolver con cada resultado las marcas de tiempo del mensaje (si el servidor lo acepta)
+        self.con_tiempos = False
+        
+        # Anillo de memoria compartida por el que llegan los mensajes, si se negoció
+        self.memoria_compartida = memoria_compartida and version_protocolo == VERSION_BINARIO
+        self.anillo = None
+        
+        # Resúmenes por código de cola pendientes de enviar (si el servidor acepta agregados)
+        self.agregar = max(0, agregar) if version_protocolo == VERSION_BINARIO else 0
+        self.agregando = False
+        self.agregados: Dict[int, EstadisticasFlujo] = {}
+        self.resultados_por_agregar = 0
+        self.ultimo_agregado = 0  # id del último mensaje resumido
         
-        # Decidir si se suscribe a 1 o 2 colas (50% probabilidad cada una)
-        if random.random() < 0.5:
-            # Suscripción a una cola
-            cola_elegida = random.choice([COLA_PRINCIPAL, COLA_SECUNDARIA, COLA_TERCIARIA])
-            self.colas_suscritas = {cola_elegida}
+        # Tiempos por etapa (siempre activos) y perfiles opcionales por hilo
+        self.tiempos = TiemposEtapas()
+        self.perfilador = Perfilador(perfilar, cliente_id) if perfilar else None
+        
+        if suscripciones:
+            self.colas_suscritas = topicos.resolver(suscripciones)
+        elif random.random() < 0.5 or len(topicos) < 2:
+            # Suscripción a una cola (50% probabilidad)
+            self.colas_suscritas = {random.choice(topicos.nombres)}
         else:
             # Suscripción a dos colas
-            colas_disponibles = [COLA_PRINCIPAL, COLA_SECUNDARIA, COLA_TERCIARIA]
-            self.colas_suscritas = set(random.sample(colas_disponibles, 2))
+            self.colas_suscritas = set(random.sample(topicos.nombres, 2))
+        
+        # Función de procesamiento de cada cola: especificaciones distintas
+        # (función, caché, capacidad) y el índice de la que usa cada cola
+        funcion_cola = {cola: funcion for cola in topicos.nombres}
+        for patron, nombre in (funciones_colas or {}).items():
+            for cola in topicos.resolver([patron]):
+                funcion_cola[cola] = nombre
+        especificaciones = []
+        self.indice_procesador: Dict[str, int] = {}
+        for cola, nombre in funcion_cola.items():
+            especificacion = (nombre, cache, capacidad_cache)
+            if especificacion not in especificaciones:
+                especificaciones.append(especificacion)
+            self.indice_procesador[cola] = especificaciones.index(especificacion)
+        self.especificaciones = tuple(especificaciones)
+        self.procesadores = {cola: obtener_procesador(*self.especificaciones[indice])
+                             for cola, indice in self.indice_procesador.items()}
+        self.procesador = obtener_procesador(funcion, cache, capacidad_cache)
         
         print(f"Cliente {cliente_id} iniciado. Suscrito a: {', '.join(sorted(self.colas_suscritas))}")
     
-    def procesar_numeros(self, numeros: List[int]) -> int:
+    def procesar_numeros(self, numeros: List[int], cola: Optional[str] = None) -> int:
         """
-        Procesa un conjunto de números y retorna el resultado.
-        Suma los números y eleva al cuadrado.
+        Procesa un conjunto de números y retorna el resultado, con la función
+        de la cola (o la del cliente, sin cola). La predeterminada suma los
+        números y eleva al cuadrado.
         
         Args:
             numeros: Lista de números a procesar
+            cola: Cola de la que proviene el mensaje
             
         Returns:
             Resultado del procesamiento
         """
-        suma = sum(numeros)
-        resultado = suma ** 2
-        return resultado
+        procesador = self.procesadores[cola] if cola is not None else self.procesador
+        return procesador(numeros)
+    
+    def procesar_mensajes(self, mensajes: List[Dict]) -> List[int]:
+        """Resultados de un lote de mensajes, cada uno con la función de su cola."""
+        procesadores = self.procesadores
+        return [procesadores[mensaje['cola']](mensaje['numeros']) for mensaje in mensajes]
+    
+    def resumen_caches(self) -> List[str]:
+        """Una línea por procesador con caché de las colas suscritas (usados en este proceso)."""
+        if self.modo == MODO_PIPELINE and self.pool == POOL_PROCESOS:
+            return []  # las cachés viven en los procesos del pool
+        procesadores = {id(self.procesadores[cola]): self.procesadores[cola] for cola in sorted(self.colas_suscritas)}
+        return [procesador.resumen() for procesador in procesadores.values() if procesador.cache != CACHE_NINGUNA]
     
-    def enviar_resultado(self, resultado: int):
+    def conectar_resultados(self):
+        """Abre la conexión persistente hacia el servidor de resultados."""
+        self.socket_resultados = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket_resultados.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket_resultados.connect((self.server_host, self.server_port + 1))
+        
+        # En modo binario la conexión se abre con el saludo que identifica al cliente
+        saludo = self.saludo_resultados()
+        if saludo is not None:
+            enviar_tramas(self.socket_resultados, [saludo])
+    
+    def enviar_resultado(self, resultado: int, mensaje_id: int = 0, cola: Optional[str] = None):
         """
-        Envía el resultado al servidor.
+        Agrega un resultado al buffer y envía el lote cuando está completo.
         
         Args:
             resultado: Resultado a enviar
+            mensaje_id: ID del mensaje del que proviene el resultado
+            cola: Cola de la que proviene el mensaje (por defecto, el primer tópico del registro)
+        """
+        codigo = self.topicos.codigos[cola] if cola is not None else 0
+        self.enviar_resultados([(mensaje_id, codigo, resultado)])
+    
+    def enviar_resultados(self, registros: List[Tuple[int, int, int]]):
+        """
+        Agrega varios resultados al buffer y envía el lote cuando está completo.
+        
+        Args:
+            registros: Tuplas (id del mensaje, código de cola, resultado)
+        """
+        with self.lock_resultados:
+            if self.agregando:
+                self.acumular_agregados(registros)
+                if self.resultados_por_agregar >= self.agregar:
+                    self.vaciar_resultados()
+                return
+            self.resultados_pendientes.extend(registros)
+            if len(self.resultados_pendientes) >= self.tamaño_lote:
+                self.vaciar_resultados()
+    
+    def acumular_agregados(self, registros: List[Tuple]):
+        """Suma los resultados a los resúmenes de su cola en lugar de guardarlos."""
+        if not registros:
+            return
+        por_cola = defaultdict(list)
+        for registro in registros:
+            por_cola[registro[1]].append(registro[2])
+        for codigo, valores in por_cola.items():
+            estadisticas = self.agregados.get(codigo)
+            if estadisticas is None:
+                estadisticas = self.agregados[codigo] = EstadisticasFlujo()
+            estadisticas.agregar_lote(valores)
+        self.resultados_por_agregar += len(registros)
+        self.ultimo_agregado = registros[-1][0]
+    
+    def trama_pendiente(self) -> Optional[Tuple[bytes, int]]:
+        """
+        Cuerpo de la trama con lo pendiente (agregados o resultados) y el id
+        del último mensaje que cubre, o None si no hay nada. Vacía el buffer.
         """
+        if self.agregados:
+            agregados = [(codigo, estadisticas.cantidad, estadisticas.suma, estadisticas.minimo, estadisticas.maximo)
+                         for codigo, estadisticas in self.agregados.items()]
+            self.agregados = {}
+            self.resultados_por_agregar = 0
+            return codificar_agregados(agregados), self.ultimo_agregado
+        
+        if not self.resultados_pendientes:
+            return None
+        pendientes = self.resultados_pendientes
+        self.resultados_pendientes = []
+        if self.version_protocolo == VERSION_BINARIO:
+            return codificar_resultados(pendientes), pendientes[-1][0]
+        return pickle.dumps({
+            'cliente_id': self.cliente_id,
+            'resultados': [resultado for _, _, resultado in pendientes],
+            'colas_suscritas': self.colas_suscritas
+        }), pendientes[-1][0]
+    
+    def vaciar_resultados(self):
+        """
+        Envía en una sola trama todos los resultados (o agregados) pendientes.
+        Debe llamarse con self.lock_resultados adquirido.
+        """
+        if self.socket_resultados is None:
+            return
+        inicio = time.perf_counter_ns()
+        pendiente = self.trama_pendiente()
+        self.tiempos.sumar('serializacion_resultados', inicio)
+        if pendiente is None:
+            return
+        cuerpo, ultimo_id = pendiente
+        
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.server_host, self.server_port + 1))
-            
-            # Enviar datos
-            datos = {
-                'cliente_id': self.cliente_id,
-                'resultado': resultado,
-                'colas_suscritas': self.colas_suscritas
-            }
-            
-            datos_serializados = pickle.dumps(datos)
-            tamaño = len(datos_serializados)
-            
-            # Enviar tamaño primero
-            sock.sendall(struct.pack('!I', tamaño))
-            # Enviar datos
-            sock.sendall(datos_serializados)
-            
-            sock.close()
+            inicio = time.perf_counter_ns()
+            enviar_tramas(self.socket_resultados, [cuerpo])
+            if self.confirmaciones and self.socket_mensajes is not None:
+                # Los resultados salen en el orden de entrega: el último confirma todo el lote
+                # (y devuelve su crédito si hay ventana)
+                enviar_tramas(self.socket_mensajes, [codificar_confirmacion(ultimo_id)])
+            self.tiempos.sumar('envio_resultados', inicio)
         except Exception as e:
-            print(f"Cliente {self.cliente_id}: Error al enviar resultado: {e}")
+            print(f"Cliente {self.cliente_id}: Error al enviar resultados: {e}")
+            self.running = False
+            # Sin canal no se vuelve a intentar: el resto del lote en curso se descarta
+            self.socket_resultados.close()
+            self.socket_resultados = None
     
-    def recibir_mensajes(self):
+    def vaciar_periodicamente(self):
+        """Vacía el buffer de resultados cada INTERVALO_ENVIO_RESULTADOS segundos."""
+        while self.running:
+            time.sleep(INTERVALO_ENVIO_RESULTADOS)
+            with self.lock_resultados:
+                self.vaciar_resultados()
+    
+    def cerrar_resultados(self):
+        """Envía los resultados pendientes y cierra el canal de resultados."""
+        with self.lock_resultados:
+            self.vaciar_resultados()
+            if self.socket_resultados is not None:
+                self.socket_resultados.close()
+                self.socket_resultados = None
+    
+    def recibir_lote(self, lector: LectorTramas) -> Optional[List[Dict]]:
         """
-        Se conecta al servidor y recibe mensajes de las colas suscritas.
+        Recibe del servidor todas las tramas disponibles y las decodifica.
+        
+        Returns:
+            Lista de mensajes, o None si el servidor cerró la conexión
         """
-        mensajes_procesados = 0
+        if self.anillo is not None:
+            inicio = time.perf_counter_ns()
+            mensajes = self.recibir_lote_anillo(lector.sock)
+            self.tiempos.sumar('lectura_anillo', inicio)
+            return mensajes
+        
+        inicio = time.perf_counter_ns()
+        tramas = lector.leer_tramas()
+        inicio = self.tiempos.sumar('recepcion', inicio)
+        if not tramas:
+            return None
         
+        if self.version_protocolo == VERSION_BINARIO:
+            nombres = self.topicos.nombres
+            if len(tramas) == 1:
+                mensajes = decodificar_mensajes(tramas[0], nombres)
+            else:
+                mensajes = [mensaje for datos in tramas for mensaje in decodificar_mensajes(datos, nombres)]
+        else:
+            mensajes = [pickle.loads(datos) for datos in tramas]
+        self.tiempos.sumar('decodificacion', inicio)
+        return mensajes
+    
+    def recibir_lote_anillo(self, sock) -> Optional[List[Dict]]:
+        """
+        Espera mensajes en el anillo de memoria compartida y los devuelve
+        todos. Devuelve None cuando el servidor cerró y el anillo quedó vacío.
+        """
+        while True:
+            mensajes = self.anillo.leer(self.topicos.nombres, self.con_tiempos)
+            if mensajes:
+                return mensajes
+            if not self.running:
+                return None
+            if not self.anillo.esperar(sock, INTERVALO_ESPERA_ANILLO):
+                return self.anillo.leer(self.topicos.nombres, self.con_tiempos) or None
+    
+    def hay_mensajes(self, lector: LectorTramas) -> bool:
+        """Indica sin esperar si ya hay más mensajes para leer."""
+        if self.anillo is not None:
+            return self.anillo.disponibles() > 0
+        return bool(select.select([lector.sock], [], [], 0)[0])
+    
+    def registros_resultados(self, mensajes: List[Dict], resultados: List[int], recibido: int) -> List[Tuple]:
+        """
+        Tuplas para el canal de resultados. Con tiempos agregan las marcas del
+        mensaje y lo que tardó su lote desde que se recibió (`recibido`,
+        time.monotonic_ns() del cliente) hasta tener los resultados.
+        """
+        codigos = self.topicos.codigos
+        if not self.con_tiempos:
+            return [(mensaje['id'], codigos[mensaje['cola']], resultado)
+                    for mensaje, resultado in zip(mensajes, resultados)]
+        procesamiento = time.monotonic_ns() - recibido
+        return [(mensaje['id'], codigos[mensaje['cola']], resultado,
+                 mensaje['timestamp'], mensaje['enviado'], procesamiento)
+                for mensaje, resultado in zip(mensajes, resultados)]
+    
+    def registrar_procesados(self, cantidad: int):
+        """Suma mensajes procesados y muestra el progreso cada 1000."""
+        anterior = self.mensajes_procesados
+        self.mensajes_procesados += cantidad
+        if self.mensajes_procesados // 1000 > anterior // 1000:
+            print(f"Cliente {self.cliente_id}: {self.mensajes_procesados:,} mensajes procesados")
+    
+    def procesar_secuencial(self, lector: LectorTramas):
+        """Recibe, procesa y envía cada mensaje en el mismo hilo."""
+        while self.running:
+            try:
+                mensajes = self.recibir_lote(lector)
+                if mensajes is None:
+                    break
+                recibido = time.monotonic_ns()
+                
+                # Procesar números y enviar los resultados del lote
+                inicio = time.perf_counter_ns()
+                resultados = self.procesar_mensajes(mensajes)
+                inicio = self.tiempos.sumar('procesamiento', inicio)
+                registros = self.registros_resultados(mensajes, resultados, recibido)
+                self.tiempos.sumar('armado_resultados', inicio)
+                self.enviar_resultados(registros)
+                
+                self.registrar_procesados(len(mensajes))
+                
+            except socket.timeout:
+                continue
+            except Exception as e:
+                print(f"Cliente {self.cliente_id}: Error recibiendo mensaje: {e}")
+                break
+    
+    def procesar_en_pipeline(self, lector: LectorTramas):
+        """
+        Procesa los mensajes en tres etapas conectadas por colas acotadas:
+        lectura (este hilo) → procesamiento en un pool de hilos o procesos →
+        envío de resultados por lotes. El orden de los lotes se conserva.
+        """
+        if self.pool == POOL_PROCESOS:
+            # spawn: hacer fork de un proceso con hilos activos puede dejar locks tomados
+            executor = ProcessPoolExecutor(self.trabajadores, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = ThreadPoolExecutor(self.trabajadores)
+        recibidos = Queue(maxsize=PROFUNDIDAD_PIPELINE)
+        en_proceso = Queue(maxsize=PROFUNDIDAD_PIPELINE)
+        indices = self.indice_procesador
+        
+        def etapa_procesamiento():
+            while True:
+                elemento = recibidos.get()
+                if elemento is None:
+                    en_proceso.put(None)
+                    return
+                mensajes, recibido = elemento
+                inicio = time.perf_counter_ns()
+                futuro = executor.submit(
+                    procesar_lote_numeros,
+                    [(indices[mensaje['cola']], mensaje['numeros']) for mensaje in mensajes], self.especificaciones
+                )
+                self.tiempos.sumar('entrega_al_pool', inicio)
+                en_proceso.put((mensajes, recibido, futuro))
+        
+        def etapa_envio():
+            while True:
+                elemento = en_proceso.get()
+                if elemento is None:
+                    return
+                mensajes, recibido, futuro = elemento
+                inicio = time.perf_counter_ns()
+                try:
+                    resultados = futuro.result()
+                except Exception as e:
+                    print(f"Cliente {self.cliente_id}: Error procesando lote: {e}")
+                    self.running = False
+                    continue
+                inicio = self.tiempos.sumar('espera_procesamiento', inicio)
+                registros = self.registros_resultados(mensajes, resultados, recibido)
+                self.tiempos.sumar('armado_resultados', inicio)
+                self.enviar_resultados(registros)
+                self.registrar_procesados(len(mensajes))
+        
+        hilos = [
+            crear_hilo(self.perfilador, etapa_procesamiento, 'pipeline_procesamiento'),
+            crear_hilo(self.perfilador, etapa_envio, 'pipeline_envio'),
+        ]
+        for hilo in hilos:
+            hilo.start()
+        
+        # Etapa de lectura: junta en un lote todas las tramas ya disponibles en el socket
         try:
-            # Conectar al servidor de mensajes
+            while self.running:
+                lote = self.recibir_lote(lector)
+                if lote is None:
+                    break
+                recibido = time.monotonic_ns()
+                while len(lote) < TAMAÑO_LOTE_PIPELINE and self.hay_mensajes(lector):
+                    mensajes = self.recibir_lote(lector)
+                    if mensajes is None:
+                        self.running = False
+                        break
+                    lote.extend(mensajes)
+                recibidos.put((lote, recibido))
+        except Exception as e:
+            print(f"Cliente {self.cliente_id}: Error recibiendo mensaje: {e}")
+        finally:
+            recibidos.put(None)
+            for hilo in hilos:
+                hilo.join()
+            executor.shutdown()
+    
+    def opciones_saludo(self) -> int:
+        """Opciones que el cliente anuncia en el saludo del canal de mensajes (bits OPCION_*)."""
+        opciones = 0
+        if self.agregar:
+            # Los agregados no llevan marcas de tiempo: no se piden latencias
+            opciones |= OPCION_AGREGADOS
+        elif self.version_protocolo == VERSION_BINARIO:
+            opciones |= OPCION_LATENCIAS
+        if self.confirmar:
+            opciones |= OPCION_CONFIRMACIONES
+        if self.ventana:
+            opciones |= OPCION_VENTANA
+        if self.memoria_compartida:
+            opciones |= OPCION_MEMORIA_COMPARTIDA
+        return opciones
+    
+    def datos_suscripcion(self, opciones: int) -> bytes:
+        """Trama de suscripción del canal de mensajes (el primer byte indica el formato)."""
+        if self.version_protocolo == VERSION_BINARIO:
+            return codificar_saludo(self.cliente_id, self.colas_suscritas, opciones or None,
+                                    self.ventana, self.topicos.codigos)
+        return pickle.dumps({
+            'cliente_id': self.cliente_id,
+            'colas': self.colas_suscritas
+        })
+    
+    def saludo_resultados(self) -> Optional[bytes]:
+        """Saludo con el que se abre el canal de resultados (solo en modo binario)."""
+        if self.version_protocolo != VERSION_BINARIO:
+            return None
+        return codificar_saludo(self.cliente_id, self.colas_suscritas, codigos_colas=self.topicos.codigos)
+    
+    def aplicar_aceptacion(self, aceptadas: int):
+        """Ajusta el cliente a las opciones que el servidor dejó activas."""
+        self.con_tiempos = bool(aceptadas & OPCION_LATENCIAS)
+        self.confirmaciones = bool(aceptadas & (OPCION_CONFIRMACIONES | OPCION_VENTANA))
+        self.agregando = bool(aceptadas & OPCION_AGREGADOS)
+        if aceptadas & OPCION_VENTANA:
+            # Confirmar a mitad de ventana para que el servidor nunca se quede sin crédito
+            self.tamaño_lote = min(self.tamaño_lote, max(1, self.ventana // 2))
+            self.agregar = min(self.agregar, max(1, self.ventana // 2))
+    
+    def conectar_mensajes(self) -> Tuple[socket.socket, LectorTramas]:
+        """
+        Abre el canal de mensajes, envía la suscripción y aplica las opciones
+        que el servidor acepta. Si no se puede abrir el segmento de memoria
+        compartida que ofrece el servidor, vuelve a conectarse por TCP.
+        """
+        while True:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect((self.server_host, self.server_port))
             
-            # Enviar información de suscripción
-            suscripcion = {
-                'cliente_id': self.cliente_id,
-                'colas': self.colas_suscritas
-            }
-            
-            datos_suscripcion = pickle.dumps(suscripcion)
-            tamaño_suscripcion = len(datos_suscripcion)
+            opciones = self.opciones_saludo()
+            enviar_tramas(sock, [self.datos_suscripcion(opciones)])
+            lector = LectorTramas(sock)
+            if not opciones:
+                return sock, lector
             
-            sock.sendall(struct.pack('!I', tamaño_suscripcion))
-            sock.sendall(datos_suscripcion)
-            
-            # Recibir mensajes
-            while self.running:
+            # Con opciones en el saludo el servidor responde cuáles acepta
+            aceptacion = lector.leer_trama()
+            if aceptacion is None:
+                raise ConnectionError("el servidor cerró la conexión durante el saludo")
+            aceptadas = decodificar_aceptacion(aceptacion)
+            if aceptadas & OPCION_MEMORIA_COMPARTIDA:
                 try:
-                    # Recibir tamaño del mensaje
-                    tamaño_data = sock.recv(4)
-                    if len(tamaño_data) < 4:
-                        break
-                    
-                    tamaño = struct.unpack('!I', tamaño_data)[0]
-                    
-                    # Recibir datos del mensaje
-                    datos = b''
-                    while len(datos) < tamaño:
-                        chunk = sock.recv(tamaño - len(datos))
-                        if not chunk:
-                            break
-                        datos += chunk
-                    
-                    if len(datos) < tamaño:
-                        break
-                    
-                    mensaje = pickle.loads(datos)
-                    numeros = mensaje['numeros']
-                    
-                    # Procesar números
-                    resultado = self.procesar_numeros(numeros)
-                    
-                    # Enviar resultado
-                    self.enviar_resultado(resultado)
-                    
-                    mensajes_procesados += 1
-                    
-                    if mensajes_procesados % 1000 == 0:
-                        print(f"Cliente {self.cliente_id}: {mensajes_procesados:,} mensajes procesados")
-                    
-                except socket.timeout:
+                    self.anillo = AnilloMensajes.abrir(decodificar_segmento_aceptacion(aceptacion))
+                except OSError as e:
+                    # P. ej., servidor en otro contenedor con la misma dirección de red
+                    print(f"Cliente {self.cliente_id}: Sin memoria compartida ({e}), se usa TCP")
+                    self.memoria_compartida = False
+                    sock.close()
                     continue
-                except Exception as e:
-                    print(f"Cliente {self.cliente_id}: Error recibiendo mensaje: {e}")
-                    break
+                print(f"Cliente {self.cliente_id}: Mensajes por memoria compartida ({self.anillo.nombre})")
+            self.aplicar_aceptacion(aceptadas)
+            if self.confirmaciones:
+                # Las confirmaciones son tramas pequeñas: sin Nagle para no retrasar el crédito
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.socket_mensajes = sock
+            return sock, lector
+    
+    def recibir_mensajes(self):
+        """
+        Se conecta al servidor y recibe mensajes de las colas suscritas.
+        """
+        try:
+            # Conectar al servidor de mensajes
+            sock, lector = self.conectar_mensajes()
+            
+            # Abrir el canal persistente de resultados
+            self.conectar_resultados()
+            hilo_envio = crear_hilo(self.perfilador, self.vaciar_periodicamente, 'envio_periodico')
+            hilo_envio.start()
+            
+            # Recibir y procesar mensajes
+            if self.modo == MODO_PIPELINE:
+                self.procesar_en_pipeline(lector)
+            else:
+                self.procesar_secuencial(lector)
             
+            # Enviar (y confirmar) lo pendiente antes de cerrar el canal de mensajes
+            with self.lock_resultados:
+                self.vaciar_resultados()
+                self.socket_mensajes = None
             sock.close()
+            if self.anillo is not None:
+                self.anillo.cerrar()
             
         except ConnectionRefusedError:
             print(f"Cliente {self.cliente_id}: No se pudo conectar al servidor. ¿Está ejecutándose?")
         except Exception as e:
             print(f"Cliente {self.cliente_id}: Error: {e}")
         finally:
-            print(f"Cliente {self.cliente_id} finalizado. Total procesado: {mensajes_procesados:,} mensajes")
+            self.running = False
+            self.cerrar_resultados()
+            print(f"Cliente {self.cliente_id} finalizado. Total procesado: {self.mensajes_procesados:,} mensajes")
+            for linea in self.resumen_caches():
+                print(f"Cliente {self.cliente_id}: {linea}")
+            print(f"Cliente {self.cliente_id}: tiempos {texto_tiempos(self.tiempos.resumen())}")
     
     def ejecutar(self):
-        """Ejecuta el cliente."""
-        self.recibir_mensajes()
+        """Ejecuta el cliente (perfilando sus hilos con --perfilar)."""
+        if self.perfilador is None:
+            self.recibir_mensajes()
+            return
+        try:
+            self.perfilador.ejecutar(self.recibir_mensajes, 'principal')
+        finally:
+            self.running = False
+            self.perfilador.guardar()
+
+
+def interpretar_funciones_colas(texto: Optional[str], topicos: RegistroTopicos) -> Dict[str, str]:
+    """
+    Interpreta 'patrón=función,...' (el valor de --funcion-cola) y comprueba
+    patrones y funciones.
+    """
+    funciones_colas = {}
+    if not texto:
+        return funciones_colas
+    for parte in texto.split(','):
+        patron, separador, nombre = parte.partition('=')
+        if not separador or not patron.strip() or not nombre.strip():
+            raise ValueError(f"Se esperaba PATRON=FUNCION en --funcion-cola: '{parte}'")
+        topicos.resolver([patron.strip()])
+        buscar_funcion(nombre.strip())
+        funciones_colas[patron.strip()] = nombre.strip()
+    return funciones_colas
 
 
 def main():
@@ -183,10 +661,73 @@ def main():
     parser.add_argument('--id', type=str, required=True, help='ID único del cliente')
     parser.add_argument('--host', type=str, default=SERVER_HOST, help='Dirección del servidor')
     parser.add_argument('--port', type=int, default=SERVER_PORT, help='Puerto del servidor')
+    parser.add_argument('--lote', type=int, default=TAMAÑO_LOTE_RESULTADOS,
+                        help='Resultados enviados por trama en el canal de resultados')
+    parser.add_argument(
+        '--protocolo',
+        type=str,
+        choices=['binario', 'pickle'],
+        default='binario',
+        help='Formato de las tramas (pickle solo por compatibilidad con servidores antiguos)'
+    )
+    
+    parser.add_argument(
+        '--modo',
+        type=str,
+        choices=[MODO_SECUENCIAL, MODO_PIPELINE],
+        default=MODO_SECUENCIAL,
+        help='secuencial (un mensaje a la vez) o pipeline (lectura, procesamiento y envío en paralelo)'
+    )
+    parser.add_argument('--trabajadores', type=int, default=2,
+                        help='Tamaño del pool de procesamiento en modo pipeline')
+    parser.add_argument('--pool', type=str, choices=[POOL_HILOS, POOL_PROCESOS], default=POOL_HILOS,
+                        help='Pool de procesamiento en modo pipeline (hilos o procesos)')
+    parser.add_argument('--confirmar', action='store_true',
+                        help='Confirmar los mensajes procesados (servidor con --entrega al_menos_una_vez)')
+    parser.add_argument('--ventana', type=int, default=0,
+                        help='Mensajes sin confirmar que el cliente admite a la vez (prefetch; 0: sin ventana)')
+    parser.add_argument('--memoria-compartida', action='store_true',
+                        help='Recibir los mensajes por memoria compartida si el servidor está en esta máquina '
+                             '(si no, TCP)')
+    parser.add_argument('--agregar', type=int, nargs='?', const=RESULTADOS_POR_AGREGADO, default=0, metavar='N',
+                        help='Enviar un resumen por cola (cantidad, suma, mínimo, máximo) cada N resultados '
+                             f'en lugar de cada resultado (por defecto N={RESULTADOS_POR_AGREGADO})')
+    parser.add_argument('--funcion', type=str, default=FUNCION_PREDETERMINADA, metavar='NOMBRE',
+                        help=f"Función de procesamiento ({', '.join(sorted(FUNCIONES))}, o modulo:funcion)")
+    parser.add_argument('--funcion-cola', type=str, default=None, metavar='PATRON=NOMBRE,...',
+                        help="Función de procesamiento por cola ('alertas=collatz,pedidos.*=producto')")
+    parser.add_argument('--cache', type=str, choices=CACHES, default=CACHE_NINGUNA,
+                        help='Caché de resultados: ninguna, lru (acotada, con aciertos y fallos) o tabla '
+                             '(todo el dominio precalculado al iniciar)')
+    parser.add_argument('--capacidad-cache', type=int, default=CAPACIDAD_CACHE,
+                        help='Entradas de la caché LRU')
+    parser.add_argument('--topicos', type=str, default=None, metavar='ARCHIVO',
+                        help='Registro de tópicos (JSON o TOML), el mismo que usa el servidor')
+    parser.add_argument('--suscribir', type=str, default=None, metavar='PATRONES',
+                        help="Tópicos separados por comas, con comodines ('pedidos.*,alertas'); "
+                             "por defecto 1 o 2 colas al azar")
+    parser.add_argument('--perfilar', type=str, nargs='?', const=DIRECTORIO_PERFILES, default=None,
+                        metavar='DIRECTORIO',
+                        help='Perfilar cada hilo con cProfile y guardar un .prof por rol al terminar '
+                             f'(por defecto en {DIRECTORIO_PERFILES}/)')
     
     args = parser.parse_args()
     
-    client = SubscriberClient(args.id, args.host, args.port)
+    try:
+        topicos = cargar_registro(args.topicos)
+        suscripciones = [patron.strip() for patron in args.suscribir.split(',')] if args.suscribir else None
+        if suscripciones:
+            topicos.resolver(suscripciones)
+        funciones_colas = interpretar_funciones_colas(args.funcion_cola, topicos)
+        buscar_funcion(args.funcion)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    
+    version = VERSION_BINARIO if args.protocolo == 'binario' else VERSION_PICKLE
+    client = SubscriberClient(args.id, args.host, args.port, args.lote, version,
+                              args.modo, args.trabajadores, args.pool, args.confirmar, args.ventana,
+                              topicos, suscripciones, args.memoria_compartida, args.agregar,
+                              args.funcion, funciones_colas, args.cache, args.capacidad_cache, args.perfilar)
     
     try:
         client.ejecutar()
@@ -0,0 +1,199 @@
+"""
+Motor asyncio del Cliente Subscriber - Modelo Publisher-Subscriber
+Aloja muchos suscriptores en un único event loop: cada cliente es una
+corrutina con sus dos conexiones, sin hilos propios, y un solo temporizador
+por proceso vacía los resultados pendientes de todos. Lo usa run_clients.py
+(--procesos) para simular miles de suscriptores en unos pocos procesos.
+
+Solo habla el protocolo binario y procesa en modo secuencial; la memoria
+compartida no se negocia (su espera sobre el anillo bloquearía el loop).
+"""
+
+import asyncio
+import contextlib
+import os
+import resource
+import socket
+import time
+from typing import Dict, List
+
+from client_integrated import SubscriberClient, INTERVALO_ENVIO_RESULTADOS
+from protocolo import (
+    CABECERA, VERSION_BINARIO, ErrorProtocolo, partes_tramas,
+    decodificar_aceptacion, decodificar_mensajes, codificar_confirmacion,
+)
+
+# Reintentos al conectar (el servidor puede tardar en aceptar una ráfaga de conexiones)
+REINTENTOS_CONEXION = 5
+ESPERA_REINTENTO = 0.2  # segundos, se duplica en cada intento
+
+# Descriptores de archivo de reserva además de los dos sockets por cliente
+DESCRIPTORES_EXTRA = 64
+
+
+class SubscriberClientAsyncio(SubscriberClient):
+    """
+    Cliente Subscriber con E/S dirigida por eventos (asyncio).
+    Reutiliza la suscripción, el procesamiento y el armado de resultados
+    de SubscriberClient.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.version_protocolo != VERSION_BINARIO:
+            raise ValueError("El cliente asyncio solo admite el protocolo binario")
+        self.memoria_compartida = False
+        self.writer_mensajes = None
+        self.writer_resultados = None
+        self.conectado = False
+        self.error = None
+
+    @staticmethod
+    async def leer_trama(reader: asyncio.StreamReader) -> bytes:
+        """Lee una trama completa (cabecera de tamaño + cuerpo)."""
+        tamaño = CABECERA.unpack(await reader.readexactly(CABECERA.size))[0]
+        return await reader.readexactly(tamaño)
+
+    async def conectar(self, puerto: int):
+        """Abre una conexión al servidor, reintentando si la rechaza."""
+        espera = ESPERA_REINTENTO
+        for intento in range(REINTENTOS_CONEXION):
+            try:
+                return await asyncio.open_connection(self.server_host, puerto)
+            except OSError:
+                if intento == REINTENTOS_CONEXION - 1:
+                    raise
+                await asyncio.sleep(espera)
+                espera *= 2
+
+    async def abrir_canales(self) -> asyncio.StreamReader:
+        """Abre el canal de mensajes (con su saludo) y el de resultados."""
+        reader, writer = await self.conectar(self.server_port)
+        opciones = self.opciones_saludo()
+        writer.writelines(partes_tramas([self.datos_suscripcion(opciones)]))
+        self.writer_mensajes = writer
+        if opciones:
+            self.aplicar_aceptacion(decodificar_aceptacion(await self.leer_trama(reader)))
+            if self.confirmaciones:
+                # Las confirmaciones son tramas pequeñas: sin Nagle para no retrasar el crédito
+                writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        _, self.writer_resultados = await self.conectar(self.server_port + 1)
+        self.writer_resultados.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.writer_resultados.writelines(partes_tramas([self.saludo_resultados()]))
+        return reader
+
+    def vaciar_resultados(self):
+        """Escribe en una sola trama lo pendiente (y su confirmación) sin esperar al socket."""
+        if self.writer_resultados is None:
+            return
+        pendiente = self.trama_pendiente()
+        if pendiente is None:
+            return
+        cuerpo, ultimo_id = pendiente
+        self.writer_resultados.writelines(partes_tramas([cuerpo]))
+        if self.confirmaciones and self.writer_mensajes is not None:
+            self.writer_mensajes.writelines(partes_tramas([codificar_confirmacion(ultimo_id)]))
+
+    async def ejecutar_async(self):
+        """Recibe, procesa y envía resultados hasta que el servidor cierre la conexión."""
+        try:
+            reader = await self.abrir_canales()
+            self.conectado = True
+            print(f"Cliente {self.cliente_id} conectado. Suscrito a: {', '.join(sorted(self.colas_suscritas))}")
+            nombres = self.topicos.nombres
+            while self.running:
+                datos = await self.leer_trama(reader)
+                recibido = time.monotonic_ns()
+                mensajes = decodificar_mensajes(datos, nombres)
+                resultados = self.procesar_mensajes(mensajes)
+                self.enviar_resultados(self.registros_resultados(mensajes, resultados, recibido))
+                self.registrar_procesados(len(mensajes))
+                await self.writer_resultados.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass  # el servidor cerró la conexión
+        except (OSError, ErrorProtocolo) as e:
+            self.error = str(e) or type(e).__name__
+            print(f"Cliente {self.cliente_id}: Error: {self.error}")
+        finally:
+            self.running = False
+            for writer in (self.writer_resultados, self.writer_mensajes):
+                if writer is None:
+                    continue
+                with contextlib.suppress(OSError):
+                    if writer is self.writer_resultados:
+                        self.vaciar_resultados()
+                        await writer.drain()
+                    writer.close()
+            self.writer_resultados = self.writer_mensajes = None
+            print(f"Cliente {self.cliente_id} finalizado. Total procesado: {self.mensajes_procesados:,} mensajes")
+
+
+async def ejecutar_clientes(clientes: List[SubscriberClientAsyncio], escalonamiento: float):
+    """
+    Ejecuta los clientes en el loop actual, iniciándolos con `escalonamiento`
+    segundos de separación, hasta que terminen todos.
+    """
+    async def vaciar_periodicamente():
+        while True:
+            await asyncio.sleep(INTERVALO_ENVIO_RESULTADOS)
+            for cliente in clientes:
+                if cliente.resultados_pendientes or cliente.agregados:
+                    cliente.vaciar_resultados()
+
+    vaciado = asyncio.create_task(vaciar_periodicamente())
+    tareas = []
+    try:
+        for cliente in clientes:
+            tareas.append(asyncio.create_task(cliente.ejecutar_async()))
+            await asyncio.sleep(escalonamiento)
+        await asyncio.gather(*tareas)
+    finally:
+        vaciado.cancel()
+        for tarea in tareas:
+            tarea.cancel()
+
+
+def ajustar_limite_descriptores(necesarios: int):
+    """Sube el límite blando de descriptores de archivo hasta `necesarios` (sin pasar del duro)."""
+    blando, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if blando != resource.RLIM_INFINITY and blando < necesarios:
+        nuevo = necesarios if duro == resource.RLIM_INFINITY else min(necesarios, duro)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (nuevo, duro))
+
+
+def estadisticas_proceso(indice: int, clientes: List[SubscriberClientAsyncio], segundos: float) -> Dict:
+    """Resumen de un proceso anfitrión: conexiones, mensajes, ritmo, CPU y memoria."""
+    uso = resource.getrusage(resource.RUSAGE_SELF)
+    procesados = [cliente.mensajes_procesados for cliente in clientes]
+    return {
+        'proceso': indice,
+        'pid': os.getpid(),
+        'clientes': len(clientes),
+        'conectados': sum(1 for cliente in clientes if cliente.conectado),
+        'errores': sum(1 for cliente in clientes if cliente.error is not None),
+        'mensajes': sum(procesados),
+        'minimo_cliente': min(procesados, default=0),
+        'maximo_cliente': max(procesados, default=0),
+        'segundos': segundos,
+        'cpu': uso.ru_utime + uso.ru_stime,
+        'rss_max_kb': uso.ru_maxrss,
+    }
+
+
+def ejecutar_proceso_clientes(indice: int, ids: List[str], host: str, port: int, opciones: Dict,
+                              escalonamiento: float, estadisticas):
+    """
+    Punto de entrada de un proceso anfitrión: ejecuta sus clientes en un
+    event loop y publica sus estadísticas en la cola `estadisticas`. La
+    salida de cada cliente se descarta.
+    """
+    ajustar_limite_descriptores(2 * len(ids) + DESCRIPTORES_EXTRA)
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        clientes = [SubscriberClientAsyncio(cliente_id, host, port, **opciones) for cliente_id in ids]
+        inicio = time.perf_counter()
+        try:
+            asyncio.run(ejecutar_clientes(clientes, escalonamiento))
+        except KeyboardInterrupt:
+            pass
+    estadisticas.put(estadisticas_proceso(indice, clientes, time.perf_counter() - inicio))
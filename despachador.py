@@ -0,0 +1,753 @@
+"""
+Despachador de colas - Modelo Publisher-Subscriber
+Permite que un suscriptor espere sobre la unión de sus colas suscritas y
+despierte en cuanto cualquiera de ellas recibe un mensaje, sin sondeo.
+
+Todas las colas comparten un único lock. Cada suscriptor tiene su propia
+condición sobre ese lock; al publicar en una cola se despierta solo a uno
+de los suscriptores que esperan en ella.
+
+Las colas son acotadas. Cuando una cola está llena se aplica la política de
+desborde: bloquear al productor hasta que un consumidor libere espacio, o
+descartar el mensaje más antiguo o el más nuevo. Una cola llena sin
+consumidores nunca bloquea al productor: descarta su mensaje más antiguo.
+El productor además puede esperar a que haya demanda (alguna cola con
+consumidores y espacio libre) antes de generar más mensajes.
+
+Un suscriptor puede declarar una ventana de crédito: cuántos mensajes sin
+confirmar admite a la vez. Solo toma mensajes mientras le quede crédito y lo
+recupera con cada confirmación, de modo que un consumidor lento no acapara
+mensajes que otro más rápido podría procesar. Al publicar se despierta
+primero a los suscriptores en espera con más crédito libre. Cada suscripción
+mide su utilización (tiempo con mensajes en vuelo y con la ventana llena).
+
+Para la entrega al menos una vez, MensajesEnVuelo guarda los mensajes
+entregados a una conexión hasta que el cliente los confirma; los que vencen
+o quedan sin confirmar al desconectarse vuelven a encolarse.
+
+Cada cola puede tener un tiempo de vida (TTL) y cada mensaje uno propio (el
+campo 'ttl', en nanosegundos): los mensajes cuyo timestamp es más viejo que
+su TTL se descartan al desencolarlos, sin recorrer la cola, y se cuentan
+como expirados. Bajo sobrecarga se pierde el trabajo viejo en lugar de
+entregar un atraso cada vez mayor. Una cola puede además tener niveles de
+prioridad (ColaPrioridades): se entrega siempre el nivel más urgente con
+mensajes y, dentro de un nivel, en orden de llegada.
+
+Opcionalmente cada cola se registra en disco (ver persistencia.py): al
+crear el despachador se recuperan los mensajes pendientes del registro.
+
+Para las métricas en vivo (ver metricas.py) el despachador cuenta los
+mensajes encolados una vez por lote y deduce los desencolados de los demás
+contadores, sin trabajo extra por mensaje; el lock compartido mide su
+tiempo de espera y de retención (LockMedido).
+"""
+
+import heapq
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional
+
+from persistencia import PersistenciaColas, INTERVALO_FSYNC
+
+# Políticas de equidad entre las colas de un mismo suscriptor
+POLITICA_ROUND_ROBIN = "round_robin"
+POLITICA_PONDERADA = "ponderada"
+POLITICA_ALEATORIA = "aleatoria"
+POLITICAS_DESPACHO = (POLITICA_ROUND_ROBIN, POLITICA_PONDERADA, POLITICA_ALEATORIA)
+
+# Políticas de desborde de una cola llena
+DESBORDE_BLOQUEAR = "bloquear"
+DESBORDE_DESCARTAR_ANTIGUO = "descartar_antiguo"
+DESBORDE_DESCARTAR_NUEVO = "descartar_nuevo"
+POLITICAS_DESBORDE = (DESBORDE_BLOQUEAR, DESBORDE_DESCARTAR_ANTIGUO, DESBORDE_DESCARTAR_NUEVO)
+
+CAPACIDAD_COLA = 10_000
+
+# Crédito de un suscriptor sin ventana (sin límite de mensajes en vuelo)
+CREDITO_ILIMITADO = sys.maxsize
+
+
+class LockMedido:
+    """
+    Lock que mide su propio uso: tiempo retenido y, solo cuando está ocupado,
+    tiempo de espera para adquirirlo (sin contención basta un intento no
+    bloqueante). Los contadores se actualizan con el lock adquirido.
+    """
+
+    __slots__ = ('_lock', '_desde', 'adquisiciones', 'contenciones', 'tiempo_espera', 'tiempo_retencion')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._desde = 0.0
+        self.adquisiciones = 0
+        self.contenciones = 0
+        self.tiempo_espera = 0.0
+        self.tiempo_retencion = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._desde = time.perf_counter()
+        else:
+            if not blocking:
+                return False
+            inicio = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            self._desde = time.perf_counter()
+            self.tiempo_espera += self._desde - inicio
+            self.contenciones += 1
+        self.adquisiciones += 1
+        return True
+
+    def release(self):
+        self.tiempo_retencion += time.perf_counter() - self._desde
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *excepcion):
+        self.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    # threading.Condition lo usa para comprobar que el lock está adquirido
+    _is_owned = locked
+
+
+class Suscripcion:
+    """
+    Estado de despacho de un suscriptor: sus colas, la política de equidad
+    y la condición sobre la que espera.
+    """
+
+    def __init__(self, colas: Iterable[str], politica: str, pesos: Dict[str, float],
+                 lock: threading.Lock, ventana: Optional[int] = None, cliente_id: Optional[str] = None):
+        if politica not in POLITICAS_DESPACHO:
+            raise ValueError(f"Política de despacho desconocida: {politica}")
+        self.colas = sorted(colas)
+        self.politica = politica
+        self.pesos = [pesos.get(cola, 1.0) for cola in self.colas]
+        self.condicion = threading.Condition(lock)
+        # Motor asyncio: evento que se activa cuando el despachador lo despierta
+        # (en lugar de la condición; solo se usa desde el hilo del event loop)
+        self.evento = None
+        self.siguiente = 0  # posición del round-robin
+        self.cliente_id = cliente_id
+        self.liberados = 0  # mensajes que sacó de las colas la última toma (entregados o expirados)
+        
+        # Ventana de crédito (None: sin límite ni seguimiento de mensajes en vuelo)
+        self.ventana = ventana
+        self.en_vuelo = 0
+        
+        # Utilización: tiempos acumulados desde la suscripción
+        self.entregados = 0
+        self.inicio = time.monotonic()
+        self.ultimo_cambio = self.inicio
+        self.tiempo_ocupado = 0.0  # con algún mensaje en vuelo
+        self.tiempo_lleno = 0.0    # con la ventana llena (el cliente limita el ritmo)
+        self.area_en_vuelo = 0.0   # integral de mensajes en vuelo en el tiempo
+
+    def despertar(self):
+        """Despierta al suscriptor en espera, sea un hilo o una corrutina (con el lock adquirido)."""
+        self.condicion.notify()
+        if self.evento is not None:
+            self.evento.set()
+
+    def credito(self) -> int:
+        """Mensajes que el suscriptor puede recibir todavía."""
+        if self.ventana is None:
+            return CREDITO_ILIMITADO
+        return max(0, self.ventana - self.en_vuelo)
+
+    def _acumular(self):
+        """Acumula los tiempos de utilización hasta ahora (con el lock adquirido)."""
+        ahora = time.monotonic()
+        transcurrido = ahora - self.ultimo_cambio
+        self.ultimo_cambio = ahora
+        if self.en_vuelo:
+            self.tiempo_ocupado += transcurrido
+            self.area_en_vuelo += self.en_vuelo * transcurrido
+            if self.en_vuelo >= self.ventana:
+                self.tiempo_lleno += transcurrido
+
+    def entregar(self, cantidad: int):
+        """Cuenta mensajes tomados por el suscriptor (con el lock adquirido)."""
+        self.entregados += cantidad
+        if self.ventana is not None:
+            self._acumular()
+            self.en_vuelo += cantidad
+
+    def liberar(self, cantidad: int):
+        """Devuelve crédito por mensajes confirmados o reencolados (con el lock adquirido)."""
+        self._acumular()
+        self.en_vuelo = max(0, self.en_vuelo - cantidad)
+
+    def utilizacion(self) -> Dict:
+        """Estadísticas de utilización como dict serializable (ver combinar_utilizacion)."""
+        if self.ventana is not None:
+            self._acumular()
+        return {
+            'entregados': self.entregados,
+            'ventana': self.ventana or 0,
+            'segundos': time.monotonic() - self.inicio,
+            'ocupado': self.tiempo_ocupado,
+            'lleno': self.tiempo_lleno,
+            'area': self.area_en_vuelo,
+        }
+
+    def elegir_cola(self, colas: Dict[str, deque]) -> Optional[str]:
+        """Elige, según la política, una de las colas suscritas que tenga mensajes."""
+        if self.politica == POLITICA_ROUND_ROBIN:
+            n = len(self.colas)
+            for i in range(n):
+                posicion = (self.siguiente + i) % n
+                if colas[self.colas[posicion]]:
+                    self.siguiente = (posicion + 1) % n
+                    return self.colas[posicion]
+            return None
+
+        disponibles = [i for i, cola in enumerate(self.colas) if colas[cola]]
+        if not disponibles:
+            return None
+        if len(disponibles) == 1:
+            return self.colas[disponibles[0]]
+        if self.politica == POLITICA_PONDERADA:
+            elegida = random.choices(disponibles, weights=[self.pesos[i] for i in disponibles])[0]
+        else:
+            elegida = random.choice(disponibles)
+        return self.colas[elegida]
+
+
+def combinar_utilizacion(a: Dict, b: Dict) -> Dict:
+    """Suma las estadísticas de utilización de dos suscripciones del mismo cliente."""
+    combinada = {clave: a[clave] + b[clave] for clave in a}
+    combinada['ventana'] = max(a['ventana'], b['ventana'])
+    return combinada
+
+
+class ColaPrioridades:
+    """
+    Cola con niveles de prioridad (el 0 es el más urgente): una deque FIFO
+    por nivel y un montículo con los niveles que tienen mensajes, así que
+    encolar y desencolar cuestan O(log niveles). Dentro de cada nivel los
+    más viejos (los primeros en expirar) quedan al frente. Ofrece la parte de
+    la interfaz de deque que usa el despachador; un mensaje sin 'prioridad'
+    va al nivel menos urgente.
+    """
+
+    __slots__ = ('niveles', 'activos', 'cantidad')
+
+    def __init__(self, niveles: int):
+        self.niveles = [deque() for _ in range(max(1, niveles))]
+        self.activos: List[int] = []  # montículo de niveles no vacíos
+        self.cantidad = 0
+
+    def append(self, mensaje):
+        nivel = min(mensaje.get('prioridad', len(self.niveles) - 1), len(self.niveles) - 1)
+        mensajes = self.niveles[nivel]
+        if not mensajes:
+            heapq.heappush(self.activos, nivel)
+        mensajes.append(mensaje)
+        self.cantidad += 1
+
+    def extend(self, mensajes: Iterable):
+        for mensaje in mensajes:
+            self.append(mensaje)
+
+    def popleft(self):
+        """Quita el mensaje más antiguo del nivel más urgente."""
+        nivel = self.activos[0]
+        mensajes = self.niveles[nivel]
+        mensaje = mensajes.popleft()
+        if not mensajes:
+            heapq.heappop(self.activos)
+        self.cantidad -= 1
+        return mensaje
+
+    def descartar(self):
+        """Quita el mensaje más antiguo del nivel menos urgente (desborde con descartar_antiguo)."""
+        nivel = max(self.activos)
+        mensajes = self.niveles[nivel]
+        mensaje = mensajes.popleft()
+        if not mensajes:
+            self.activos.remove(nivel)
+            heapq.heapify(self.activos)
+        self.cantidad -= 1
+        return mensaje
+
+    def pendientes_por_nivel(self) -> List[int]:
+        return [len(mensajes) for mensajes in self.niveles]
+
+    def __len__(self):
+        return self.cantidad
+
+    def __bool__(self):
+        return self.cantidad > 0
+
+    def __iter__(self):
+        for mensajes in self.niveles:
+            yield from mensajes
+
+
+class MensajesEnVuelo:
+    """
+    Mensajes entregados a una conexión y aún sin confirmar, por ID y en
+    orden de entrega. Las confirmaciones son acumulativas: confirmar un ID
+    confirma también todos los entregados antes que él.
+
+    Con reencolar=False solo se usa para devolver crédito de la ventana:
+    los mensajes sin confirmar no vuelven a la cola.
+    """
+
+    def __init__(self, reencolar: bool = True):
+        self.reencolar = reencolar
+        self.lock = threading.Lock()
+        self.mensajes: 'OrderedDict[int, tuple]' = OrderedDict()  # id -> (mensaje, instante de entrega)
+        self.confirmados = 0
+        self.desconectado = False  # el cliente cerró la conexión
+
+    def registrar(self, mensajes: List, instante: float):
+        with self.lock:
+            for mensaje in mensajes:
+                self.mensajes[mensaje['id']] = (mensaje, instante)
+
+    def confirmar(self, ultimo_id: int) -> int:
+        """Confirma hasta `ultimo_id` inclusive. Devuelve cuántos mensajes se confirmaron."""
+        with self.lock:
+            if ultimo_id not in self.mensajes:
+                return 0  # ya vencido y reencolado, o confirmado antes
+            cantidad = 0
+            while True:
+                mensaje_id, _ = self.mensajes.popitem(last=False)
+                cantidad += 1
+                if mensaje_id == ultimo_id:
+                    break
+            self.confirmados += cantidad
+            return cantidad
+
+    def vencidos(self, limite: float) -> List:
+        """Quita y devuelve los mensajes entregados antes de `limite`."""
+        vencidos = []
+        with self.lock:
+            while self.mensajes:
+                mensaje, instante = next(iter(self.mensajes.values()))
+                if instante >= limite:
+                    break
+                self.mensajes.popitem(last=False)
+                vencidos.append(mensaje)
+        return vencidos
+
+    def todos(self) -> List:
+        """Quita y devuelve todos los mensajes sin confirmar."""
+        with self.lock:
+            mensajes = [mensaje for mensaje, _ in self.mensajes.values()]
+            self.mensajes.clear()
+        return mensajes
+
+    def __len__(self):
+        return len(self.mensajes)
+
+
+class Despachador:
+    """Conjunto de colas acotadas con espera sobre la unión de varias colas."""
+
+    def __init__(self, nombres_colas: Iterable[str], capacidad: int = CAPACIDAD_COLA,
+                 politica_desborde: str = DESBORDE_BLOQUEAR, directorio_persistencia: Optional[str] = None,
+                 intervalo_fsync: float = INTERVALO_FSYNC, ttl: Optional[Dict[str, float]] = None,
+                 prioridades: Optional[Dict[str, int]] = None, ttl_por_mensaje: bool = False):
+        """
+        Args:
+            nombres_colas: Colas a crear
+            capacidad: Máximo de mensajes en espera por cola
+            politica_desborde: Qué hacer con una cola llena
+            directorio_persistencia: Directorio del registro en disco (None: solo memoria)
+            intervalo_fsync: Segundos entre confirmaciones en disco
+            ttl: Tiempo de vida en segundos de los mensajes de cada cola que lo tenga
+            prioridades: Niveles de prioridad de cada cola que los tenga
+            ttl_por_mensaje: Respetar también el campo 'ttl' de cada mensaje
+        """
+        if politica_desborde not in POLITICAS_DESBORDE:
+            raise ValueError(f"Política de desborde desconocida: {politica_desborde}")
+        prioridades = {cola: niveles for cola, niveles in (prioridades or {}).items() if niveles > 1}
+        if prioridades and directorio_persistencia is not None:
+            # El registro en disco supone colas FIFO: la cola en memoria es el final del registro
+            raise ValueError("Las colas con prioridades no admiten persistencia")
+        self.lock = LockMedido()
+        self.espacio = threading.Condition(self.lock)  # el productor espera aquí
+        self.capacidad = max(1, capacidad)
+        self.politica_desborde = politica_desborde
+        self.colas: Dict[str, deque] = {
+            nombre: ColaPrioridades(prioridades[nombre]) if nombre in prioridades else deque()
+            for nombre in nombres_colas
+        }
+        self.prioridades = prioridades
+        self.ttl = {cola: segundos for cola, segundos in (ttl or {}).items() if segundos}
+        self.ttl_ns: Dict[str, int] = {nombre: int(self.ttl.get(nombre, 0) * 1e9) for nombre in self.colas}
+        self.expiracion = bool(self.ttl) or ttl_por_mensaje
+        self.esperando: Dict[str, Dict[Suscripcion, None]] = {nombre: {} for nombre in self.colas}
+        self.consumidores: Dict[str, int] = {nombre: 0 for nombre in self.colas}
+        self.productores_esperando = 0
+        self.cerrado = False
+        self.suscripciones: Dict[Suscripcion, None] = {}  # activas, en orden de suscripción
+        
+        # Estadísticas
+        self.encolados: Dict[str, int] = {nombre: 0 for nombre in self.colas}  # aceptados y recuperados
+        self.descartados: Dict[str, int] = {nombre: 0 for nombre in self.colas}
+        self.tiempo_bloqueo = 0.0  # segundos que el productor estuvo detenido
+        self.recuperados = 0
+        self.reencolados: Dict[str, int] = {nombre: 0 for nombre in self.colas}
+        self.expirados: Dict[str, int] = {nombre: 0 for nombre in self.colas}
+        self.utilizacion: Dict[str, Dict] = {}  # cliente -> utilización de suscripciones terminadas
+        
+        # Registro en disco opcional
+        self.persistencia = None
+        if directorio_persistencia is not None:
+            self.persistencia = PersistenciaColas(directorio_persistencia, self.colas, self.lock, intervalo_fsync)
+            for cola, mensajes in self.persistencia.recuperar().items():
+                self.colas[cola].extend(mensajes)
+                self.encolados[cola] += len(mensajes)
+                self.recuperados += len(mensajes)
+            self.persistencia.iniciar()
+
+    def suscribir(self, colas: Iterable[str], politica: str = POLITICA_ALEATORIA,
+                  pesos: Optional[Dict[str, float]] = None, ventana: Optional[int] = None,
+                  cliente_id: Optional[str] = None) -> Suscripcion:
+        """
+        Crea el estado de despacho para un suscriptor y lo cuenta como consumidor.
+        Con `ventana` el suscriptor nunca tiene más de esa cantidad de mensajes
+        sin liberar (ver liberar).
+        """
+        suscripcion = Suscripcion(colas, politica, pesos or {}, self.lock, ventana, cliente_id)
+        with self.lock:
+            for cola in suscripcion.colas:
+                self.consumidores[cola] += 1
+            self.suscripciones[suscripcion] = None
+            self.espacio.notify_all()
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion):
+        """Deja de contar al suscriptor como consumidor de sus colas."""
+        with self.lock:
+            self._dejar_de_esperar(suscripcion)
+            for cola in suscripcion.colas:
+                self.consumidores[cola] -= 1
+            if suscripcion in self.suscripciones:
+                del self.suscripciones[suscripcion]
+                if suscripcion.cliente_id is not None:
+                    self._guardar_utilizacion(self.utilizacion, suscripcion)
+            # Un productor bloqueado en una cola que se quedó sin consumidores debe continuar
+            self.espacio.notify_all()
+
+    @staticmethod
+    def _guardar_utilizacion(tabla: Dict[str, Dict], suscripcion: Suscripcion):
+        utilizacion = suscripcion.utilizacion()
+        anterior = tabla.get(suscripcion.cliente_id)
+        tabla[suscripcion.cliente_id] = utilizacion if anterior is None else combinar_utilizacion(anterior, utilizacion)
+
+    def utilizacion_clientes(self) -> Dict[str, Dict]:
+        """Utilización de cada cliente: suscripciones terminadas más las activas."""
+        with self.lock:
+            tabla = dict(self.utilizacion)
+            for suscripcion in self.suscripciones:
+                if suscripcion.cliente_id is not None:
+                    self._guardar_utilizacion(tabla, suscripcion)
+        return tabla
+
+    def liberar(self, suscripcion: Suscripcion, cantidad: int):
+        """
+        Devuelve crédito a un suscriptor con ventana (mensajes confirmados o
+        reencolados) y lo despierta si estaba esperando crédito.
+        """
+        if not cantidad or suscripcion.ventana is None:
+            return
+        with self.lock:
+            sin_credito = suscripcion.credito() == 0
+            suscripcion.liberar(cantidad)
+            if sin_credito:
+                suscripcion.condicion.notify()
+
+    def _despertar(self, cola: str, cantidad: int = 1):
+        """
+        Despierta hasta `cantidad` suscriptores que esperan en la cola (con el
+        lock adquirido). Si hay más en espera que mensajes, se prefiere a los de
+        más crédito libre; a igual crédito, al que espera desde antes.
+        """
+        esperando = self.esperando[cola]
+        if len(esperando) <= cantidad:
+            elegidos = list(esperando)
+        else:
+            elegidos = heapq.nlargest(cantidad, esperando, key=Suscripcion.credito)
+        for suscripcion in elegidos:
+            self._dejar_de_esperar(suscripcion)
+            suscripcion.despertar()
+
+    def _dejar_de_esperar(self, suscripcion: Suscripcion):
+        """Quita al suscriptor de las listas de espera de todas sus colas."""
+        for cola in suscripcion.colas:
+            self.esperando[cola].pop(suscripcion, None)
+
+    def _esperar_espacio(self, cola: str, timeout: Optional[float]):
+        """Bloquea al productor mientras la cola esté llena y tenga consumidores (con el lock adquirido)."""
+        inicio = time.perf_counter()
+        limite = None if timeout is None else inicio + timeout
+        self.productores_esperando += 1
+        try:
+            while (len(self.colas[cola]) >= self.capacidad and self.consumidores[cola] > 0
+                   and not self.cerrado):
+                restante = None if limite is None else limite - time.perf_counter()
+                if restante is not None and restante <= 0:
+                    break
+                self.espacio.wait(restante)
+        finally:
+            self.productores_esperando -= 1
+            self.tiempo_bloqueo += time.perf_counter() - inicio
+
+    def _encolar(self, cola: str, mensaje, bloquear: bool, timeout: Optional[float]) -> bool:
+        """Agrega un mensaje aplicando la política de desborde (con el lock adquirido)."""
+        mensajes = self.colas[cola]
+        if len(mensajes) >= self.capacidad:
+            if self.politica_desborde == DESBORDE_BLOQUEAR and self.consumidores[cola] > 0:
+                if not bloquear:
+                    return False
+                self._esperar_espacio(cola, timeout)
+            if len(mensajes) >= self.capacidad:
+                self.descartados[cola] += 1
+                if self.politica_desborde == DESBORDE_DESCARTAR_NUEVO:
+                    return True
+                if cola in self.prioridades:
+                    mensajes.descartar()
+                else:
+                    mensajes.popleft()
+        mensajes.append(mensaje)
+        if self.persistencia is not None:
+            self.persistencia.agregar(cola, mensaje)
+        return True
+
+    def publicar(self, cola: str, mensaje, timeout: Optional[float] = None):
+        """Agrega un mensaje a la cola y despierta a un suscriptor en espera."""
+        with self.lock:
+            self._encolar(cola, mensaje, True, timeout)
+            self.encolados[cola] += 1
+            if self.esperando[cola]:
+                self._despertar(cola)
+
+    def publicar_lote(self, cola: str, mensajes: List, bloquear: bool = True,
+                      timeout: Optional[float] = None) -> int:
+        """
+        Agrega varios mensajes a la misma cola con una sola adquisición del lock.
+
+        Con bloquear=False nunca espera: si la política es bloquear y la cola se
+        llena, se detiene y devuelve cuántos mensajes aceptó.
+
+        Returns:
+            Número de mensajes aceptados (incluye los descartados por desborde)
+        """
+        aceptados = 0
+        sin_avisar = 0  # aceptados que aún no despertaron a nadie
+        cola_mensajes = self.colas[cola]
+        with self.lock:
+            for mensaje in mensajes:
+                if sin_avisar and len(cola_mensajes) >= self.capacidad and self.esperando[cola]:
+                    # La cola se llenó a mitad del lote: avisar antes de que _encolar
+                    # bloquee al productor, o los suscriptores esperarían su timeout
+                    self._despertar(cola, sin_avisar)
+                    sin_avisar = 0
+                if not self._encolar(cola, mensaje, bloquear, timeout):
+                    break
+                aceptados += 1
+                sin_avisar += 1
+            self.encolados[cola] += aceptados
+            if sin_avisar and self.esperando[cola]:
+                self._despertar(cola, sin_avisar)
+        return aceptados
+
+    def reencolar(self, mensajes: List):
+        """
+        Devuelve a sus colas mensajes entregados que no se confirmaron, sin
+        aplicar la capacidad ni la política de desborde. Se agregan al final
+        para que la cola en memoria siga siendo el final del registro en disco.
+        """
+        if not mensajes:
+            return
+        with self.lock:
+            for mensaje in mensajes:
+                cola = mensaje['cola']
+                self.colas[cola].append(mensaje)
+                self.reencolados[cola] += 1
+                if self.persistencia is not None:
+                    self.persistencia.agregar(cola, mensaje)
+                if self.esperando[cola]:
+                    self._despertar(cola)
+
+    def _hay_demanda(self) -> bool:
+        """Indica si alguna cola con consumidores tiene espacio libre (con el lock adquirido)."""
+        return any(self.consumidores[cola] > 0 and len(mensajes) < self.capacidad
+                   for cola, mensajes in self.colas.items())
+
+    def hay_demanda(self) -> bool:
+        """Indica si alguna cola con consumidores tiene espacio libre."""
+        with self.lock:
+            return self._hay_demanda()
+
+    def esperar_demanda(self, timeout: Optional[float] = None) -> bool:
+        """
+        Bloquea al productor hasta que haya demanda de los consumidores.
+        El tiempo de espera se acumula en `tiempo_bloqueo`.
+
+        Returns:
+            True si hay demanda, False si venció el timeout o se cerró el despachador.
+        """
+        with self.lock:
+            if self._hay_demanda():
+                return True
+            inicio = time.perf_counter()
+            self.productores_esperando += 1
+            try:
+                self.espacio.wait_for(lambda: self.cerrado or self._hay_demanda(), timeout)
+            finally:
+                self.productores_esperando -= 1
+                self.tiempo_bloqueo += time.perf_counter() - inicio
+            return self._hay_demanda() and not self.cerrado
+
+    def _tomar(self, suscripcion: Suscripcion, maximo: int) -> List:
+        """
+        Toma hasta `maximo` mensajes según la política y el crédito (con el
+        lock adquirido), descartando por el camino los que ya expiraron.
+        """
+        maximo = min(maximo, suscripcion.credito())
+        mensajes = []
+        liberados = 0
+        if self.expiracion:
+            ahora = time.monotonic_ns()
+            ttl_ns = self.ttl_ns
+        while len(mensajes) < maximo:
+            cola = suscripcion.elegir_cola(self.colas)
+            if cola is None:
+                break
+            mensaje = self.colas[cola].popleft()
+            liberados += 1
+            if self.expiracion:
+                ttl = mensaje.get('ttl') or ttl_ns[cola]
+                if ttl and ahora - mensaje['timestamp'] > ttl:
+                    self.expirados[cola] += 1
+                    continue
+            mensajes.append(mensaje)
+        if mensajes:
+            suscripcion.entregar(len(mensajes))
+            # Si quedan mensajes (el crédito o el límite cortaron la toma), pasar el
+            # aviso a otro suscriptor en espera en lugar de dejarlo para la próxima publicación
+            for cola in suscripcion.colas:
+                if self.colas[cola] and self.esperando[cola]:
+                    self._despertar(cola)
+        suscripcion.liberados = liberados
+        if liberados and self.productores_esperando:
+            self.espacio.notify_all()
+        return mensajes
+
+    def tomar(self, suscripcion: Suscripcion, maximo: int = 1) -> List:
+        """Toma sin bloquear hasta `maximo` mensajes de las colas suscritas (según su crédito)."""
+        with self.lock:
+            return self._tomar(suscripcion, maximo)
+
+    def hay_mensajes(self, suscripcion: Suscripcion) -> bool:
+        """Indica si alguna de las colas suscritas tiene mensajes."""
+        return any(self.colas[cola] for cola in suscripcion.colas)
+
+    def esperar_mensajes(self, suscripcion: Suscripcion) -> bool:
+        """
+        Anota al suscriptor en las listas de espera de sus colas para que la
+        próxima publicación en ellas lo despierte (ver Suscripcion.despertar).
+        Es la mitad sin bloqueo de obtener, para el motor asyncio.
+
+        Returns:
+            False si no hace falta esperar: ya hay mensajes o el despachador se cerró
+        """
+        with self.lock:
+            if self.cerrado or self.hay_mensajes(suscripcion):
+                return False
+            for cola in suscripcion.colas:
+                self.esperando[cola][suscripcion] = None
+            return True
+
+    def dejar_de_esperar(self, suscripcion: Suscripcion):
+        """Quita al suscriptor de las listas de espera (tras despertar o vencer su espera)."""
+        with self.lock:
+            self._dejar_de_esperar(suscripcion)
+
+    def obtener(self, suscripcion: Suscripcion, maximo: int = 1, timeout: Optional[float] = None) -> List:
+        """
+        Espera hasta que alguna cola suscrita tenga mensajes y toma hasta `maximo`.
+        Un suscriptor sin crédito espera primero a que se le libere (ver liberar).
+
+        Returns:
+            Lista de mensajes; vacía si venció el timeout o el despachador se cerró.
+        """
+        with self.lock:
+            mensajes = self._tomar(suscripcion, maximo)
+            if mensajes or self.cerrado:
+                return mensajes
+
+            if suscripcion.credito() == 0:
+                suscripcion.condicion.wait(timeout)
+                return self._tomar(suscripcion, maximo)
+
+            for cola in suscripcion.colas:
+                self.esperando[cola][suscripcion] = None
+            suscripcion.condicion.wait(timeout)
+            self._dejar_de_esperar(suscripcion)
+            return self._tomar(suscripcion, maximo)
+
+    def pendientes(self, cola: str) -> int:
+        """Número de mensajes en espera en la cola."""
+        return len(self.colas[cola])
+
+    def _desencolados(self, cola: str) -> int:
+        """
+        Mensajes que la cola entregó a suscriptores (con el lock adquirido).
+        Todo lo que entró y no se descartó, no expiró ni sigue en la cola salió de ella.
+        """
+        return (self.encolados[cola] + self.reencolados[cola] - self.descartados[cola]
+                - self.expirados[cola] - len(self.colas[cola]))
+
+    def metricas(self) -> Dict:
+        """Instantánea de contadores de colas, suscriptores y lock para las métricas en vivo."""
+        with self.lock:
+            return {
+                'pendientes': {cola: len(mensajes) for cola, mensajes in self.colas.items()},
+                'encolados': dict(self.encolados),
+                'desencolados': {cola: self._desencolados(cola) for cola in self.colas},
+                'descartados': dict(self.descartados),
+                'reencolados': dict(self.reencolados),
+                'expirados': dict(self.expirados),
+                'consumidores': dict(self.consumidores),
+                'suscripciones': [
+                    (suscripcion.cliente_id, suscripcion.colas, suscripcion.ventana, suscripcion.en_vuelo)
+                    for suscripcion in self.suscripciones
+                ],
+                'tiempo_bloqueo': self.tiempo_bloqueo,
+                'lock': {
+                    'adquisiciones': self.lock.adquisiciones,
+                    'contenciones': self.lock.contenciones,
+                    'tiempo_espera': self.lock.tiempo_espera,
+                    'tiempo_retencion': self.lock.tiempo_retencion,
+                },
+            }
+
+    def cerrar_persistencia(self):
+        """Confirma en disco el estado de las colas y cierra el registro (si lo hay)."""
+        if self.persistencia is not None:
+            self.persistencia.cerrar()
+
+    def cerrar(self):
+        """Despierta a suscriptores y productores en espera; nada vuelve a bloquear."""
+        with self.lock:
+            self.cerrado = True
+            self.espacio.notify_all()
+            for suscripcion in self.suscripciones:
+                # También a los que esperan crédito, que no figuran en las listas de espera
+                self._dejar_de_esperar(suscripcion)
+                suscripcion.despertar()
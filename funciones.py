@@ -0,0 +1,247 @@
+"""
+Funciones de procesamiento - Modelo Publisher-Subscriber
+Registro de las funciones con las que un cliente convierte los números de
+un mensaje en un resultado, y cachés para no repetir el cálculo:
+
+    - lru: caché acotada (functools.lru_cache) con la tupla normalizada de
+      números como clave; cuenta aciertos y fallos
+    - tabla: todos los resultados del dominio (números de NUMERO_MINIMO a
+      NUMERO_MAXIMO, de 2 a MAX_NUMEROS por mensaje) precalculados al crear el
+      procesador; fuera del dominio se calcula sin caché. Si la tabla superaría
+      MAX_ENTRADAS_TABLA entradas (funciones que dependen del orden, como las
+      importadas), se usa lru en su lugar: precalcular un millón de llamadas de
+      una función costosa detendría el arranque del cliente durante minutos
+
+Los mensajes traen 2 o 3 números entre 1 y 100, así que hay menos de 180,000
+entradas distintas (ordenadas) y se repiten millones de veces: con caché,
+una función costosa cuesta una búsqueda en un diccionario por mensaje.
+
+Normalizar la clave es ordenar los números cuando la función es simétrica
+(no depende del orden); si no lo es, la clave es la tupla tal cual.
+
+Nuevas funciones se agregan con el decorador registrar_funcion, o desde
+cualquier módulo importable con la forma 'modulo:funcion' (se tratan como no
+simétricas).
+"""
+
+import importlib
+import itertools
+import math
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from protocolo import MAX_NUMEROS
+
+FUNCION_PREDETERMINADA = "suma_cuadrado"
+
+CACHE_NINGUNA = "ninguna"
+CACHE_LRU = "lru"
+CACHE_TABLA = "tabla"
+CACHES = (CACHE_NINGUNA, CACHE_LRU, CACHE_TABLA)
+
+# Entradas de la caché LRU: alcanza para todo el dominio de los mensajes
+CAPACIDAD_CACHE = 1 << 18
+
+# Dominio de la tabla precalculada (el del generador de mensajes)
+NUMERO_MINIMO = 1
+NUMERO_MAXIMO = 100
+
+# Entradas máximas de la tabla precalculada: cabe el dominio de una función
+# simétrica (~177,000), no el de una que depende del orden (~1,010,000)
+MAX_ENTRADAS_TABLA = 200_000
+
+
+class FuncionProcesamiento:
+    """Función registrada: calcula un entero a partir de una secuencia de números."""
+
+    __slots__ = ('nombre', 'calcular', 'simetrica')
+
+    def __init__(self, nombre: str, calcular: Callable[[Sequence[int]], int], simetrica: bool):
+        self.nombre = nombre
+        self.calcular = calcular
+        self.simetrica = simetrica  # el resultado no depende del orden de los números
+
+
+FUNCIONES: Dict[str, FuncionProcesamiento] = {}
+
+
+def registrar_funcion(nombre: str, simetrica: bool = True):
+    """Decorador que agrega una función al registro con el nombre dado."""
+    def registrar(calcular: Callable[[Sequence[int]], int]):
+        FUNCIONES[nombre] = FuncionProcesamiento(nombre, calcular, simetrica)
+        return calcular
+    return registrar
+
+
+@registrar_funcion("suma_cuadrado")
+def suma_cuadrado(numeros: Sequence[int]) -> int:
+    """Suma los números y eleva al cuadrado (la función original del cliente)."""
+    return sum(numeros) ** 2
+
+
+@registrar_funcion("suma")
+def suma(numeros: Sequence[int]) -> int:
+    return sum(numeros)
+
+
+@registrar_funcion("producto")
+def producto(numeros: Sequence[int]) -> int:
+    resultado = 1
+    for numero in numeros:
+        resultado *= numero
+    return resultado
+
+
+@registrar_funcion("suma_cuadrados")
+def suma_cuadrados(numeros: Sequence[int]) -> int:
+    return sum(numero * numero for numero in numeros)
+
+
+@registrar_funcion("ponderada", simetrica=False)
+def ponderada(numeros: Sequence[int]) -> int:
+    """Suma de cada número por su posición (1, 2, 3): depende del orden."""
+    return sum(posicion * numero for posicion, numero in enumerate(numeros, 1))
+
+
+@registrar_funcion("collatz")
+def collatz(numeros: Sequence[int]) -> int:
+    """Pasos de la sucesión de Collatz desde el producto de los números (cientos de iteraciones)."""
+    valor = producto(numeros)
+    pasos = 0
+    while valor > 1:
+        valor = valor // 2 if valor % 2 == 0 else 3 * valor + 1
+        pasos += 1
+    return pasos
+
+
+def buscar_funcion(nombre: str) -> FuncionProcesamiento:
+    """Función del registro, o importada de 'modulo:funcion' (y registrada con ese nombre)."""
+    funcion = FUNCIONES.get(nombre)
+    if funcion is not None:
+        return funcion
+    if ':' not in nombre:
+        raise ValueError(f"Función de procesamiento desconocida: {nombre} "
+                         f"(disponibles: {', '.join(sorted(FUNCIONES))}, o modulo:funcion)")
+    modulo, _, atributo = nombre.partition(':')
+    try:
+        calcular = getattr(importlib.import_module(modulo), atributo)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"No se pudo cargar la función {nombre}: {e}") from e
+    if not callable(calcular):
+        raise ValueError(f"{nombre} no es una función")
+    registrar_funcion(nombre, simetrica=False)(calcular)
+    return FUNCIONES[nombre]
+
+
+def entradas_tabla(funcion: FuncionProcesamiento) -> int:
+    """Entradas que tendría la tabla precalculada de la función."""
+    valores = NUMERO_MAXIMO - NUMERO_MINIMO + 1
+    if funcion.simetrica:
+        return sum(math.comb(valores + cantidad - 1, cantidad) for cantidad in range(2, MAX_NUMEROS + 1))
+    return sum(valores ** cantidad for cantidad in range(2, MAX_NUMEROS + 1))
+
+
+def construir_tabla(funcion: FuncionProcesamiento) -> Dict[Tuple[int, ...], int]:
+    """Resultados de la función para cada tupla normalizada del dominio."""
+    dominio = range(NUMERO_MINIMO, NUMERO_MAXIMO + 1)
+    tabla = {}
+    for cantidad in range(2, MAX_NUMEROS + 1):
+        if funcion.simetrica:
+            claves = itertools.combinations_with_replacement(dominio, cantidad)
+        else:
+            claves = itertools.product(dominio, repeat=cantidad)
+        calcular = funcion.calcular
+        tabla.update((clave, calcular(clave)) for clave in claves)
+    return tabla
+
+
+class Procesador:
+    """
+    Función de procesamiento con su caché. Se llama con la lista de números
+    de un mensaje y devuelve el resultado.
+    """
+
+    def __init__(self, nombre: str, cache: str = CACHE_NINGUNA, capacidad: int = CAPACIDAD_CACHE):
+        """
+        Args:
+            nombre: Función del registro (o 'modulo:funcion')
+            cache: ninguna, lru o tabla
+            capacidad: Entradas de la caché LRU
+        """
+        if cache not in CACHES:
+            raise ValueError(f"Caché desconocida: {cache}")
+        self.funcion = buscar_funcion(nombre)
+        if cache == CACHE_TABLA and entradas_tabla(self.funcion) > MAX_ENTRADAS_TABLA:
+            print(f"Aviso: la tabla de {nombre} tendría {entradas_tabla(self.funcion):,} entradas "
+                  f"(máximo {MAX_ENTRADAS_TABLA:,}); se usa la caché lru")
+            cache = CACHE_LRU
+        self.nombre = nombre
+        self.cache = cache
+        self.capacidad = max(1, capacidad)
+        self.tabla = None
+        self.consultas_tabla = 0
+        self.fallos_tabla = 0
+        self.calcular_cacheado = None
+
+        calcular = self.funcion.calcular
+        if cache == CACHE_NINGUNA:
+            self.procesar = calcular
+        elif cache == CACHE_LRU:
+            calcular_cacheado = self.calcular_cacheado = lru_cache(maxsize=self.capacidad)(calcular)
+            if self.funcion.simetrica:
+                self.procesar = lambda numeros: calcular_cacheado(tuple(sorted(numeros)))
+            else:
+                self.procesar = lambda numeros: calcular_cacheado(tuple(numeros))
+        else:
+            self.tabla = construir_tabla(self.funcion)
+            self.procesar = self._procesar_con_tabla
+
+    def __call__(self, numeros: List[int]) -> int:
+        return self.procesar(numeros)
+
+    def _procesar_con_tabla(self, numeros: List[int]) -> int:
+        self.consultas_tabla += 1
+        try:
+            return self.tabla[tuple(sorted(numeros)) if self.funcion.simetrica else tuple(numeros)]
+        except KeyError:
+            self.fallos_tabla += 1
+            return self.funcion.calcular(numeros)
+
+    def estadisticas(self) -> Dict[str, int]:
+        """Aciertos, fallos y entradas de la caché."""
+        if self.calcular_cacheado is not None:
+            info = self.calcular_cacheado.cache_info()
+            return {'aciertos': info.hits, 'fallos': info.misses, 'entradas': info.currsize}
+        if self.tabla is not None:
+            return {'aciertos': self.consultas_tabla - self.fallos_tabla, 'fallos': self.fallos_tabla,
+                    'entradas': len(self.tabla)}
+        return {'aciertos': 0, 'fallos': 0, 'entradas': 0}
+
+    def resumen(self) -> str:
+        """Texto de una línea con la función, la caché y su tasa de aciertos."""
+        if self.cache == CACHE_NINGUNA:
+            return f"{self.nombre} (sin caché)"
+        datos = self.estadisticas()
+        consultas = datos['aciertos'] + datos['fallos']
+        tasa = datos['aciertos'] / consultas if consultas else 0.0
+        return (f"{self.nombre} (caché {self.cache}, {datos['entradas']:,} entradas): "
+                f"{datos['aciertos']:,} aciertos, {datos['fallos']:,} fallos ({tasa:.1%})")
+
+
+# Un procesador por configuración y por proceso: los clientes (y los hilos y
+# procesos de sus pools) que usan la misma función comparten la caché
+_procesadores: Dict[Tuple[str, str, int], Procesador] = {}
+_lock_procesadores = threading.Lock()
+
+
+def obtener_procesador(nombre: str, cache: str = CACHE_NINGUNA, capacidad: int = CAPACIDAD_CACHE) -> Procesador:
+    """Procesador compartido de este proceso para la configuración dada (lo crea la primera vez)."""
+    clave = (nombre, cache, capacidad)
+    procesador = _procesadores.get(clave)
+    if procesador is None:
+        with _lock_procesadores:
+            procesador = _procesadores.get(clave)
+            if procesador is None:
+                procesador = _procesadores[clave] = Procesador(nombre, cache, capacidad)
+    return procesador
@@ -0,0 +1,147 @@
+"""
+Generación de mensajes por lotes - Modelo Publisher-Subscriber
+Produce miles de conjuntos de números de una vez y asigna la cola de todo el
+lote según el criterio, con la misma distribución que la selección mensaje a
+mensaje de PublisherServer. Usa NumPy si está instalado y, si no, una versión
+en Python puro basada en las funciones por lotes de `random`.
+
+Las colas, sus pesos y las reglas condicionales salen del registro de
+tópicos (ver topicos.py): los pesos acumulados y la tabla condicional ya
+vienen compilados, así que el coste por mensaje no depende del número de colas.
+
+En las colas con niveles de prioridad se sortea además el nivel de cada
+mensaje ('prioridad') según los pesos del registro, y se copia en 'ttl' el
+tiempo de vida del nivel, si tiene uno.
+"""
+
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+from topicos import (
+    CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL, REGISTRO_PREDETERMINADO, SIN_REGLA,
+    RegistroTopicos,
+)
+
+
+class GeneradorLotes:
+    """Genera lotes de mensajes agrupados por cola."""
+
+    def __init__(self, criterio: str, semilla: Optional[int] = None, usar_numpy: bool = True,
+                 topicos: RegistroTopicos = REGISTRO_PREDETERMINADO):
+        """
+        Args:
+            criterio: Criterio de selección de cola
+            semilla: Semilla para obtener lotes reproducibles
+            usar_numpy: Usar NumPy si está disponible
+            topicos: Registro de tópicos (colas, pesos y reglas condicionales)
+        """
+        if criterio not in (CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL):
+            raise ValueError(f"Criterio desconocido: {criterio}")
+        self.criterio = criterio
+        self.topicos = topicos
+        self.usar_numpy = usar_numpy and np is not None
+        if self.usar_numpy:
+            self.rng = np.random.default_rng(semilla)
+            self.acumulados = np.array(topicos.acumulados)
+            self.tabla_condicional = np.array(topicos.tabla_condicional)
+        else:
+            self.rng = random.Random(semilla)
+
+    def generar(self, primer_id: int, cantidad: int) -> Dict[str, List[Dict]]:
+        """
+        Genera `cantidad` mensajes con IDs consecutivos desde `primer_id`.
+
+        Returns:
+            Mensajes agrupados por nombre de cola
+        """
+        if self.usar_numpy:
+            cantidades, numeros, codigos = self._generar_numpy(cantidad)
+        else:
+            cantidades, numeros, codigos = self._generar_python(cantidad)
+
+        timestamp = time.monotonic_ns()
+        lote = defaultdict(list)
+        nombres = self.topicos.nombres
+        for i, (n, fila, codigo) in enumerate(zip(cantidades, numeros, codigos)):
+            cola = nombres[codigo]
+            lote[cola].append({
+                'id': primer_id + i,
+                'numeros': fila[:n],
+                'cola': cola,
+                'timestamp': timestamp
+            })
+        if self.topicos.prioridades:
+            self._asignar_prioridades(lote)
+        return lote
+
+    def _asignar_prioridades(self, lote: Dict[str, List[Dict]]):
+        """Sortea el nivel de prioridad de los mensajes de cada cola con niveles (y su TTL, si lo tiene)."""
+        for cola, niveles in self.topicos.prioridades.items():
+            mensajes = lote.get(cola)
+            if not mensajes:
+                continue
+            if self.usar_numpy:
+                sorteo = np.searchsorted(niveles.acumulados, self.rng.random(len(mensajes)) * niveles.total,
+                                         side='right')
+                sorteo = np.minimum(sorteo, len(niveles) - 1).tolist()
+            else:
+                sorteo = self.rng.choices(range(len(niveles)), cum_weights=niveles.acumulados, k=len(mensajes))
+            ttl_ns = niveles.ttl_ns
+            for mensaje, nivel in zip(mensajes, sorteo):
+                mensaje['prioridad'] = nivel
+                if ttl_ns[nivel]:
+                    mensaje['ttl'] = ttl_ns[nivel]
+
+    def _generar_python(self, cantidad: int):
+        """Versión en Python puro: una llamada a `choices` por columna del lote."""
+        rng = self.rng
+        cantidades = rng.choices((2, 3), k=cantidad)
+        planos = rng.choices(range(1, 101), k=3 * cantidad)
+        numeros = [planos[i:i + 3] for i in range(0, 3 * cantidad, 3)]
+
+        topicos = range(len(self.topicos))
+        if self.criterio == CRITERIO_ALEATORIO:
+            codigos = rng.choices(topicos, k=cantidad)
+        else:
+            codigos = rng.choices(topicos, cum_weights=self.topicos.acumulados, k=cantidad)
+            if self.criterio == CRITERIO_CONDICIONAL:
+                tabla = self.topicos.tabla_condicional
+                codigos = [
+                    _codigo_condicional(tabla, n, fila, ponderado)
+                    for n, fila, ponderado in zip(cantidades, numeros, codigos)
+                ]
+        return cantidades, numeros, codigos
+
+    def _generar_numpy(self, cantidad: int):
+        """Versión vectorizada con NumPy."""
+        rng = self.rng
+        cantidades = rng.integers(2, 4, cantidad)
+        numeros = rng.integers(1, 101, (cantidad, 3))
+
+        if self.criterio == CRITERIO_ALEATORIO:
+            codigos = rng.integers(0, len(self.topicos), cantidad)
+        else:
+            codigos = np.searchsorted(self.acumulados, rng.random(cantidad) * self.topicos.total, side='right')
+            codigos = np.minimum(codigos, len(self.topicos) - 1)
+            if self.criterio == CRITERIO_CONDICIONAL:
+                validos = np.arange(3) < cantidades[:, None]
+                pares = ((numeros % 2 == 0) & validos).sum(axis=1)
+                por_regla = self.tabla_condicional[cantidades, pares]
+                codigos = np.where(por_regla != SIN_REGLA, por_regla, codigos)
+        return cantidades.tolist(), numeros.tolist(), codigos.tolist()
+
+
+def _codigo_condicional(tabla: List[List[int]], cantidad: int, fila: List[int], ponderado: int) -> int:
+    """Tópico condicional de un conjunto; `ponderado` es la cola de respaldo ya sorteada."""
+    pares = (fila[0] % 2 == 0) + (fila[1] % 2 == 0)
+    if cantidad == 3:
+        pares += fila[2] % 2 == 0
+    codigo = tabla[cantidad][pares]
+    return codigo if codigo != SIN_REGLA else ponderado
@@ -0,0 +1,226 @@
+"""
+Grabación y reproducción del flujo de mensajes - Modelo Publisher-Subscriber
+Permite medir el despacho y los suscriptores aislados de la generación y
+comparar criterios o configuraciones sobre exactamente la misma carga.
+
+    - GrabadorMensajes escribe cada lote generado en un registro binario
+      compacto: un registro de 24 bytes por mensaje (el mismo formato que
+      viaja por el socket), con el timestamp como desplazamiento en
+      nanosegundos desde el primer lote grabado
+    - ReproductorMensajes mapea el archivo en memoria y entrega lotes con la
+      misma interfaz que GeneradorLotes, a toda velocidad (ritmo 'maximo') o
+      respetando los intervalos grabados (ritmo 'original')
+
+Los mensajes reproducidos conservan su ID, su cola y sus números; el
+timestamp se renueva al reproducirlos, para que las latencias midan la
+ejecución actual. Las colas se identifican por nombre: la grabación puede
+reproducirse con otro registro de tópicos siempre que contenga sus colas.
+
+Estructura del archivo:
+    cabecera:  'PSGR' | versión (B) | criterio (B + utf-8) | colas (B) | nombre de cada cola (B + utf-8)
+    registros: id (Q) | código de cola (B) | cantidad (B) | 3 números (H) | desplazamiento ns (Q)
+"""
+
+import mmap
+import struct
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from protocolo import MAX_NUMEROS, REGISTRO_MENSAJE
+from topicos import RegistroTopicos, REGISTRO_PREDETERMINADO
+
+MAGIA_GRABACION = b'PSGR'
+VERSION_GRABACION = 1
+CABECERA_GRABACION = struct.Struct('!4sB')
+LONGITUD = struct.Struct('!B')
+DESPLAZAMIENTO = struct.Struct('!Q')
+# Posición del desplazamiento dentro de un registro de mensaje
+POSICION_DESPLAZAMIENTO = REGISTRO_MENSAJE.size - DESPLAZAMIENTO.size
+
+RITMO_MAXIMO = "maximo"
+RITMO_ORIGINAL = "original"
+RITMOS = (RITMO_MAXIMO, RITMO_ORIGINAL)
+
+# Búfer de escritura del archivo de grabación
+TAMAÑO_BUFER_GRABACION = 1 << 20
+
+
+def _codificar_texto(texto: str) -> bytes:
+    datos = texto.encode('utf-8')
+    return LONGITUD.pack(len(datos)) + datos
+
+
+def _leer_texto(datos, posicion: int) -> Tuple[str, int]:
+    longitud = datos[posicion]
+    inicio = posicion + LONGITUD.size
+    return bytes(datos[inicio:inicio + longitud]).decode('utf-8'), inicio + longitud
+
+
+def leer_cabecera(datos) -> Tuple[str, List[str], int]:
+    """
+    Interpreta la cabecera de una grabación.
+
+    Returns:
+        (criterio, nombres de las colas por código, posición del primer registro)
+    """
+    try:
+        magia, version = CABECERA_GRABACION.unpack_from(datos)
+        if magia != MAGIA_GRABACION:
+            raise ValueError("El archivo no es una grabación de mensajes")
+        if version != VERSION_GRABACION:
+            raise ValueError(f"Versión de grabación no soportada: {version}")
+        criterio, posicion = _leer_texto(datos, CABECERA_GRABACION.size)
+        cantidad = datos[posicion]
+        posicion += LONGITUD.size
+        colas = []
+        for _ in range(cantidad):
+            nombre, posicion = _leer_texto(datos, posicion)
+            colas.append(nombre)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Cabecera de grabación inválida: {e}") from e
+    return criterio, colas, posicion
+
+
+class GrabadorMensajes:
+    """Escribe los lotes generados en un archivo de grabación. Lo usa un único hilo."""
+
+    def __init__(self, ruta: str, criterio: str, topicos: RegistroTopicos = REGISTRO_PREDETERMINADO):
+        """
+        Args:
+            ruta: Archivo de grabación (se sobrescribe)
+            criterio: Criterio con el que se generan los mensajes (solo informativo)
+            topicos: Registro de tópicos: sus códigos de cola son los de la grabación
+        """
+        self.ruta = ruta
+        self.codigos = topicos.codigos
+        self.archivo = open(ruta, 'wb', buffering=TAMAÑO_BUFER_GRABACION)
+        self.archivo.write(CABECERA_GRABACION.pack(MAGIA_GRABACION, VERSION_GRABACION) + _codificar_texto(criterio)
+                           + LONGITUD.pack(len(topicos.nombres))
+                           + b''.join(_codificar_texto(nombre) for nombre in topicos.nombres))
+        self.origen = None  # timestamp del primer lote grabado
+        self.grabados = 0
+
+    def grabar_lote(self, lote: Dict[str, List[Dict]]):
+        """Agrega al archivo los mensajes de un lote, cola por cola."""
+        empaquetar = REGISTRO_MENSAJE.pack
+        registros = []
+        for cola, mensajes in lote.items():
+            codigo = self.codigos[cola]
+            for mensaje in mensajes:
+                if self.origen is None:
+                    self.origen = mensaje['timestamp']
+                numeros = mensaje['numeros']
+                relleno = list(numeros) + [0] * (MAX_NUMEROS - len(numeros))
+                registros.append(empaquetar(mensaje['id'], codigo, len(numeros), *relleno,
+                                            max(0, mensaje['timestamp'] - self.origen)))
+        self.archivo.write(b''.join(registros))
+        self.grabados += len(registros)
+
+    def cerrar(self):
+        if not self.archivo.closed:
+            self.archivo.close()
+
+
+class ReproductorMensajes:
+    """
+    Entrega los mensajes de una grabación en lotes, con la interfaz de
+    GeneradorLotes. Con varios trabajadores, cada uno reproduce un tramo
+    contiguo del archivo (ver `tramo`).
+    """
+
+    def __init__(self, ruta: str, topicos: RegistroTopicos = REGISTRO_PREDETERMINADO,
+                 ritmo: str = RITMO_MAXIMO, tramo: Tuple[int, int] = (0, 1)):
+        """
+        Args:
+            ruta: Archivo de grabación
+            topicos: Registro de tópicos del servidor; debe contener las colas grabadas
+            ritmo: 'maximo' (sin esperas) u 'original' (los intervalos grabados)
+            tramo: (parte, partes): reproducir solo la parte indicada del archivo
+        """
+        if ritmo not in RITMOS:
+            raise ValueError(f"Ritmo de reproducción desconocido: {ritmo}")
+        if topicos.prioridades:
+            # Sin nivel, cada mensaje iría al menos urgente y perdería el TTL de su nivel
+            raise ValueError("La reproducción no admite colas con prioridades: "
+                             "la grabación no guarda el nivel de cada mensaje")
+        with open(ruta, 'rb') as archivo:
+            self.mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.criterio, colas, self.inicio_datos = leer_cabecera(self.mapa)
+        except ValueError:
+            self.mapa.close()
+            raise
+        desconocidas = [cola for cola in colas if cola not in topicos.codigos]
+        if desconocidas:
+            self.mapa.close()
+            raise ValueError(f"La grabación usa colas que no están en el registro de tópicos: "
+                             f"{', '.join(desconocidas)}")
+        self.colas = colas
+        self.ritmo = ritmo
+
+        registros = (len(self.mapa) - self.inicio_datos) // REGISTRO_MENSAJE.size
+        parte, partes = tramo
+        self.primero = registros * parte // partes
+        self.final = registros * (parte + 1) // partes
+        self.siguiente = self.primero
+        self.inicio_reloj = None  # instante en que se reprodujo el primer registro del tramo
+
+    @property
+    def total(self) -> int:
+        """Mensajes del tramo a reproducir."""
+        return self.final - self.primero
+
+    @property
+    def reproducidos(self) -> int:
+        return self.siguiente - self.primero
+
+    @property
+    def agotado(self) -> bool:
+        return self.siguiente >= self.final
+
+    def _desplazamiento(self, registro: int) -> int:
+        posicion = self.inicio_datos + registro * REGISTRO_MENSAJE.size + POSICION_DESPLAZAMIENTO
+        return DESPLAZAMIENTO.unpack_from(self.mapa, posicion)[0]
+
+    def demora(self) -> float:
+        """Segundos que faltan para que toque reproducir el siguiente mensaje (0 si ya toca)."""
+        if self.ritmo == RITMO_MAXIMO or self.agotado:
+            return 0.0
+        if self.inicio_reloj is None:
+            self.inicio_reloj = time.monotonic()
+            return 0.0
+        transcurrido = (self._desplazamiento(self.siguiente) - self._desplazamiento(self.primero)) / 1e9
+        return self.inicio_reloj + transcurrido - time.monotonic()
+
+    def generar(self, primer_id: int, cantidad: int) -> Dict[str, List[Dict]]:
+        """
+        Los siguientes `cantidad` mensajes grabados (menos al final del tramo,
+        ninguno si ya se agotó). `primer_id` se ignora: se usan los IDs grabados.
+
+        Returns:
+            Mensajes agrupados por nombre de cola
+        """
+        fin = min(self.siguiente + cantidad, self.final)
+        inicio = self.inicio_datos + self.siguiente * REGISTRO_MENSAJE.size
+        datos = self.mapa[inicio:self.inicio_datos + fin * REGISTRO_MENSAJE.size]
+        self.siguiente = fin
+
+        timestamp = time.monotonic_ns()
+        colas = self.colas
+        lote = defaultdict(list)
+        for mid, codigo, n, a, b, c, _ in REGISTRO_MENSAJE.iter_unpack(datos):
+            cola = colas[codigo]
+            lote[cola].append({'id': mid, 'numeros': [a, b, c][:n], 'cola': cola, 'timestamp': timestamp})
+        return lote
+
+    def cerrar(self):
+        if not self.mapa.closed:
+            self.mapa.close()
+
+
+def describir_grabacion(ruta: str) -> Tuple[str, List[str], int]:
+    """Criterio, colas y número de mensajes de una grabación, sin reproducirla."""
+    with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        criterio, colas, inicio_datos = leer_cabecera(mapa)
+        return criterio, colas, (len(mapa) - inicio_datos) // REGISTRO_MENSAJE.size
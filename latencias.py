@@ -0,0 +1,166 @@
+"""
+Histogramas de latencia - Modelo Publisher-Subscriber
+Registra latencias en nanosegundos en cubetas log-lineales al estilo HDR:
+cada potencia de dos se divide en SUBCUBETAS cubetas iguales, de modo que
+el error relativo de cualquier percentil es menor a 1/SUBCUBETAS (~3%) y la
+memoria está acotada por el número de cubetas, sin guardar cada valor.
+
+Cada resultado con tiempos aporta una latencia a cada etapa:
+    espera:        desde que se generó el mensaje hasta que el servidor lo envió (cola)
+    entrega:       red y búferes de ida y vuelta (lo que no es espera ni procesamiento)
+    procesamiento: desde que el cliente recibió el mensaje hasta que tuvo su resultado
+    total:         desde que se generó el mensaje hasta que llegó su resultado
+
+Los mensajes de un mismo lote de generación, trama y lote del cliente
+comparten sus marcas de tiempo, así que cada combinación distinta se
+registra una sola vez con su cantidad.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+# Cubetas por potencia de dos (error relativo < 1/32)
+BITS_SUBCUBETA = 5
+SUBCUBETAS = 1 << BITS_SUBCUBETA
+
+# Valores mayores se cuentan en la última cubeta (2^50 ns ≈ 13 días)
+MAX_BITS_VALOR = 50
+CUBETAS_LATENCIA = (MAX_BITS_VALOR - BITS_SUBCUBETA) * SUBCUBETAS
+
+ETAPAS = ('espera', 'entrega', 'procesamiento', 'total')
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+def indice_cubeta(valor: int) -> int:
+    """Cubeta de un valor en nanosegundos (los negativos cuentan como 0)."""
+    if valor < 2 * SUBCUBETAS:
+        return valor if valor > 0 else 0
+    desplazamiento = valor.bit_length() - BITS_SUBCUBETA - 1
+    return min(((desplazamiento + 1) << BITS_SUBCUBETA) + (valor >> desplazamiento) - SUBCUBETAS,
+               CUBETAS_LATENCIA - 1)
+
+
+def limite_cubeta(indice: int) -> int:
+    """Mayor valor que cae en la cubeta `indice`."""
+    if indice < 2 * SUBCUBETAS:
+        return indice
+    desplazamiento = (indice >> BITS_SUBCUBETA) - 1
+    mantisa = (indice & (SUBCUBETAS - 1)) + SUBCUBETAS
+    return ((mantisa + 1) << desplazamiento) - 1
+
+
+def formatear_duracion(nanosegundos: float) -> str:
+    """Duración legible con la unidad adecuada (ns, µs, ms o s)."""
+    if nanosegundos < 1e3:
+        return f"{nanosegundos:.0f} ns"
+    if nanosegundos < 1e6:
+        return f"{nanosegundos / 1e3:.1f} µs"
+    if nanosegundos < 1e9:
+        return f"{nanosegundos / 1e6:.1f} ms"
+    return f"{nanosegundos / 1e9:.2f} s"
+
+
+class HistogramaLatencias:
+    """Conteo por cubetas de una serie de latencias, con máximo exacto."""
+
+    __slots__ = ('cuentas', 'cantidad', 'maximo')
+
+    def __init__(self):
+        self.cuentas: Dict[int, int] = defaultdict(int)  # solo las cubetas usadas
+        self.cantidad = 0
+        self.maximo = 0
+
+    def registrar(self, valor: int, cantidad: int = 1):
+        """Cuenta `cantidad` veces una latencia en nanosegundos."""
+        self.registrar_cubeta(indice_cubeta(valor), valor, cantidad)
+
+    def registrar_cubeta(self, indice: int, valor: int, cantidad: int):
+        """Como registrar, con la cubeta del valor ya calculada."""
+        self.cuentas[indice] += cantidad
+        self.cantidad += cantidad
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def registrar_lote(self, valores: Iterable[int]):
+        """Incorpora un lote de latencias en nanosegundos."""
+        for valor in valores:
+            self.registrar(valor)
+
+    def combinar(self, otro: 'HistogramaLatencias'):
+        """Suma a este histograma las cuentas de otro."""
+        for indice, cantidad in otro.cuentas.items():
+            self.cuentas[indice] += cantidad
+        self.cantidad += otro.cantidad
+        self.maximo = max(self.maximo, otro.maximo)
+
+    def percentiles(self, percentiles: Iterable[float] = PERCENTILES) -> List[int]:
+        """Valor de cada percentil (cota superior de su cubeta, sin pasar del máximo)."""
+        objetivos = sorted((max(1, -(-self.cantidad * p // 100)), i) for i, p in enumerate(percentiles))
+        valores = [0] * len(objetivos)
+        if not self.cantidad:
+            return valores
+        acumulado = 0
+        pendientes = iter(objetivos)
+        objetivo, posicion = next(pendientes)
+        for indice in sorted(self.cuentas):
+            acumulado += self.cuentas[indice]
+            while acumulado >= objetivo:
+                valores[posicion] = min(limite_cubeta(indice), self.maximo)
+                siguiente = next(pendientes, None)
+                if siguiente is None:
+                    return valores
+                objetivo, posicion = siguiente
+        return valores
+
+    def resumen(self) -> str:
+        """Texto de una línea con p50, p90, p99, p99.9 y máximo."""
+        if not self.cantidad:
+            return "sin datos"
+        partes = [f"p{p:g} {formatear_duracion(valor)}" for p, valor in zip(PERCENTILES, self.percentiles())]
+        partes.append(f"máx {formatear_duracion(self.maximo)}")
+        return ", ".join(partes)
+
+
+class LatenciasEtapas:
+    """Un histograma por etapa (espera, entrega, procesamiento y total)."""
+
+    __slots__ = ETAPAS
+
+    def __init__(self):
+        for etapa in ETAPAS:
+            setattr(self, etapa, HistogramaLatencias())
+
+    @staticmethod
+    def registrar_en(destinos: List['LatenciasEtapas'], latencias: Tuple[int, ...], cantidad: int = 1):
+        """
+        Cuenta `cantidad` veces las latencias de un resultado (una por etapa,
+        en el orden de ETAPAS) en varios destinos, calculando cada cubeta una vez.
+        """
+        for etapa, valor in zip(ETAPAS, latencias):
+            indice = indice_cubeta(valor)
+            for destino in destinos:
+                histograma = getattr(destino, etapa)
+                histograma.cuentas[indice] += cantidad
+                histograma.cantidad += cantidad
+                if valor > histograma.maximo:
+                    histograma.maximo = valor
+
+    def combinar(self, otras: 'LatenciasEtapas'):
+        for etapa in ETAPAS:
+            getattr(self, etapa).combinar(getattr(otras, etapa))
+
+    @property
+    def cantidad(self) -> int:
+        return self.total.cantidad
+
+    def lineas(self) -> List[Tuple[str, str]]:
+        """Pares (etapa, resumen) para el reporte."""
+        return [(etapa, getattr(self, etapa).resumen()) for etapa in ETAPAS]
+
+
+def latencias_por_etapa(timestamp: int, enviado: int, procesamiento: int, llegada: int) -> Tuple[int, ...]:
+    """
+    Latencias de cada etapa (en el orden de ETAPAS) de un resultado que llegó
+    en el instante `llegada` (time.monotonic_ns() del servidor).
+    """
+    return enviado - timestamp, llegada - enviado - procesamiento, procesamiento, llegada - timestamp
@@ -0,0 +1,232 @@
+"""
+Transporte por memoria compartida - Modelo Publisher-Subscriber
+Anillo de registros de mensaje de tamaño fijo en un segmento de
+multiprocessing.shared_memory, para los clientes que corren en la misma
+máquina que el servidor.
+
+El cliente lo pide en el saludo (OPCION_MEMORIA_COMPARTIDA); si el servidor
+lo acepta crea el segmento y responde su nombre en la trama de aceptación.
+Desde ahí el servidor escribe los mensajes en el anillo en lugar de enviar
+tramas, y el socket de mensajes solo sirve para:
+
+    - avisos: un byte del servidor cuando el cliente quedó esperando un
+      anillo vacío (el cliente marca `esperando` en la cabecera antes de
+      dormir en select)
+    - confirmaciones del cliente, igual que por TCP
+    - detectar la desconexión de cualquiera de los dos extremos
+
+Hay un único productor (el hilo o la corrutina que atiende al cliente) y un
+único consumidor, así que cada contador de la cabecera lo escribe un solo
+lado: el servidor publica `escritos` después de copiar los registros y el
+cliente publica `leidos` después de decodificarlos. Si un aviso se pierde
+entre ambas comprobaciones, el cliente lo recupera al vencer la espera.
+
+Cabecera (cada contador en su propia línea de caché):
+    escritos (Q) @0 | leídos (Q) @64 | esperando (B) @128 | capacidad (Q) @136
+Registro (32 bytes, orden nativo: nunca sale de la máquina):
+    id (Q) | cola (B) | cantidad (B) | 3 números (H) | timestamp (Q) | envío (Q)
+"""
+
+import select
+import socket
+import struct
+import threading
+from typing import Dict, List, Sequence
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # plataformas sin memoria compartida: solo TCP
+    shared_memory = None
+
+MEMORIA_COMPARTIDA_DISPONIBLE = shared_memory is not None
+
+CONTADOR = struct.Struct('=Q')
+REGISTRO_ANILLO = struct.Struct('=QBB3HQQ')
+# Empaquetador por cantidad de números: con dos, el tercero es relleno en cero
+EMPAQUETAR_REGISTRO = (None, None, struct.Struct('=QBB2H2xQQ').pack, REGISTRO_ANILLO.pack)
+
+POSICION_ESCRITOS = 0
+POSICION_LEIDOS = 64
+POSICION_ESPERANDO = 128
+POSICION_CAPACIDAD = 136
+INICIO_REGISTROS = 192
+
+# Registros por anillo (512 KB por cliente)
+CAPACIDAD_ANILLO = 16384
+
+# Registros por lectura: leer por partes libera espacio al productor sin esperar a vaciar el anillo
+MAX_REGISTROS_POR_LECTURA = 1024
+
+# Crear y abrir segmentos no se solapa entre hilos (ver abrir_segmento)
+_lock_segmentos = threading.Lock()
+
+# Byte que despierta al cliente y máximo de avisos acumulados que se descartan de una vez
+AVISO = b'\x01'
+MAX_AVISOS = 4096
+
+
+def cliente_local(sock) -> bool:
+    """Indica si el otro extremo del socket está en esta misma máquina."""
+    try:
+        if sock.family == socket.AF_UNIX:
+            return True
+        return sock.getpeername()[0] == sock.getsockname()[0]
+    except OSError:
+        return False
+
+
+def abrir_segmento(nombre: str):
+    """
+    Abre un segmento existente sin registrarlo en el resource tracker: antes
+    de Python 3.13 abrirlo lo registra, y el tracker de este proceso lo
+    borraría al terminar aunque el segmento sea de otro (o, si ambos
+    comparten tracker, el registro del dueño se perdería).
+    """
+    try:
+        return shared_memory.SharedMemory(name=nombre, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    with _lock_segmentos:
+        registrar = resource_tracker.register
+        resource_tracker.register = lambda nombre, tipo: None
+        try:
+            return shared_memory.SharedMemory(name=nombre)
+        finally:
+            resource_tracker.register = registrar
+
+
+class AnilloMensajes:
+    """Anillo de un productor y un consumidor sobre un segmento de memoria compartida."""
+
+    def __init__(self, memoria, propietario: bool):
+        self.memoria = memoria
+        self.bufer = memoria.buf
+        self.propietario = propietario  # quien lo creó lo borra al cerrar
+        self.capacidad = CONTADOR.unpack_from(self.bufer, POSICION_CAPACIDAD)[0]
+        # Cada lado lleva su propio contador y solo lee el del otro
+        self.escritos = CONTADOR.unpack_from(self.bufer, POSICION_ESCRITOS)[0]
+        self.leidos = CONTADOR.unpack_from(self.bufer, POSICION_LEIDOS)[0]
+
+    @classmethod
+    def crear(cls, capacidad: int = CAPACIDAD_ANILLO) -> 'AnilloMensajes':
+        """Crea un segmento nuevo (lado del servidor)."""
+        with _lock_segmentos:
+            memoria = shared_memory.SharedMemory(create=True,
+                                                 size=INICIO_REGISTROS + capacidad * REGISTRO_ANILLO.size)
+        memoria.buf[:INICIO_REGISTROS] = bytes(INICIO_REGISTROS)
+        CONTADOR.pack_into(memoria.buf, POSICION_CAPACIDAD, capacidad)
+        return cls(memoria, propietario=True)
+
+    @classmethod
+    def abrir(cls, nombre: str) -> 'AnilloMensajes':
+        """Se conecta al segmento que creó el servidor (lado del cliente)."""
+        if shared_memory is None:
+            raise OSError("memoria compartida no disponible en esta plataforma")
+        return cls(abrir_segmento(nombre), propietario=False)
+
+    @property
+    def nombre(self) -> str:
+        return self.memoria.name
+
+    def libres(self) -> int:
+        """Registros que el productor puede escribir sin pisar los no leídos."""
+        return self.capacidad - (self.escritos - CONTADOR.unpack_from(self.bufer, POSICION_LEIDOS)[0])
+
+    def disponibles(self) -> int:
+        """Registros escritos que el consumidor aún no leyó."""
+        return CONTADOR.unpack_from(self.bufer, POSICION_ESCRITOS)[0] - self.leidos
+
+    def escribir(self, mensajes: List[Dict], enviado: int, codigos_colas: Dict[str, int]) -> bool:
+        """
+        Copia al anillo un lote de mensajes (no más que libres()) con el
+        instante de envío. Devuelve True si el consumidor espera un aviso.
+        """
+        empaquetar = EMPAQUETAR_REGISTRO
+        datos = memoryview(b''.join([
+            empaquetar[len(mensaje['numeros'])](mensaje['id'], codigos_colas[mensaje['cola']],
+                                                len(mensaje['numeros']), *mensaje['numeros'],
+                                                mensaje['timestamp'], enviado)
+            for mensaje in mensajes
+        ]))
+
+        # El lote puede dar la vuelta al final del búfer: a lo sumo dos copias
+        tamaño = REGISTRO_ANILLO.size
+        inicio = self.escritos % self.capacidad
+        primeros = min(len(mensajes), self.capacidad - inicio) * tamaño
+        desde = INICIO_REGISTROS + inicio * tamaño
+        self.bufer[desde:desde + primeros] = datos[:primeros]
+        if primeros < len(datos):
+            self.bufer[INICIO_REGISTROS:INICIO_REGISTROS + len(datos) - primeros] = datos[primeros:]
+
+        # Publicar los registros solo después de copiarlos
+        self.escritos += len(mensajes)
+        CONTADOR.pack_into(self.bufer, POSICION_ESCRITOS, self.escritos)
+        if self.bufer[POSICION_ESPERANDO]:
+            self.bufer[POSICION_ESPERANDO] = 0
+            return True
+        return False
+
+    def leer(self, nombres_colas: Sequence[str], con_tiempos: bool = False) -> List[Dict]:
+        """
+        Decodifica los registros disponibles (hasta MAX_REGISTROS_POR_LECTURA),
+        sin esperar, a la misma forma de dict que decodificar_mensajes, y los
+        libera para el productor.
+        """
+        escritos = min(CONTADOR.unpack_from(self.bufer, POSICION_ESCRITOS)[0],
+                       self.leidos + MAX_REGISTROS_POR_LECTURA)
+        if escritos == self.leidos:
+            return []
+        tamaño = REGISTRO_ANILLO.size
+        inicio = self.leidos % self.capacidad
+        primeros = min(escritos - self.leidos, self.capacidad - inicio)
+        tramos = [self.bufer[INICIO_REGISTROS + inicio * tamaño:INICIO_REGISTROS + (inicio + primeros) * tamaño]]
+        if primeros < escritos - self.leidos:
+            tramos.append(self.bufer[INICIO_REGISTROS:INICIO_REGISTROS + (escritos - self.leidos - primeros) * tamaño])
+
+        mensajes = []
+        for tramo in tramos:
+            if con_tiempos:
+                mensajes.extend(
+                    {'id': mid, 'cola': nombres_colas[cola], 'numeros': [a, b, c] if cantidad == 3 else [a, b],
+                     'timestamp': ts, 'enviado': enviado}
+                    for mid, cola, cantidad, a, b, c, ts, enviado in REGISTRO_ANILLO.iter_unpack(tramo)
+                )
+            else:
+                mensajes.extend(
+                    {'id': mid, 'cola': nombres_colas[cola], 'numeros': [a, b, c] if cantidad == 3 else [a, b],
+                     'timestamp': ts}
+                    for mid, cola, cantidad, a, b, c, ts, _ in REGISTRO_ANILLO.iter_unpack(tramo)
+                )
+            tramo.release()
+
+        self.leidos = escritos
+        CONTADOR.pack_into(self.bufer, POSICION_LEIDOS, escritos)
+        return mensajes
+
+    def esperar(self, sock, timeout: float) -> bool:
+        """
+        Duerme hasta que haya registros, llegue un aviso o venza `timeout`.
+        Devuelve False si el servidor cerró el socket de mensajes.
+        """
+        self.bufer[POSICION_ESPERANDO] = 1
+        try:
+            if self.disponibles():
+                return True
+            if select.select([sock], [], [], timeout)[0]:
+                return bool(sock.recv(MAX_AVISOS))
+            return True
+        finally:
+            self.bufer[POSICION_ESPERANDO] = 0
+
+    def cerrar(self):
+        """Libera la vista del segmento y, si este lado lo creó, lo borra."""
+        if self.memoria is None:
+            return
+        self.bufer = None
+        self.memoria.close()
+        if self.propietario:
+            try:
+                self.memoria.unlink()
+            except FileNotFoundError:
+                pass
+        self.memoria = None
@@ -0,0 +1,239 @@
+"""
+Métricas en vivo - Modelo Publisher-Subscriber
+Expone el estado del servidor en el formato de texto de Prometheus por HTTP,
+en un puerto TCP local o en un socket Unix:
+
+    curl http://localhost:9100/metrics
+    curl --unix-socket /tmp/pubsub.sock http://localhost/metrics
+
+Cada consulta toma una instantánea de contadores que el servidor ya mantiene
+(enteros que se suman una vez por lote con el lock del despachador
+adquirido), así que no hay trabajo extra por mensaje; las tasas por segundo
+se calculan entre una consulta y la anterior.
+"""
+
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+HOST_METRICAS = "127.0.0.1"
+RUTA_METRICAS = "/metrics"
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def interpretar_direccion(direccion: str) -> Tuple[str, object]:
+    """
+    Interpreta la dirección del endpoint: PUERTO, HOST:PUERTO o la ruta de
+    un socket Unix (cualquier valor con '/').
+
+    Returns:
+        ('unix', ruta) o ('tcp', (host, puerto))
+    """
+    if '/' in direccion:
+        return 'unix', direccion
+    host, _, puerto = direccion.rpartition(':')
+    return 'tcp', (host or HOST_METRICAS, int(puerto))
+
+
+def desplazar_direccion(direccion: str, indice: int) -> str:
+    """Dirección propia del trabajador `indice`: el puerto más el índice, o la ruta con sufijo."""
+    tipo, destino = interpretar_direccion(direccion)
+    if tipo == 'unix':
+        return f"{destino}.{indice}"
+    host, puerto = destino
+    return f"{host}:{puerto + indice}"
+
+
+def _etiquetas(**etiquetas) -> str:
+    """Etiquetas en formato Prometheus, con los valores escapados."""
+    if not etiquetas:
+        return ""
+    partes = []
+    for nombre, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{nombre}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _tasa(actual: float, previo: float, segundos: float) -> float:
+    return (actual - previo) / segundos if segundos > 0 else 0.0
+
+
+class TextoMetricas:
+    """Acumula familias de métricas en el formato de texto de Prometheus."""
+
+    def __init__(self):
+        self.lineas: List[str] = []
+
+    def familia(self, nombre: str, tipo: str, ayuda: str, muestras: List[Tuple[Dict, float]]):
+        """Agrega una familia (HELP, TYPE y una línea por muestra)."""
+        self.lineas.append(f"# HELP {nombre} {ayuda}")
+        self.lineas.append(f"# TYPE {nombre} {tipo}")
+        for etiquetas, valor in muestras:
+            self.lineas.append(f"{nombre}{_etiquetas(**etiquetas)} {valor}")
+
+    def por_cola(self, nombre: str, tipo: str, ayuda: str, valores: Dict[str, float]):
+        self.familia(nombre, tipo, ayuda, [({'cola': cola}, valor) for cola, valor in valores.items()])
+
+    def texto(self) -> str:
+        return "\n".join(self.lineas) + "\n"
+
+
+class ServidorHTTPUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Servidor HTTP sobre un socket Unix (HTTPServer supone direcciones TCP)."""
+
+    address_family = socket.AF_UNIX
+
+
+class ExportadorMetricas:
+    """Endpoint HTTP con las métricas de un PublisherServer, atendido en un hilo propio."""
+
+    def __init__(self, server, direccion: str):
+        """
+        Args:
+            server: PublisherServer (o PublisherServerAsyncio) a observar
+            direccion: PUERTO, HOST:PUERTO o ruta de un socket Unix
+        """
+        self.server = server
+        self.direccion = direccion
+        self.lock = threading.Lock()
+        self.inicio = time.monotonic()
+        self.anterior = (self.inicio, {}, {}, 0)  # instante, encolados, desencolados, resultados
+        self.http = None
+        self.hilo = None
+
+    def generar(self) -> str:
+        """Texto de todas las métricas en el formato de Prometheus."""
+        despachador = self.server.despachador
+        estado = despachador.metricas()
+        resultados = self.server.total_resultados
+        ahora = time.monotonic()
+        with self.lock:
+            instante, encolados, desencolados, resultados_previos = self.anterior
+            self.anterior = (ahora, estado['encolados'], estado['desencolados'], resultados)
+        segundos = ahora - instante
+
+        metricas = TextoMetricas()
+        metricas.por_cola("pubsub_cola_mensajes", "gauge", "Mensajes en espera en la cola",
+                          estado['pendientes'])
+        metricas.familia("pubsub_cola_capacidad", "gauge", "Máximo de mensajes en espera por cola",
+                         [({}, despachador.capacidad)])
+        metricas.por_cola("pubsub_cola_encolados_total", "counter", "Mensajes publicados en la cola",
+                          estado['encolados'])
+        metricas.por_cola("pubsub_cola_desencolados_total", "counter", "Mensajes entregados desde la cola",
+                          estado['desencolados'])
+        metricas.por_cola("pubsub_cola_descartados_total", "counter", "Mensajes descartados por desborde",
+                          estado['descartados'])
+        metricas.por_cola("pubsub_cola_reencolados_total", "counter", "Mensajes reencolados sin confirmar",
+                          estado['reencolados'])
+        metricas.por_cola("pubsub_cola_expirados_total", "counter",
+                          "Mensajes descartados al desencolar por superar su TTL", estado['expirados'])
+        metricas.por_cola(
+            "pubsub_cola_encolados_por_segundo", "gauge", "Mensajes publicados por segundo desde la consulta anterior",
+            {cola: _tasa(valor, encolados.get(cola, 0), segundos) for cola, valor in estado['encolados'].items()}
+        )
+        metricas.por_cola(
+            "pubsub_cola_desencolados_por_segundo", "gauge",
+            "Mensajes entregados por segundo desde la consulta anterior",
+            {cola: _tasa(valor, desencolados.get(cola, 0), segundos)
+             for cola, valor in estado['desencolados'].items()}
+        )
+
+        metricas.por_cola("pubsub_cola_suscriptores", "gauge", "Suscriptores conectados a la cola",
+                          estado['consumidores'])
+        suscripciones = estado['suscripciones']
+        metricas.familia("pubsub_clientes_conectados", "gauge", "Clientes con conexión de mensajes activa",
+                         [({}, len(suscripciones))])
+        metricas.familia(
+            "pubsub_cliente_suscripcion", "gauge", "Colas a las que está suscrito cada cliente conectado",
+            [({'cliente': cliente_id, 'cola': cola}, 1)
+             for cliente_id, colas, _, _ in suscripciones for cola in colas]
+        )
+        con_ventana = [(cliente_id, ventana, en_vuelo)
+                       for cliente_id, _, ventana, en_vuelo in suscripciones if ventana is not None]
+        metricas.familia("pubsub_cliente_ventana", "gauge", "Ventana de crédito de cada cliente",
+                         [({'cliente': cliente_id}, ventana) for cliente_id, ventana, _ in con_ventana])
+        metricas.familia("pubsub_cliente_en_vuelo", "gauge", "Mensajes entregados sin confirmar de cada cliente",
+                         [({'cliente': cliente_id}, en_vuelo) for cliente_id, _, en_vuelo in con_ventana])
+
+        metricas.familia("pubsub_resultados_total", "counter", "Resultados recibidos", [({}, resultados)])
+        metricas.familia("pubsub_resultados_por_segundo", "gauge",
+                         "Resultados recibidos por segundo desde la consulta anterior",
+                         [({}, _tasa(resultados, resultados_previos, segundos))])
+        metricas.familia("pubsub_resultados_objetivo", "gauge", "Resultados tras los que se detiene el servidor",
+                         [({}, self.server.objetivo)])
+
+        lock = estado['lock']
+        metricas.familia("pubsub_lock_adquisiciones_total", "counter", "Adquisiciones del lock de las colas",
+                         [({}, lock['adquisiciones'])])
+        metricas.familia("pubsub_lock_contenciones_total", "counter",
+                         "Adquisiciones que encontraron el lock ocupado", [({}, lock['contenciones'])])
+        metricas.familia("pubsub_lock_espera_segundos_total", "counter",
+                         "Tiempo esperando el lock de las colas", [({}, lock['tiempo_espera'])])
+        metricas.familia("pubsub_lock_retencion_segundos_total", "counter",
+                         "Tiempo con el lock de las colas adquirido", [({}, lock['tiempo_retencion'])])
+        metricas.familia("pubsub_productor_detenido_segundos_total", "counter",
+                         "Tiempo que el productor esperó espacio o demanda", [({}, estado['tiempo_bloqueo'])])
+        metricas.familia("pubsub_activo_segundos", "gauge", "Segundos desde que se inició el endpoint",
+                         [({}, ahora - self.inicio)])
+        return metricas.texto()
+
+    def _crear_servidor_http(self):
+        exportador = self
+
+        class ManejadorMetricas(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in (RUTA_METRICAS, '/'):
+                    self.send_error(404)
+                    return
+                cuerpo = exportador.generar().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', TIPO_CONTENIDO)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def address_string(self):
+                return str(self.client_address)
+
+            def log_message(self, formato, *args):
+                pass  # sin una línea por consulta
+
+        tipo, destino = interpretar_direccion(self.direccion)
+        if tipo == 'unix':
+            if os.path.exists(destino):
+                os.remove(destino)
+            servidor = ServidorHTTPUnix(destino, ManejadorMetricas)
+        else:
+            servidor = ThreadingHTTPServer(destino, ManejadorMetricas)
+        servidor.daemon_threads = True
+        return servidor
+
+    def iniciar(self):
+        """Abre el endpoint y lo atiende en un hilo en segundo plano."""
+        self.http = self._crear_servidor_http()
+        self.hilo = threading.Thread(target=self.http.serve_forever, args=(0.5,), daemon=True)
+        self.hilo.start()
+        print(f"Métricas disponibles en {self.descripcion()}")
+
+    def descripcion(self) -> str:
+        tipo, destino = interpretar_direccion(self.direccion)
+        if tipo == 'unix':
+            return f"el socket Unix {destino} ({RUTA_METRICAS})"
+        host, puerto = destino
+        return f"http://{host}:{puerto}{RUTA_METRICAS}"
+
+    def cerrar(self):
+        """Detiene el endpoint y borra el socket Unix, si lo hay."""
+        if self.http is None:
+            return
+        self.http.shutdown()
+        self.http.server_close()
+        self.http = None
+        tipo, destino = interpretar_direccion(self.direccion)
+        if tipo == 'unix' and os.path.exists(destino):
+            os.remove(destino)
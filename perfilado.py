@@ -0,0 +1,233 @@
+"""
+Perfilado e instrumentación del camino caliente - Modelo Publisher-Subscriber
+Dos herramientas para saber dónde se va el tiempo cuando baja el rendimiento:
+
+    - TiemposEtapas: temporizadores siempre activos alrededor de las etapas
+      del camino caliente (generación, publicación, serialización, envío,
+      registro de resultados...). Se mide una vez por lote, no por mensaje,
+      con dos lecturas de perf_counter_ns, y cada hilo suma en su propia
+      tabla, sin locks. Al terminar un hilo creado con crear_hilo(), su tabla
+      se suma a los totales y se descarta: un servidor con miles de
+      conexiones no acumula una tabla por hilo. Los totales salen en el
+      reporte final del servidor y en la última línea del cliente.
+    - Perfilador: cProfile por hilo (--perfilar). Cada hilo creado con
+      crear_hilo() se perfila por separado; al terminar, su perfil se suma
+      al de su rol ('entrega', 'resultados', 'generacion', ...) y guardar()
+      escribe un archivo .prof por rol (legible con pstats o snakeviz) y
+      muestra las funciones más costosas. Sin --perfilar no hay ningún costo.
+
+En Python 3.12+ cProfile usa sys.monitoring, que admite un único perfilador
+activo a la vez: si otro hilo ya está perfilando, el nuevo hilo se ejecuta
+sin perfilar y se avisa una sola vez.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Directorio de los perfiles con --perfilar sin argumento
+DIRECTORIO_PERFILES = "perfiles"
+
+# Funciones listadas por rol al guardar los perfiles
+LINEAS_PERFIL = 12
+
+# Espera máxima, al guardar, por los hilos perfilados que aún no terminaron
+ESPERA_HILOS_ACTIVOS = 3.0
+
+# Tablas de tiempos del hilo actual (de cualquier TiemposEtapas), para sumarlas al terminar
+_hilo = threading.local()
+
+
+class TiemposEtapas:
+    """
+    Tiempo acumulado y número de lotes de cada etapa. Uso:
+
+        inicio = time.perf_counter_ns()
+        ...etapa...
+        inicio = tiempos.sumar('etapa', inicio)   # devuelve el instante actual
+
+    así una etapa puede encadenarse con la siguiente sin otra lectura del reloj.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._tablas: Dict[int, Dict[str, List[int]]] = {}  # id de la tabla -> tabla de un hilo activo
+        self._totales: Dict[str, List[int]] = {}  # de los hilos que ya terminaron
+        self._lock = threading.Lock()  # solo para registrar y retirar tablas
+
+    def _tabla(self) -> Dict[str, List[int]]:
+        try:
+            return self._local.tabla
+        except AttributeError:
+            tabla = self._local.tabla = {}
+            with self._lock:
+                self._tablas[id(tabla)] = tabla
+            try:
+                _hilo.tablas.append((self, tabla))
+            except AttributeError:
+                _hilo.tablas = [(self, tabla)]
+            return tabla
+
+    def _retirar(self, tabla: Dict[str, List[int]]):
+        """Suma a los totales la tabla de un hilo que termina (desde ese mismo hilo)."""
+        with self._lock:
+            del self._tablas[id(tabla)]
+            for etapa, (nanosegundos, lotes) in tabla.items():
+                total = self._totales.get(etapa)
+                if total is None:
+                    self._totales[etapa] = [nanosegundos, lotes]
+                else:
+                    total[0] += nanosegundos
+                    total[1] += lotes
+        del self._local.tabla
+
+    def sumar(self, etapa: str, inicio: int) -> int:
+        """Suma a `etapa` el tiempo desde `inicio` (perf_counter_ns) y devuelve el instante actual."""
+        ahora = time.perf_counter_ns()
+        tabla = self._tabla()
+        registro = tabla.get(etapa)
+        if registro is None:
+            tabla[etapa] = [ahora - inicio, 1]
+        else:
+            registro[0] += ahora - inicio
+            registro[1] += 1
+        return ahora
+
+    def resumen(self) -> Dict[str, Tuple[int, int]]:
+        """(nanosegundos, lotes) de cada etapa, sumando las tablas de todos los hilos."""
+        with self._lock:
+            tablas = list(self._tablas.values())
+            totales = {etapa: (nanosegundos, lotes) for etapa, (nanosegundos, lotes) in self._totales.items()}
+        for tabla in tablas:
+            for etapa, (nanosegundos, lotes) in list(tabla.items()):
+                anterior = totales.get(etapa, (0, 0))
+                totales[etapa] = (anterior[0] + nanosegundos, anterior[1] + lotes)
+        return totales
+
+
+def combinar_tiempos(a: Dict[str, Tuple[int, int]], b: Dict[str, Tuple[int, int]]) -> Dict[str, Tuple[int, int]]:
+    """Suma los resúmenes de tiempos de dos procesos."""
+    combinados = dict(a)
+    for etapa, (nanosegundos, lotes) in b.items():
+        anterior = combinados.get(etapa, (0, 0))
+        combinados[etapa] = (anterior[0] + nanosegundos, anterior[1] + lotes)
+    return combinados
+
+
+def lineas_tiempos(resumen: Dict[str, Tuple[int, int]]) -> List[str]:
+    """Una línea por etapa, de la más costosa a la menos: total, lotes y promedio por lote."""
+    lineas = []
+    for etapa, (nanosegundos, lotes) in sorted(resumen.items(), key=lambda item: -item[1][0]):
+        lineas.append(f"{etapa + ':':<28}{nanosegundos / 1e9:>9.3f} s en {lotes:>10,} lotes "
+                      f"({nanosegundos / lotes / 1e3 if lotes else 0:,.1f} µs/lote)")
+    return lineas
+
+
+def texto_tiempos(resumen: Dict[str, Tuple[int, int]]) -> str:
+    """Resumen de una línea: segundos de cada etapa, de la más costosa a la menos."""
+    partes = [f"{etapa} {nanosegundos / 1e9:.3f} s"
+              for etapa, (nanosegundos, _) in sorted(resumen.items(), key=lambda item: -item[1][0])]
+    return ", ".join(partes) if partes else "sin datos"
+
+
+class Perfilador:
+    """Perfiles de cProfile por hilo, combinados por rol y guardados al terminar."""
+
+    def __init__(self, directorio: str, prefijo: str):
+        """
+        Args:
+            directorio: Directorio de los archivos .prof (se crea si no existe)
+            prefijo: Inicio del nombre de cada archivo (p. ej., 'servidor' o el ID del cliente)
+        """
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.estadisticas: Dict[str, pstats.Stats] = {}
+        self.hilos: Dict[str, int] = {}
+        self.activos = 0
+        self.avisado = False
+        self.lock = threading.Condition()
+        os.makedirs(directorio, exist_ok=True)
+
+    def ejecutar(self, objetivo: Callable, rol: str, *args):
+        """Ejecuta `objetivo(*args)` en este hilo con su propio perfil, sumado al de `rol`."""
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Python 3.12+: ya hay un perfilador activo en otro hilo
+            if not self.avisado:
+                self.avisado = True
+                print("Aviso: este intérprete no admite un perfil por hilo; algunos hilos no se perfilarán")
+            return objetivo(*args)
+        with self.lock:
+            self.activos += 1
+        try:
+            return objetivo(*args)
+        finally:
+            perfil.disable()
+            with self.lock:
+                self.activos -= 1
+                self.hilos[rol] = self.hilos.get(rol, 0) + 1
+                if rol in self.estadisticas:
+                    self.estadisticas[rol].add(perfil)
+                else:
+                    self.estadisticas[rol] = pstats.Stats(perfil)
+                self.lock.notify_all()
+
+    def guardar(self, lineas: int = LINEAS_PERFIL, espera: float = ESPERA_HILOS_ACTIVOS) -> List[str]:
+        """
+        Escribe un archivo .prof por rol y muestra las funciones con más
+        tiempo propio de cada uno. Espera hasta `espera` segundos a los hilos
+        que aún no terminaron; los que siguen activos no se incluyen.
+
+        Returns:
+            Rutas de los archivos escritos
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: self.activos == 0, espera)
+            estadisticas = dict(self.estadisticas)
+            hilos = dict(self.hilos)
+            activos = self.activos
+        rutas = []
+        for rol in sorted(estadisticas):
+            ruta = os.path.join(self.directorio, f"{self.prefijo}-{os.getpid()}-{rol}.prof")
+            estadisticas[rol].dump_stats(ruta)
+            rutas.append(ruta)
+            salida = io.StringIO()
+            estadisticas[rol].stream = salida
+            estadisticas[rol].sort_stats('tottime').print_stats(lineas)
+            texto = salida.getvalue()
+            cabecera = texto.find('ncalls')
+            print(f"\nPerfil '{rol}' ({hilos[rol]} hilos) guardado en {ruta}:")
+            print(texto[texto.rfind('\n', 0, cabecera) + 1:].rstrip() if cabecera >= 0 else texto.rstrip())
+        if activos:
+            print(f"{activos} hilos seguían activos y no se incluyeron en los perfiles")
+        return rutas
+
+
+def crear_hilo(perfilador: Optional[Perfilador], objetivo: Callable, rol: str, args: tuple = ()) -> threading.Thread:
+    """
+    Hilo demonio que ejecuta `objetivo(*args)`, perfilado con el rol dado si
+    hay perfilador. Al terminar, sus tiempos por etapa pasan a los totales.
+    """
+    if perfilador is not None:
+        objetivo, args = perfilador.ejecutar, (objetivo, rol) + tuple(args)
+    return threading.Thread(target=_ejecutar_hilo, args=(objetivo, tuple(args)), daemon=True)
+
+
+def _ejecutar_hilo(objetivo: Callable, args: tuple):
+    try:
+        objetivo(*args)
+    finally:
+        terminar_hilo()
+
+
+def terminar_hilo():
+    """Retira las tablas de tiempos del hilo actual, sumándolas a los totales de cada TiemposEtapas."""
+    for tiempos, tabla in getattr(_hilo, 'tablas', ()):
+        tiempos._retirar(tabla)
+    _hilo.tablas = []
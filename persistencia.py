@@ -0,0 +1,247 @@
+"""
+Persistencia de colas en disco - Modelo Publisher-Subscriber
+Registro opcional de cada cola en archivos de segmento de tamaño fijo
+mapeados en memoria. Cada mensaje encolado se escribe como un registro
+binario de 24 bytes (el mismo formato que viaja por el socket). Como las
+colas son FIFO, la cola en memoria contiene siempre los últimos registros
+escritos; el offset del consumidor (mensajes ya entregados o descartados)
+se calcula al confirmar como escritura - mensajes en la cola, sin costo
+alguno al entregar.
+
+Escritura y offsets se confirman en disco por grupos (group commit): un
+hilo sincroniza los segmentos modificados y después los offsets cada
+`intervalo_fsync` segundos, de modo que el coste de msync se reparte entre
+todos los mensajes del intervalo. Al reiniciar, los mensajes entre el
+offset del consumidor y el de escritura vuelven a las colas: se pierde como
+máximo un intervalo de mensajes y un mensaje ya entregado puede entregarse
+de nuevo (al menos una vez).
+
+Límite: el offset del consumidor cuenta como consumido todo lo que salió de
+la cola, incluidos los mensajes entregados que el cliente aún no confirmó.
+Si el proceso cae con mensajes en vuelo, esos mensajes no se recuperan.
+
+Los timestamps se guardan como hora de reloj (time.time_ns()) y al
+recuperarlos se llevan al reloj monotónico actual: time.monotonic_ns() solo
+tiene sentido dentro de un mismo arranque de la máquina, y el TTL y las
+latencias de los mensajes recuperados se miden con él.
+
+Estructura en disco (un directorio por cola):
+    <directorio>/<cola>/offsets                     escritura (Q) | lectura (Q) | siguiente id (Q)
+    <directorio>/<cola>/<primer registro>.seg       registros_por_segmento registros de mensaje
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from protocolo import MAX_NUMEROS, REGISTRO_MENSAJE
+
+# Registros por archivo de segmento (65,536 × 24 bytes = 1.5 MB)
+REGISTROS_POR_SEGMENTO = 1 << 16
+
+# Segundos entre confirmaciones en disco (group commit)
+INTERVALO_FSYNC = 0.1
+
+EXTENSION_SEGMENTO = '.seg'
+ARCHIVO_OFFSETS = 'offsets'
+OFFSETS = struct.Struct('!QQQ')
+
+
+def desfase_reloj() -> int:
+    """Nanosegundos que hay que sumar a time.monotonic_ns() para obtener la hora de reloj."""
+    return time.time_ns() - time.monotonic_ns()
+
+
+def _mapear(ruta: str, tamaño: int) -> mmap.mmap:
+    """Mapea en memoria un archivo de `tamaño` bytes, creándolo si no existe."""
+    fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size < tamaño:
+            os.ftruncate(fd, tamaño)
+        return mmap.mmap(fd, tamaño)
+    finally:
+        os.close(fd)
+
+
+class DiarioCola:
+    """
+    Registro persistente de una cola. No es seguro entre hilos: agregar se
+    llama con el lock del despachador adquirido.
+    """
+
+    def __init__(self, directorio: str, nombre: str, codigo: int,
+                 registros_por_segmento: int = REGISTROS_POR_SEGMENTO):
+        self.directorio = os.path.join(directorio, nombre)
+        os.makedirs(self.directorio, exist_ok=True)
+        self.nombre = nombre
+        self.codigo = codigo
+        self.registros_por_segmento = registros_por_segmento
+        self.offsets = _mapear(os.path.join(self.directorio, ARCHIVO_OFFSETS), OFFSETS.size)
+        self.escritura, self.lectura, self.siguiente_id = OFFSETS.unpack_from(self.offsets)
+        self.segmentos: Dict[int, mmap.mmap] = {}  # primer registro -> segmento abierto
+        self.actual = self._segmento(self.escritura)  # segmento donde se escribe
+        # Se calcula una vez: convertir cada timestamp cuesta una suma
+        self.desfase = desfase_reloj()
+
+    def _segmento(self, secuencia: int) -> mmap.mmap:
+        """Segmento que contiene el registro `secuencia`, abriéndolo si hace falta."""
+        inicio = secuencia - secuencia % self.registros_por_segmento
+        segmento = self.segmentos.get(inicio)
+        if segmento is None:
+            ruta = os.path.join(self.directorio, f"{inicio:020d}{EXTENSION_SEGMENTO}")
+            segmento = _mapear(ruta, self.registros_por_segmento * REGISTRO_MENSAJE.size)
+            self.segmentos[inicio] = segmento
+        return segmento
+
+    def agregar(self, mensaje: Dict):
+        """Escribe un mensaje al final del registro."""
+        secuencia = self.escritura
+        posicion = secuencia % self.registros_por_segmento
+        segmento = self.actual if posicion else self._segmento(secuencia)
+        numeros = mensaje['numeros']
+        if len(numeros) == MAX_NUMEROS:
+            a, b, c = numeros
+        else:
+            (a, b), c = numeros, 0
+        REGISTRO_MENSAJE.pack_into(segmento, posicion * REGISTRO_MENSAJE.size, mensaje['id'], self.codigo,
+                                   len(numeros), a, b, c, mensaje['timestamp'] + self.desfase)
+        self.actual = segmento
+        self.escritura = secuencia + 1
+        if mensaje['id'] >= self.siguiente_id:
+            self.siguiente_id = mensaje['id'] + 1
+
+    def recuperar(self) -> List[Dict]:
+        """
+        Mensajes escritos y aún no consumidos según los últimos offsets
+        confirmados, con el timestamp llevado al reloj monotónico actual.
+        """
+        desfase = desfase_reloj()
+        mensajes = []
+        for secuencia in range(self.lectura, self.escritura):
+            mid, _, cantidad, a, b, c, ts = REGISTRO_MENSAJE.unpack_from(
+                self._segmento(secuencia), (secuencia % self.registros_por_segmento) * REGISTRO_MENSAJE.size
+            )
+            # Un mensaje anterior al arranque de la máquina queda en 0 (los timestamps no son negativos)
+            mensajes.append({'id': mid, 'numeros': [a, b, c][:cantidad], 'cola': self.nombre,
+                             'timestamp': max(0, ts - desfase)})
+        return mensajes
+
+    def segmentos_obsoletos(self, lectura: int) -> List[int]:
+        """Segmentos cuyos registros ya fueron todos consumidos."""
+        return [inicio for inicio in self.segmentos if inicio + self.registros_por_segmento <= lectura]
+
+    def eliminar_segmento(self, inicio: int):
+        """Cierra y borra un segmento obsoleto."""
+        self.segmentos.pop(inicio).close()
+        ruta = os.path.join(self.directorio, f"{inicio:020d}{EXTENSION_SEGMENTO}")
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def cerrar(self):
+        for segmento in self.segmentos.values():
+            segmento.close()
+        self.segmentos.clear()
+        self.actual = None
+        self.offsets.close()
+
+
+class PersistenciaColas:
+    """
+    Registros persistentes de todas las colas con confirmación por grupos.
+    Comparte el lock y las colas del despachador: agregar debe llamarse con
+    ese lock adquirido; la sincronización solo lo toma para copiar offsets.
+    """
+
+    def __init__(self, directorio: str, colas: Dict[str, deque], lock: threading.Lock,
+                 intervalo_fsync: float = INTERVALO_FSYNC, registros_por_segmento: int = REGISTROS_POR_SEGMENTO):
+        if intervalo_fsync <= 0:
+            raise ValueError("El intervalo de fsync debe ser positivo")
+        self.directorio = directorio
+        self.colas = colas
+        self.lock = lock
+        self.intervalo_fsync = intervalo_fsync
+        # El código de cada cola es su posición, como en el registro de tópicos
+        self.diarios = {nombre: DiarioCola(directorio, nombre, codigo, registros_por_segmento)
+                        for codigo, nombre in enumerate(colas)}
+        self.cerrado = False
+        self.detener = threading.Event()
+        self.hilo = None
+
+        # Estadísticas
+        self.sincronizaciones = 0
+
+    def recuperar(self) -> Dict[str, List[Dict]]:
+        """Mensajes pendientes de cada cola al momento de la última confirmación."""
+        return {nombre: diario.recuperar() for nombre, diario in self.diarios.items()}
+
+    @property
+    def siguiente_id(self) -> int:
+        """Primer ID de mensaje que no aparece en ningún registro."""
+        return max((diario.siguiente_id for diario in self.diarios.values()), default=0)
+
+    def agregar(self, cola: str, mensaje: Dict):
+        if not self.cerrado:
+            self.diarios[cola].agregar(mensaje)
+
+    def iniciar(self):
+        """Inicia el hilo de confirmación periódica."""
+        self.hilo = threading.Thread(target=self._sincronizar_periodicamente, daemon=True)
+        self.hilo.start()
+
+    def _sincronizar_periodicamente(self):
+        while not self.detener.wait(self.intervalo_fsync):
+            self.sincronizar()
+
+    def sincronizar(self):
+        """
+        Confirma en disco lo escrito hasta ahora: primero los segmentos y
+        después los offsets, para que los offsets nunca apunten a registros
+        que no llegaron al disco.
+        """
+        with self.lock:
+            if self.cerrado:
+                return
+            instantanea = []
+            for nombre, diario in self.diarios.items():
+                # Incluye como consumidos los mensajes en vuelo (ver el límite en el docstring del módulo)
+                diario.lectura = diario.escritura - len(self.colas[nombre])
+                instantanea.append((diario, diario.escritura, diario.lectura, diario.siguiente_id,
+                                    list(diario.segmentos.values())))
+
+        for diario, escritura, lectura, siguiente_id, segmentos in instantanea:
+            actuales = OFFSETS.unpack_from(diario.offsets)
+            if actuales == (escritura, lectura, siguiente_id):
+                continue
+            if escritura != actuales[0]:
+                for segmento in segmentos:
+                    segmento.flush()
+            OFFSETS.pack_into(diario.offsets, 0, escritura, lectura, siguiente_id)
+            diario.offsets.flush()
+
+        with self.lock:
+            if self.cerrado:
+                return
+            for diario, _, lectura, _, _ in instantanea:
+                for inicio in diario.segmentos_obsoletos(lectura):
+                    diario.eliminar_segmento(inicio)
+        self.sincronizaciones += 1
+
+    def cerrar(self):
+        """Detiene el hilo de confirmación, hace una última confirmación y cierra los archivos."""
+        if self.cerrado:
+            return
+        self.detener.set()
+        if self.hilo is not None:
+            self.hilo.join()
+        self.sincronizar()
+        with self.lock:
+            self.cerrado = True
+            for diario in self.diarios.values():
+                diario.cerrar()
+
@@ -0,0 +1,424 @@
+"""
+Protocolo binario compartido - Modelo Publisher-Subscriber
+Define el formato de las tramas que intercambian servidor y clientes.
+
+Cada trama en el socket es: tamaño (uint32, big-endian) + cuerpo.
+LectorTramas lee del socket con recv_into sobre un búfer reutilizable y
+separa todas las tramas completas de cada lectura; enviar_tramas escribe
+cabeceras y cuerpos de una o varias tramas con una sola llamada a sendmsg.
+
+Negociación: la primera trama de cada conexión es el saludo (handshake).
+Si el primer byte del cuerpo es 0x80 se trata de un cliente antiguo que
+envía un dict serializado con pickle; en otro caso el primer byte es la
+versión del protocolo binario.
+
+El saludo del canal de mensajes puede terminar con un byte de opciones que
+el cliente sabe usar (p. ej., confirmaciones). Solo en ese caso el servidor
+responde con una trama de aceptación que indica cuáles quedan activas; los
+servidores antiguos ignoran el byte y los clientes antiguos no lo envían.
+Con la opción de ventana el cliente declara además cuántos mensajes sin
+confirmar puede tener a la vez (crédito de prefetch). Con la opción de
+latencias el servidor marca cada trama de mensajes con el instante de envío
+y el cliente devuelve con cada resultado las marcas de tiempo del mensaje y
+lo que tardó en procesarlo; las marcas son de time.monotonic_ns() del
+servidor y el cliente solo mide duraciones con su propio reloj. Con la
+opción de memoria compartida (solo clientes en la misma máquina) la
+aceptación trae el nombre del segmento por el que llegarán los mensajes
+(ver memoria_compartida.py). Con la opción de agregados el cliente no envía
+cada resultado: acumula por cola cantidad, suma, mínimo y máximo y envía de
+vez en cuando una trama con esos resúmenes (sin ids ni tiempos).
+
+Formatos binarios (versión 2):
+    Saludo:       versión (B) | len(cliente_id) (B) | cliente_id | n_colas (B) | códigos de cola (B...)
+                  [| opciones (B) [| ventana (H), solo con OPCION_VENTANA]]
+    Mensajes:     tipo=1 (B) | n (H) | n registros de mensaje
+    Resultados:   tipo=2 (B) | n (H) | n registros de resultado
+    Mensajes con tiempos:   tipo=5 (B) | n (H) | envío (Q) | n registros de mensaje
+    Resultados con tiempos: tipo=6 (B) | n (H) | n registros de resultado con tiempos
+    Agregados:    tipo=7 (B) | n (H) | n registros de agregado
+    Confirmación: tipo=3 (B) | id del último mensaje procesado (Q)   (acumulativa)
+    Aceptación:   tipo=4 (B) | opciones activas (B)
+                  [| len(segmento) (B) | segmento, solo con OPCION_MEMORIA_COMPARTIDA]
+
+    Registro de mensaje (24 bytes):   id (Q) | cola (B) | cantidad (B) | 3 números (H) | timestamp (Q, ns)
+    Registro de resultado (17 bytes): id (Q) | cola (B) | resultado (q)
+    Registro de resultado con tiempos (41 bytes):
+        id (Q) | cola (B) | resultado (q) | timestamp (Q) | envío (Q) | procesamiento (Q, ns)
+    Registro de agregado (33 bytes):  cola (B) | cantidad (Q) | suma (q) | mínimo (q) | máximo (q)
+"""
+
+import struct
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Colas predeterminadas; el código de cada cola es su posición. Con un
+# registro de tópicos (ver topicos.py) las funciones de codificación reciben
+# sus nombres y códigos en lugar de estos.
+COLA_PRINCIPAL = "principal"
+COLA_SECUNDARIA = "secundaria"
+COLA_TERCIARIA = "terciaria"
+COLAS = (COLA_PRINCIPAL, COLA_SECUNDARIA, COLA_TERCIARIA)
+CODIGO_COLA = {nombre: codigo for codigo, nombre in enumerate(COLAS)}
+
+# Versiones del protocolo
+VERSION_PICKLE = 1
+VERSION_BINARIO = 2
+PROTOCOLO_VERSION = VERSION_BINARIO
+MARCA_PICKLE = 0x80  # primer byte de pickle.dumps() con protocolo >= 2
+
+# Tipos de trama binaria
+TIPO_MENSAJES = 1
+TIPO_RESULTADOS = 2
+TIPO_CONFIRMACION = 3
+TIPO_ACEPTACION = 4
+TIPO_MENSAJES_CON_TIEMPOS = 5
+TIPO_RESULTADOS_CON_TIEMPOS = 6
+TIPO_AGREGADOS = 7
+
+# Opciones del saludo (bits)
+OPCION_CONFIRMACIONES = 0x01
+OPCION_VENTANA = 0x02
+OPCION_LATENCIAS = 0x04
+OPCION_MEMORIA_COMPARTIDA = 0x08
+OPCION_AGREGADOS = 0x10
+
+MAX_NUMEROS = 3
+
+CABECERA = struct.Struct('!I')
+CABECERA_LOTE = struct.Struct('!BH')
+REGISTRO_MENSAJE = struct.Struct('!QBB3HQ')
+REGISTRO_RESULTADO = struct.Struct('!QBq')
+REGISTRO_RESULTADO_CON_TIEMPOS = struct.Struct('!QBqQQQ')
+REGISTRO_AGREGADO = struct.Struct('!BQqqq')
+MARCA_TIEMPO = struct.Struct('!Q')
+VENTANA = struct.Struct('!H')
+MAX_VENTANA = 0xFFFF
+CONFIRMACION = struct.Struct('!BQ')
+ACEPTACION = struct.Struct('!BB')
+
+# Lectura y escritura de tramas
+TAMAÑO_BUFER_LECTURA = 64 * 1024
+MAX_PARTES_SENDMSG = 1024  # IOV_MAX en Linux
+
+
+class ErrorProtocolo(Exception):
+    """Trama o saludo con un formato no reconocido."""
+
+
+def empaquetar_trama(cuerpo: bytes) -> bytes:
+    """Antepone al cuerpo la cabecera con su tamaño."""
+    return CABECERA.pack(len(cuerpo)) + cuerpo
+
+
+def partes_tramas(cuerpos: Iterable[bytes]) -> List[bytes]:
+    """Cabecera y cuerpo de cada trama, en orden, sin concatenarlos."""
+    partes = []
+    for cuerpo in cuerpos:
+        partes.append(CABECERA.pack(len(cuerpo)))
+        partes.append(cuerpo)
+    return partes
+
+
+def enviar_tramas(sock, cuerpos: Iterable[bytes]):
+    """
+    Envía una o varias tramas con escritura vectorizada (sendmsg): cabeceras
+    y cuerpos salen en la misma llamada sin copiarse a un búfer intermedio.
+    """
+    partes = partes_tramas(cuerpos)
+    while partes:
+        enviados = sock.sendmsg(partes[:MAX_PARTES_SENDMSG])
+        completas = 0
+        while completas < len(partes) and enviados >= len(partes[completas]):
+            enviados -= len(partes[completas])
+            completas += 1
+        partes = partes[completas:]
+        if enviados:
+            partes[0] = memoryview(partes[0])[enviados:]
+
+
+class LectorTramas:
+    """
+    Lector de tramas con búfer propio sobre un socket bloqueante.
+
+    Cada lectura del socket (recv_into) puede traer muchas tramas; todas las
+    que queden completas se devuelven juntas. Las tramas se entregan como
+    memoryview sobre el búfer, sin copiarlas: solo son válidas hasta la
+    siguiente llamada a leer_trama o leer_tramas.
+    """
+
+    def __init__(self, sock, tamaño_bufer: int = TAMAÑO_BUFER_LECTURA):
+        self.sock = sock
+        self.bufer = bytearray(tamaño_bufer)
+        self.vista = memoryview(self.bufer)
+        self.inicio = 0  # primer byte sin consumir
+        self.fin = 0     # fin de los datos recibidos
+
+    def _reservar(self, necesario: int):
+        """Mueve los datos pendientes al inicio del búfer, que debe poder contener `necesario` bytes."""
+        pendientes = self.fin - self.inicio
+        if necesario > len(self.bufer) or pendientes == len(self.bufer):
+            # Búfer nuevo: las vistas ya entregadas conservan el anterior
+            bufer = bytearray(max(necesario, 2 * len(self.bufer)))
+            bufer[:pendientes] = self.vista[self.inicio:self.fin]
+            self.bufer = bufer
+            self.vista = memoryview(bufer)
+        elif self.inicio:
+            self.vista[:pendientes] = self.vista[self.inicio:self.fin]
+        self.inicio = 0
+        self.fin = pendientes
+
+    def _recibir(self) -> bool:
+        """Lee del socket lo que haya disponible. Devuelve False si el otro extremo cerró."""
+        if self.inicio == self.fin:
+            self.inicio = self.fin = 0
+        else:
+            # Solo aquí se mueve el búfer: ninguna vista de la llamada en curso sigue en uso
+            disponibles = self.fin - self.inicio
+            necesario = CABECERA.size
+            if disponibles >= CABECERA.size:
+                necesario += CABECERA.unpack_from(self.bufer, self.inicio)[0]
+            if self.fin == len(self.bufer) or self.inicio + necesario > len(self.bufer):
+                self._reservar(necesario)
+        recibidos = self.sock.recv_into(self.vista[self.fin:])
+        if not recibidos:
+            return False
+        self.fin += recibidos
+        return True
+
+    def _extraer(self) -> Optional[memoryview]:
+        """Separa la siguiente trama completa del búfer, si la hay."""
+        disponibles = self.fin - self.inicio
+        if disponibles < CABECERA.size:
+            return None
+        tamaño = CABECERA.unpack_from(self.bufer, self.inicio)[0]
+        total = CABECERA.size + tamaño
+        if disponibles < total:
+            return None
+        cuerpo = self.vista[self.inicio + CABECERA.size:self.inicio + total]
+        self.inicio += total
+        return cuerpo
+
+    def leer_tramas(self) -> List[memoryview]:
+        """
+        Espera hasta tener al menos una trama completa y devuelve todas las
+        que hay en el búfer. Una lista vacía indica que el otro extremo cerró.
+        """
+        tramas = []
+        while True:
+            trama = self._extraer()
+            while trama is not None:
+                tramas.append(trama)
+                trama = self._extraer()
+            if tramas or not self._recibir():
+                return tramas
+
+    def leer_trama(self) -> Optional[memoryview]:
+        """Lee una sola trama. Devuelve None si el otro extremo cerró."""
+        while True:
+            trama = self._extraer()
+            if trama is not None or not self._recibir():
+                return trama
+
+
+def es_saludo_pickle(datos: bytes) -> bool:
+    """Indica si la trama de saludo proviene de un cliente antiguo (pickle)."""
+    return len(datos) > 0 and datos[0] == MARCA_PICKLE
+
+
+def codificar_saludo(cliente_id: str, colas: Set[str], opciones: Optional[int] = None,
+                     ventana: int = 0, codigos_colas: Dict[str, int] = CODIGO_COLA) -> bytes:
+    """
+    Codifica el saludo binario con el que se abre cada conexión (opciones:
+    bits OPCION_*; ventana: mensajes sin confirmar admitidos con OPCION_VENTANA).
+    """
+    id_bytes = cliente_id.encode('utf-8')[:255]
+    codigos = bytes(sorted(codigos_colas[cola] for cola in colas))
+    saludo = struct.pack('!BB', PROTOCOLO_VERSION, len(id_bytes)) + id_bytes + bytes([len(codigos)]) + codigos
+    if opciones is not None:
+        saludo += bytes([opciones])
+        if opciones & OPCION_VENTANA:
+            saludo += VENTANA.pack(min(max(ventana, 1), MAX_VENTANA))
+    return saludo
+
+
+def decodificar_saludo(datos: bytes, nombres_colas: Sequence[str] = COLAS) -> Tuple[int, str, Set[str]]:
+    """
+    Decodifica un saludo binario.
+
+    Returns:
+        Tupla (versión, cliente_id, colas suscritas)
+    """
+    try:
+        version = datos[0]
+        if version != VERSION_BINARIO:
+            raise ErrorProtocolo(f"Versión de protocolo no soportada: {version}")
+        largo_id = datos[1]
+        cliente_id = str(datos[2:2 + largo_id], 'utf-8')
+        inicio = 2 + largo_id
+        n_colas = datos[inicio]
+        colas = {nombres_colas[codigo] for codigo in datos[inicio + 1:inicio + 1 + n_colas]}
+    except (IndexError, UnicodeDecodeError) as e:
+        raise ErrorProtocolo(f"Saludo mal formado: {e}") from e
+    return version, cliente_id, colas
+
+
+def decodificar_opciones_saludo(datos: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Opciones anunciadas al final de un saludo binario.
+
+    Returns:
+        Tupla (opciones, ventana), con ventana 0 si el cliente no la declara,
+        o None si el cliente no envía opciones
+    """
+    inicio = 2 + datos[1]
+    posicion = inicio + 1 + datos[inicio]
+    if len(datos) <= posicion:
+        return None
+    opciones = datos[posicion]
+    ventana = 0
+    if opciones & OPCION_VENTANA:
+        try:
+            ventana = VENTANA.unpack_from(datos, posicion + 1)[0]
+        except struct.error as e:
+            raise ErrorProtocolo(f"Saludo mal formado: {e}") from e
+    return opciones, ventana
+
+
+def codificar_aceptacion(opciones: int, segmento: Optional[str] = None) -> bytes:
+    """
+    Respuesta del servidor al saludo con las opciones que quedan activas
+    (y el segmento de memoria compartida, si se aceptó esa opción).
+    """
+    aceptacion = ACEPTACION.pack(TIPO_ACEPTACION, opciones)
+    if opciones & OPCION_MEMORIA_COMPARTIDA:
+        nombre = segmento.encode('utf-8')
+        aceptacion += bytes([len(nombre)]) + nombre
+    return aceptacion
+
+
+def decodificar_aceptacion(datos: bytes) -> int:
+    tipo, opciones = ACEPTACION.unpack_from(datos)
+    if tipo != TIPO_ACEPTACION:
+        raise ErrorProtocolo(f"Se esperaba una trama de aceptación, tipo recibido: {tipo}")
+    return opciones
+
+
+def decodificar_segmento_aceptacion(datos: bytes) -> str:
+    """Nombre del segmento de memoria compartida de una aceptación con OPCION_MEMORIA_COMPARTIDA."""
+    try:
+        largo = datos[ACEPTACION.size]
+        return str(datos[ACEPTACION.size + 1:ACEPTACION.size + 1 + largo], 'utf-8')
+    except (IndexError, UnicodeDecodeError) as e:
+        raise ErrorProtocolo(f"Aceptación mal formada: {e}") from e
+
+
+def codificar_confirmacion(ultimo_id: int) -> bytes:
+    """Confirmación acumulativa: todos los mensajes entregados hasta `ultimo_id` fueron procesados."""
+    return CONFIRMACION.pack(TIPO_CONFIRMACION, ultimo_id)
+
+
+def decodificar_confirmacion(datos: bytes) -> int:
+    tipo, ultimo_id = CONFIRMACION.unpack_from(datos)
+    if tipo != TIPO_CONFIRMACION:
+        raise ErrorProtocolo(f"Se esperaba una trama de confirmación, tipo recibido: {tipo}")
+    return ultimo_id
+
+
+def codificar_mensajes(mensajes: List[Dict], enviado: Optional[int] = None,
+                       codigos_colas: Dict[str, int] = CODIGO_COLA) -> bytes:
+    """
+    Codifica un lote de mensajes (dicts con id, cola, numeros y timestamp).
+    Con `enviado` (time.monotonic_ns()) la trama lleva el instante de envío.
+    """
+    if enviado is None:
+        partes = [CABECERA_LOTE.pack(TIPO_MENSAJES, len(mensajes))]
+    else:
+        partes = [CABECERA_LOTE.pack(TIPO_MENSAJES_CON_TIEMPOS, len(mensajes)), MARCA_TIEMPO.pack(enviado)]
+    empaquetar = REGISTRO_MENSAJE.pack
+    for mensaje in mensajes:
+        numeros = mensaje['numeros']
+        relleno = list(numeros) + [0] * (MAX_NUMEROS - len(numeros))
+        partes.append(empaquetar(mensaje['id'], codigos_colas[mensaje['cola']], len(numeros),
+                                 relleno[0], relleno[1], relleno[2], mensaje['timestamp']))
+    return b''.join(partes)
+
+
+def decodificar_mensajes(datos: bytes, nombres_colas: Sequence[str] = COLAS) -> List[Dict]:
+    """
+    Decodifica un lote de mensajes a la misma forma de dict que usa el servidor.
+    Las tramas con tiempos agregan a cada mensaje el instante de envío ('enviado').
+    """
+    tipo, n = CABECERA_LOTE.unpack_from(datos)
+    inicio = CABECERA_LOTE.size
+    if tipo == TIPO_MENSAJES_CON_TIEMPOS:
+        enviado = MARCA_TIEMPO.unpack_from(datos, inicio)[0]
+        inicio += MARCA_TIEMPO.size
+        fin = inicio + n * REGISTRO_MENSAJE.size
+        return [
+            {'id': mid, 'cola': nombres_colas[cola], 'numeros': [a, b, c][:cantidad], 'timestamp': ts,
+             'enviado': enviado}
+            for mid, cola, cantidad, a, b, c, ts
+            in REGISTRO_MENSAJE.iter_unpack(datos[inicio:fin])
+        ]
+    if tipo != TIPO_MENSAJES:
+        raise ErrorProtocolo(f"Se esperaba una trama de mensajes, tipo recibido: {tipo}")
+    fin = inicio + n * REGISTRO_MENSAJE.size
+    return [
+        {'id': mid, 'cola': nombres_colas[cola], 'numeros': [a, b, c][:cantidad], 'timestamp': ts}
+        for mid, cola, cantidad, a, b, c, ts
+        in REGISTRO_MENSAJE.iter_unpack(datos[inicio:fin])
+    ]
+
+
+def codificar_resultados(resultados: List[Tuple]) -> bytes:
+    """
+    Codifica un lote de resultados: tuplas (id_mensaje, código de cola,
+    resultado) o, con tiempos, (id_mensaje, código de cola, resultado,
+    timestamp, envío, procesamiento). Todas las tuplas del lote tienen la misma forma.
+    """
+    if resultados and len(resultados[0]) == 6:
+        empaquetar = REGISTRO_RESULTADO_CON_TIEMPOS.pack
+        return CABECERA_LOTE.pack(TIPO_RESULTADOS_CON_TIEMPOS, len(resultados)) + b''.join(
+            empaquetar(*registro) for registro in resultados
+        )
+    empaquetar = REGISTRO_RESULTADO.pack
+    return CABECERA_LOTE.pack(TIPO_RESULTADOS, len(resultados)) + b''.join(
+        empaquetar(mid, cola, resultado) for mid, cola, resultado in resultados
+    )
+
+
+def decodificar_resultados(datos: bytes) -> List[Tuple]:
+    """
+    Decodifica un lote de resultados a tuplas (id_mensaje, código de cola,
+    resultado), o de 6 elementos si la trama lleva tiempos.
+    """
+    tipo, n = CABECERA_LOTE.unpack_from(datos)
+    if tipo == TIPO_RESULTADOS_CON_TIEMPOS:
+        registro = REGISTRO_RESULTADO_CON_TIEMPOS
+    elif tipo == TIPO_RESULTADOS:
+        registro = REGISTRO_RESULTADO
+    else:
+        raise ErrorProtocolo(f"Se esperaba una trama de resultados, tipo recibido: {tipo}")
+    fin = CABECERA_LOTE.size + n * registro.size
+    return list(registro.iter_unpack(datos[CABECERA_LOTE.size:fin]))
+
+
+def es_trama_agregados(datos: bytes) -> bool:
+    """Indica si una trama del canal de resultados trae agregados en lugar de resultados."""
+    return len(datos) > 0 and datos[0] == TIPO_AGREGADOS
+
+
+def codificar_agregados(agregados: List[Tuple[int, int, int, int, int]]) -> bytes:
+    """Codifica resúmenes por cola: tuplas (código de cola, cantidad, suma, mínimo, máximo)."""
+    empaquetar = REGISTRO_AGREGADO.pack
+    return CABECERA_LOTE.pack(TIPO_AGREGADOS, len(agregados)) + b''.join(
+        empaquetar(*agregado) for agregado in agregados
+    )
+
+
+def decodificar_agregados(datos: bytes) -> List[Tuple[int, int, int, int, int]]:
+    """Decodifica una trama de agregados a tuplas (código de cola, cantidad, suma, mínimo, máximo)."""
+    tipo, n = CABECERA_LOTE.unpack_from(datos)
+    if tipo != TIPO_AGREGADOS:
+        raise ErrorProtocolo(f"Se esperaba una trama de agregados, tipo recibido: {tipo}")
+    fin = CABECERA_LOTE.size + n * REGISTRO_AGREGADO.size
+    return list(REGISTRO_AGREGADO.iter_unpack(datos[CABECERA_LOTE.size:fin]))
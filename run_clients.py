@@ -1,43 +1,131 @@
 #!/usr/bin/env python3
 """
 Script para ejecutar múltiples clientes en paralelo.
+
+Por defecto lanza un intérprete por cliente. Con --procesos N reparte los
+clientes en N procesos anfitriones, cada uno con todos sus clientes como
+corrutinas de un solo event loop (cliente_asyncio.py): así se simulan miles
+de suscriptores sin miles de intérpretes.
 """
 
 import subprocess
 import sys
 import argparse
+import multiprocessing
+import queue
 import time
 
-def main():
-    parser = argparse.ArgumentParser(description='Ejecutar múltiples clientes')
-    parser.add_argument('--num-clientes', type=int, default=5, help='Número de clientes a ejecutar')
-    parser.add_argument('--host', type=str, default='localhost', help='Dirección del servidor')
-    parser.add_argument('--port', type=int, default=8888, help='Puerto del servidor')
-    
-    args = parser.parse_args()
-    
+from client_integrated import RESULTADOS_POR_AGREGADO
+from funciones import FUNCION_PREDETERMINADA, CACHES, CACHE_NINGUNA, buscar_funcion
+from cliente_asyncio import ejecutar_proceso_clientes
+from topicos import cargar_registro
+
+# Espera máxima por las estadísticas de un proceso que ya terminó
+ESPERA_ESTADISTICAS = 5.0
+
+
+def repartir_clientes(num_clientes: int, num_procesos: int):
+    """Bloques contiguos de IDs de cliente, uno por proceso, de tamaños parejos."""
+    ids = [f"cliente_{i+1}" for i in range(num_clientes)]
+    base, resto = divmod(num_clientes, num_procesos)
+    bloques = []
+    inicio = 0
+    for indice in range(num_procesos):
+        fin = inicio + base + (1 if indice < resto else 0)
+        bloques.append(ids[inicio:fin])
+        inicio = fin
+    return [bloque for bloque in bloques if bloque]
+
+
+def imprimir_estadisticas(estadisticas):
+    """Tabla por proceso anfitrión y totales."""
+    print(f"\n{'Proceso':>7} {'PID':>7} {'Clientes':>8} {'Conect.':>7} {'Errores':>7} {'Mensajes':>11} "
+          f"{'Mín/cli':>8} {'Máx/cli':>8} {'Msg/s':>10} {'CPU s':>7} {'RSS MB':>7}")
+    for e in estadisticas:
+        ritmo = e['mensajes'] / e['segundos'] if e['segundos'] > 0 else 0.0
+        print(f"{e['proceso']:>7} {e['pid']:>7} {e['clientes']:>8} {e['conectados']:>7} {e['errores']:>7} "
+              f"{e['mensajes']:>11,} {e['minimo_cliente']:>8,} {e['maximo_cliente']:>8,} {ritmo:>10,.0f} "
+              f"{e['cpu']:>7.2f} {e['rss_max_kb'] / 1024:>7.1f}")
+
+    clientes = sum(e['clientes'] for e in estadisticas)
+    conectados = sum(e['conectados'] for e in estadisticas)
+    errores = sum(e['errores'] for e in estadisticas)
+    mensajes = sum(e['mensajes'] for e in estadisticas)
+    segundos = max((e['segundos'] for e in estadisticas), default=0.0)
+    print(f"\nTotal: {clientes} clientes en {len(estadisticas)} procesos, {conectados} conectados, "
+          f"{errores} con error")
+    if segundos > 0:
+        print(f"Mensajes procesados: {mensajes:,} en {segundos:.2f} s ({mensajes / segundos:,.0f} msg/s)")
+    print(f"CPU total: {sum(e['cpu'] for e in estadisticas):.2f} s")
+
+
+def ejecutar_en_procesos(args, opciones):
+    """Reparte los clientes en args.procesos procesos anfitriones y reúne sus estadísticas."""
+    bloques = repartir_clientes(args.num_clientes, args.procesos)
+    contexto = multiprocessing.get_context('spawn')
+    cola_estadisticas = contexto.Queue()
+    procesos = []
+
+    print(f"Iniciando {args.num_clientes} clientes en {len(bloques)} procesos...")
+    inicio = time.perf_counter()
+    try:
+        for indice, ids in enumerate(bloques):
+            proceso = contexto.Process(
+                target=ejecutar_proceso_clientes,
+                args=(indice, ids, args.host, args.port, opciones, args.escalonamiento, cola_estadisticas)
+            )
+            proceso.start()
+            procesos.append(proceso)
+            print(f"Proceso {indice} iniciado (PID: {proceso.pid}): {ids[0]} a {ids[-1]}")
+
+        print(f"\n{args.num_clientes} clientes ejecutándose. Presiona Ctrl+C para detenerlos.")
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        # Los procesos anfitriones también reciben la interrupción: cierran sus clientes y reportan
+        print("\nDeteniendo clientes...")
+        for proceso in procesos:
+            proceso.join()
+        print("Clientes detenidos.")
+
+    estadisticas = []
+    for _ in procesos:
+        try:
+            estadisticas.append(cola_estadisticas.get(timeout=ESPERA_ESTADISTICAS))
+        except queue.Empty:
+            break
+    estadisticas.sort(key=lambda e: e['proceso'])
+    if len(estadisticas) < len(procesos):
+        print(f"Advertencia: {len(procesos) - len(estadisticas)} procesos no reportaron estadísticas")
+    imprimir_estadisticas(estadisticas)
+    print(f"Tiempo total (incluido el arranque): {time.perf_counter() - inicio:.2f} s")
+
+
+def ejecutar_en_interpretes(args, opciones_cli):
+    """Un intérprete de client_integrated.py por cliente."""
     procesos = []
-    
+
     print(f"Iniciando {args.num_clientes} clientes...")
-    
+
     try:
         for i in range(args.num_clientes):
             cliente_id = f"cliente_{i+1}"
             proceso = subprocess.Popen(
-                [sys.executable, 'client_integrated.py', '--id', cliente_id, '--host', args.host, '--port', str(args.port)],
+                [sys.executable, 'client_integrated.py', '--id', cliente_id, '--host', args.host,
+                 '--port', str(args.port)] + opciones_cli,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
             procesos.append(proceso)
             print(f"Cliente {cliente_id} iniciado (PID: {proceso.pid})")
-            time.sleep(0.1)  # Pequeña pausa entre inicios
-        
+            time.sleep(args.escalonamiento)  # Pequeña pausa entre inicios
+
         print(f"\n{args.num_clientes} clientes ejecutándose. Presiona Ctrl+C para detenerlos.")
-        
+
         # Esperar a que terminen todos los procesos
         for proceso in procesos:
             proceso.wait()
-            
+
     except KeyboardInterrupt:
         print("\nDeteniendo clientes...")
         for proceso in procesos:
@@ -46,6 +134,77 @@ def main():
             proceso.wait()
         print("Clientes detenidos.")
 
+
+def main():
+    parser = argparse.ArgumentParser(description='Ejecutar múltiples clientes')
+    parser.add_argument('--num-clientes', type=int, default=5, help='Número de clientes a ejecutar')
+    parser.add_argument('--host', type=str, default='localhost', help='Dirección del servidor')
+    parser.add_argument('--port', type=int, default=8888, help='Puerto del servidor')
+    parser.add_argument('--procesos', type=int, default=0,
+                        help='Procesos anfitriones con muchos clientes asyncio cada uno '
+                             '(0: un intérprete por cliente)')
+    parser.add_argument('--escalonamiento', type=float, default=None, metavar='SEGUNDOS',
+                        help='Pausa entre el inicio de dos clientes '
+                             '(por defecto 0.1 con un intérprete por cliente y 0.001 con --procesos)')
+    parser.add_argument('--lote', type=int, default=None, help='Resultados enviados por trama')
+    parser.add_argument('--confirmar', action='store_true', help='Confirmar los mensajes procesados')
+    parser.add_argument('--agregar', type=int, nargs='?', const=RESULTADOS_POR_AGREGADO, default=0, metavar='N',
+                        help='Enviar un resumen por cola cada N resultados en lugar de cada resultado')
+    parser.add_argument('--ventana', type=int, default=0, help='Ventana de crédito de cada cliente')
+    parser.add_argument('--funcion', type=str, default=FUNCION_PREDETERMINADA, metavar='NOMBRE',
+                        help='Función de procesamiento de todos los clientes')
+    parser.add_argument('--cache', type=str, choices=CACHES, default=CACHE_NINGUNA,
+                        help='Caché de resultados de la función (compartida por los clientes de cada proceso)')
+    parser.add_argument('--topicos', type=str, default=None, metavar='ARCHIVO',
+                        help='Registro de tópicos (JSON o TOML), el mismo que usa el servidor')
+    parser.add_argument('--suscribir', type=str, default=None, metavar='PATRONES',
+                        help='Tópicos de todos los clientes, separados por comas (por defecto, al azar)')
+
+    args = parser.parse_args()
+    if args.num_clientes < 1:
+        parser.error("--num-clientes debe ser al menos 1")
+    if args.procesos < 0:
+        parser.error("--procesos no puede ser negativo")
+    if args.escalonamiento is None:
+        args.escalonamiento = 0.001 if args.procesos else 0.1
+
+    if not args.procesos:
+        opciones_cli = []
+        if args.lote is not None:
+            opciones_cli += ['--lote', str(args.lote)]
+        if args.confirmar:
+            opciones_cli.append('--confirmar')
+        if args.agregar:
+            opciones_cli += ['--agregar', str(args.agregar)]
+        if args.funcion != FUNCION_PREDETERMINADA:
+            opciones_cli += ['--funcion', args.funcion]
+        if args.cache != CACHE_NINGUNA:
+            opciones_cli += ['--cache', args.cache]
+        if args.ventana:
+            opciones_cli += ['--ventana', str(args.ventana)]
+        if args.topicos:
+            opciones_cli += ['--topicos', args.topicos]
+        if args.suscribir:
+            opciones_cli += ['--suscribir', args.suscribir]
+        ejecutar_en_interpretes(args, opciones_cli)
+        return
+
+    try:
+        topicos = cargar_registro(args.topicos)
+        suscripciones = [patron.strip() for patron in args.suscribir.split(',')] if args.suscribir else None
+        if suscripciones:
+            topicos.resolver(suscripciones)
+        buscar_funcion(args.funcion)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    opciones = {'confirmar': args.confirmar, 'ventana': args.ventana, 'agregar': args.agregar,
+                'funcion': args.funcion, 'cache': args.cache,
+                'topicos': topicos, 'suscripciones': suscripciones}
+    if args.lote is not None:
+        opciones['tamaño_lote'] = args.lote
+    ejecutar_en_procesos(args, opciones)
+
+
 if __name__ == "__main__":
     main()
-
@@ -10,20 +10,26 @@ import time
 import threading
 import socket
 import pickle
-import struct
-from queue import Queue, Empty
-from collections import defaultdict
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set, Tuple
 
-# Colas para los diferentes tipos de mensajes
-COLA_PRINCIPAL = "principal"
-COLA_SECUNDARIA = "secundaria"
-COLA_TERCIARIA = "terciaria"
-
-# Criterios de selección
-CRITERIO_ALEATORIO = "aleatorio"
-CRITERIO_PONDERADO = "ponderado"
-CRITERIO_CONDICIONAL = "condicional"
+from agregacion import AgregadorFragmentado
+from generador import GeneradorLotes, CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL
+from perfilado import TiemposEtapas, Perfilador, crear_hilo, lineas_tiempos, DIRECTORIO_PERFILES
+from grabacion import GrabadorMensajes, ReproductorMensajes, RITMOS, RITMO_MAXIMO, describir_grabacion
+from topicos import RegistroTopicos, REGISTRO_PREDETERMINADO, cargar_registro
+from memoria_compartida import AnilloMensajes, MEMORIA_COMPARTIDA_DISPONIBLE, AVISO, cliente_local
+from persistencia import INTERVALO_FSYNC
+from despachador import (
+    Despachador, Suscripcion, MensajesEnVuelo, POLITICAS_DESPACHO, POLITICA_ALEATORIA,
+    POLITICAS_DESBORDE, DESBORDE_BLOQUEAR, CAPACIDAD_COLA,
+)
+from protocolo import (
+    VERSION_PICKLE, VERSION_BINARIO,
+    OPCION_CONFIRMACIONES, OPCION_VENTANA, OPCION_LATENCIAS, OPCION_MEMORIA_COMPARTIDA, OPCION_AGREGADOS,
+    LectorTramas, enviar_tramas, es_saludo_pickle, decodificar_saludo, decodificar_opciones_saludo,
+    codificar_aceptacion, decodificar_confirmacion, codificar_mensajes, decodificar_resultados,
+    es_trama_agregados, decodificar_agregados,
+)
 
 # Objetivo de resultados
 OBJETIVO_RESULTADOS = 1_000_000
@@ -32,13 +38,48 @@ OBJETIVO_RESULTADOS = 1_000_000
 SERVER_HOST = "localhost"
 SERVER_PORT = 8888
 
+# Motores de E/S del servidor
+MOTOR_HILOS = "hilos"
+MOTOR_ASYNCIO = "asyncio"
+
+# Garantía de entrega de mensajes
+ENTREGA_SIN_CONFIRMACION = "sin_confirmacion"
+ENTREGA_AL_MENOS_UNA_VEZ = "al_menos_una_vez"
+TIMEOUT_CONFIRMACION = 5.0  # segundos antes de reencolar un mensaje sin confirmar
+
+# Fragmentos del agregador de resultados (locks independientes)
+FRAGMENTOS_AGREGADOR = 16
+
+# Generación y entrega de mensajes
+TAMAÑO_LOTE_GENERACION = 1000
+MAX_MENSAJES_POR_TRAMA = 64
+MAX_MENSAJES_POR_ESCRITURA_ANILLO = 1024  # sin tramas, el lote solo lo limita el espacio libre
+INTERVALO_VERIFICACION = 0.5  # segundos sin mensajes antes de comprobar la conexión
+ESPERA_ANILLO_LLENO = 0.001  # segundos entre comprobaciones mientras el cliente no libera espacio
+
+# Segundos sin resultados nuevos, con la grabación ya agotada, antes de detener el servidor
+ESPERA_FIN_REPRODUCCION = 5.0
+
+# Conexiones pendientes de aceptar por puerto (run_clients.py --procesos conecta miles en ráfaga)
+BACKLOG_CONEXIONES = 1024
+
 
 class PublisherServer:
     """
     Servidor que actúa como Publisher en el modelo Publisher-Subscriber.
     """
     
-    def __init__(self, criterio: str, host: str = SERVER_HOST, port: int = SERVER_PORT):
+    def __init__(self, criterio: str, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                 politica_despacho: str = POLITICA_ALEATORIA, pesos_despacho: Dict[str, float] = None,
+                 capacidad_cola: int = CAPACIDAD_COLA, politica_desborde: str = DESBORDE_BLOQUEAR,
+                 objetivo: int = OBJETIVO_RESULTADOS, con_histograma: bool = False,
+                 guardar_resultados: bool = False, directorio_persistencia: str = None,
+                 intervalo_fsync: float = INTERVALO_FSYNC, entrega: str = ENTREGA_SIN_CONFIRMACION,
+                 timeout_confirmacion: float = TIMEOUT_CONFIRMACION, direccion_metricas: str = None,
+                 semilla: int = None, topicos: RegistroTopicos = REGISTRO_PREDETERMINADO,
+                 grabar: str = None, reproducir: str = None, ritmo: str = RITMO_MAXIMO,
+                 tramo_reproduccion: Tuple[int, int] = (0, 1), ttl: float = None,
+                 ttl_colas: Dict[str, float] = None, perfilar: str = None):
         """
         Inicializa el servidor Publisher.
         
@@ -46,112 +87,379 @@ class PublisherServer:
             criterio: Criterio de selección de cola
             host: Dirección del servidor
             port: Puerto del servidor
+            politica_despacho: Equidad entre las colas de un cliente (round_robin, ponderada, aleatoria)
+            pesos_despacho: Peso de cada cola para la política ponderada
+            capacidad_cola: Máximo de mensajes en espera por cola
+            politica_desborde: Qué hacer con una cola llena (bloquear, descartar_antiguo, descartar_nuevo)
+            objetivo: Número de resultados tras el cual se detiene el servidor
+            con_histograma: Mantener un histograma de resultados por cliente y por cola
+            guardar_resultados: Conservar además cada resultado en un arreglo compacto
+            directorio_persistencia: Directorio donde registrar las colas en disco (None: solo memoria)
+            intervalo_fsync: Segundos entre confirmaciones en disco del registro de colas
+            entrega: Garantía de entrega (sin_confirmacion o al_menos_una_vez)
+            timeout_confirmacion: Segundos antes de reencolar un mensaje entregado sin confirmar
+            direccion_metricas: Puerto, host:puerto o socket Unix del endpoint de métricas (None: sin endpoint)
+            semilla: Semilla del generador de mensajes, para repetir exactamente la misma carga
+            topicos: Registro de tópicos (colas, pesos y reglas condicionales)
+            grabar: Archivo donde grabar cada mensaje generado (None: sin grabación)
+            reproducir: Archivo de grabación con el que alimentar las colas en lugar de generar
+            ritmo: Ritmo de la reproducción ('maximo' u 'original')
+            tramo_reproduccion: (parte, partes) de la grabación que reproduce este proceso
+            ttl: Tiempo de vida en segundos de los mensajes de las colas sin TTL en el registro
+            ttl_colas: Tiempo de vida por cola, con precedencia sobre el registro y `ttl`
+            perfilar: Directorio donde guardar un perfil de cProfile por rol de hilo (None: sin perfilar)
         """
         self.criterio = criterio
+        self.topicos = topicos
         self.host = host
         self.port = port
-        self.colas = {
-            COLA_PRINCIPAL: Queue(),
-            COLA_SECUNDARIA: Queue(),
-            COLA_TERCIARIA: Queue()
-        }
-        self.resultados = []
-        self.registro_clientes = defaultdict(list)
-        self.suscripciones_clientes = defaultdict(set)
+        self.politica_despacho = politica_despacho
+        self.pesos_despacho = pesos_despacho or {}
+        ttl_efectivo = {cola: ttl for cola in topicos.nombres} if ttl else {}
+        ttl_efectivo.update(topicos.ttl)
+        ttl_efectivo.update(ttl_colas or {})
+        self.despachador = Despachador(
+            topicos.nombres, capacidad_cola, politica_desborde, directorio_persistencia, intervalo_fsync,
+            ttl=ttl_efectivo,
+            prioridades={cola: len(niveles) for cola, niveles in topicos.prioridades.items()},
+            ttl_por_mensaje=any(any(niveles.ttl_ns) for niveles in topicos.prioridades.values()),
+        )
+        self.grabador = None
+        self.reproductor = None
+        self.fin_reproduccion = None  # (resultados, instante) desde que se agotó la grabación
+        if reproducir is not None:
+            # Los lotes salen de la grabación: misma interfaz que GeneradorLotes
+            self.reproductor = self.generador = ReproductorMensajes(reproducir, topicos, ritmo, tramo_reproduccion)
+            print(f"Reproduciendo {self.reproductor.total:,} mensajes de {reproducir} "
+                  f"(grabados con criterio {self.reproductor.criterio}, ritmo {ritmo})")
+        else:
+            self.generador = GeneradorLotes(criterio, semilla, topicos=topicos)
+            if grabar is not None:
+                self.grabador = GrabadorMensajes(grabar, criterio, topicos)
+                print(f"Grabando los mensajes generados en {grabar}")
+        self.objetivo = objetivo
+        self.entrega = entrega
+        self.timeout_confirmacion = timeout_confirmacion
+        self.agregador = AgregadorFragmentado(FRAGMENTOS_AGREGADOR, con_histograma, guardar_resultados)
         self.lock = threading.Lock()
-        self.total_resultados = 0
+        self.progreso_reportado = 0
         self.running = True
         self.socket_server = None
+        self.direccion_metricas = direccion_metricas
+        self.exportador_metricas = None
+        
+        # Tiempos por etapa del camino caliente (siempre activos) y perfiles opcionales
+        self.tiempos = TiemposEtapas()
+        self.perfilador = Perfilador(perfilar, "servidor") if perfilar else None
+        
+        # Modo multiproceso (ver trabajadores.py)
+        self.reutilizar_puerto = False  # compartir los puertos con otros procesos (SO_REUSEPORT)
+        self.primer_mensaje_id = 0      # inicio del rango de IDs de este proceso
+        self.mostrar_progreso = True
+        
+        if self.despachador.persistencia is not None:
+            # Continuar la numeración de los mensajes ya registrados en disco
+            self.primer_mensaje_id = self.despachador.persistencia.siguiente_id
+            print(f"Colas registradas en {directorio_persistencia}: "
+                  f"{self.despachador.recuperados:,} mensajes pendientes recuperados")
         
         print(f"Servidor Publisher iniciado con criterio: {criterio}")
     
     def seleccionar_cola_aleatorio(self) -> str:
-        """Selecciona una cola aleatoriamente (33% para cada una)."""
-        return random.choice([COLA_PRINCIPAL, COLA_SECUNDARIA, COLA_TERCIARIA])
+        """Selecciona una cola aleatoriamente (la misma probabilidad para cada una)."""
+        return self.topicos.nombres[self.topicos.enrutar(CRITERIO_ALEATORIO, [], random)]
     
     def seleccionar_cola_ponderado(self) -> str:
-        """Selecciona una cola de forma ponderada: 50% principal, 30% secundaria, 20% terciaria."""
-        rand = random.random()
-        if rand < 0.5:
-            return COLA_PRINCIPAL
-        elif rand < 0.8:
-            return COLA_SECUNDARIA
-        else:
-            return COLA_TERCIARIA
+        """Selecciona una cola según los pesos del registro (por defecto 50% principal, 30% secundaria, 20% terciaria)."""
+        return self.topicos.nombres[self.topicos.enrutar(CRITERIO_PONDERADO, [], random)]
     
     def seleccionar_cola_condicional(self, numeros: List[int]) -> str:
         """
-        Selecciona una cola según las características de los números.
+        Selecciona una cola según las características de los números, con las
+        reglas del registro (por defecto):
         - Dos números pares → Principal
         - Dos números impares → Secundaria
         - Tres números pares o impares → Terciaria
         """
-        pares = sum(1 for n in numeros if n % 2 == 0)
-        impares = len(numeros) - pares
-        
-        if len(numeros) == 2:
-            if pares == 2:
-                return COLA_PRINCIPAL
-            elif impares == 2:
-                return COLA_SECUNDARIA
-        elif len(numeros) == 3:
-            if pares == 3 or impares == 3:
-                return COLA_TERCIARIA
-        
-        # Por defecto, usar ponderado
-        return self.seleccionar_cola_ponderado()
+        return self.topicos.nombres[self.topicos.enrutar(CRITERIO_CONDICIONAL, numeros, random)]
     
     def seleccionar_cola(self, numeros: List[int]) -> str:
-        """Selecciona la cola según el criterio configurado."""
-        if self.criterio == CRITERIO_ALEATORIO:
-            return self.seleccionar_cola_aleatorio()
-        elif self.criterio == CRITERIO_PONDERADO:
-            return self.seleccionar_cola_ponderado()
-        elif self.criterio == CRITERIO_CONDICIONAL:
-            return self.seleccionar_cola_condicional(numeros)
-        else:
-            raise ValueError(f"Criterio desconocido: {self.criterio}")
+        """Selecciona la cola según el criterio configurado (una consulta a la tabla de enrutamiento)."""
+        return self.topicos.nombres[self.topicos.enrutar(self.criterio, numeros, random)]
     
     def generar_numeros(self) -> List[int]:
         """Genera un conjunto aleatorio de números (2 o 3 números)."""
         cantidad = random.choice([2, 3])
         return [random.randint(1, 100) for _ in range(cantidad)]
     
+    def generar_mensaje(self, mensaje_id: int) -> Dict:
+        """Genera un mensaje con números aleatorios y la cola que le corresponde."""
+        numeros = self.generar_numeros()
+        return {
+            'id': mensaje_id,
+            'numeros': numeros,
+            'cola': self.seleccionar_cola(numeros),
+            'timestamp': time.monotonic_ns()
+        }
+    
+    def generar_lote(self, mensaje_id: int) -> Dict[str, List[Dict]]:
+        """
+        Genera TAMAÑO_LOTE_GENERACION mensajes agrupados por cola.
+        Equivale a llamar generar_mensaje() para cada ID, pero sortea los
+        números y las colas de todo el lote de una vez.
+        """
+        lote = self.generador.generar(mensaje_id, TAMAÑO_LOTE_GENERACION)
+        if self.grabador is not None:
+            self.grabador.grabar_lote(lote)
+        return lote
+    
+    def demora_reproduccion(self) -> Optional[float]:
+        """
+        Segundos a esperar antes del siguiente lote de la grabación (0 si ya
+        toca, o si no se está reproduciendo); None cuando la grabación se agotó.
+        """
+        if self.reproductor is None:
+            return 0.0
+        if self.reproductor.agotado:
+            print(f"Grabación reproducida completa: {self.reproductor.reproducidos:,} mensajes publicados")
+            return None
+        return self.reproductor.demora()
+    
+    def comprobar_fin_reproduccion(self):
+        """
+        Detiene el servidor si la grabación se agotó y pasaron
+        ESPERA_FIN_REPRODUCCION segundos sin resultados nuevos (p. ej., quedan
+        mensajes en colas sin suscriptores que nunca alcanzarán el objetivo).
+        """
+        if self.reproductor is None or not self.reproductor.agotado or not self.running:
+            return
+        total = self.total_resultados
+        ahora = time.monotonic()
+        if self.fin_reproduccion is None or self.fin_reproduccion[0] != total:
+            self.fin_reproduccion = (total, ahora)
+        elif ahora - self.fin_reproduccion[1] >= ESPERA_FIN_REPRODUCCION:
+            print(f"\nGrabación agotada y sin resultados nuevos en {ESPERA_FIN_REPRODUCCION:.0f} s: "
+                  f"deteniendo con {total:,} resultados.")
+            self.detener()
+    
+    def cerrar_grabacion(self):
+        """Cierra el archivo de grabación o de reproducción, si hay alguno."""
+        if self.grabador is not None:
+            self.grabador.cerrar()
+            print(f"Grabación cerrada: {self.grabador.grabados:,} mensajes en {self.grabador.ruta}")
+        if self.reproductor is not None:
+            self.reproductor.cerrar()
+    
     def generar_y_publicar(self):
-        """Genera números y los publica en las colas correspondientes."""
-        mensaje_id = 0
+        """
+        Genera números y los publica en las colas correspondientes.
+        El ritmo lo marcan los consumidores: solo se genera un lote cuando
+        alguna cola con suscriptores tiene espacio, y una cola llena bloquea
+        o descarta según la política de desborde. Al reproducir una grabación
+        se publica hasta agotarla, con las esperas del ritmo original si se pidió.
+        """
+        mensaje_id = self.primer_mensaje_id
         while self.running:
-            numeros = self.generar_numeros()
-            cola = self.seleccionar_cola(numeros)
-            
-            mensaje = {
-                'id': mensaje_id,
-                'numeros': numeros,
-                'cola': cola,
-                'timestamp': time.time()
-            }
+            if not self.despachador.esperar_demanda(INTERVALO_VERIFICACION):
+                continue
+            demora = self.demora_reproduccion()
+            if demora is None:
+                break
+            if demora > 0:
+                time.sleep(min(demora, INTERVALO_VERIFICACION))
+                continue
             
-            self.colas[cola].put(mensaje)
-            mensaje_id += 1
-            
-            # Pequeña pausa para no saturar
-            if mensaje_id % 1000 == 0:
-                time.sleep(0.01)
+            inicio = time.perf_counter_ns()
+            lote = self.generar_lote(mensaje_id)
+            inicio = self.tiempos.sumar('generacion', inicio)
+            for cola, mensajes in lote.items():
+                self.despachador.publicar_lote(cola, mensajes)
+            self.tiempos.sumar('publicacion', inicio)
+            mensaje_id += TAMAÑO_LOTE_GENERACION
+    
+    @property
+    def total_resultados(self) -> int:
+        """Resultados registrados hasta el momento en todos los fragmentos."""
+        return self.agregador.total()
     
     def procesar_resultado(self, cliente_id: str, resultado: int, colas_suscritas: Set[str]):
         """Procesa un resultado recibido de un cliente."""
-        with self.lock:
-            self.resultados.append(resultado)
-            self.registro_clientes[cliente_id].append(resultado)
-            self.suscripciones_clientes[cliente_id].update(colas_suscritas)
-            self.total_resultados += 1
-            
-            if self.total_resultados % 10000 == 0:
-                print(f"Resultados recibidos: {self.total_resultados:,} / {OBJETIVO_RESULTADOS:,}")
-            
-            if self.total_resultados >= OBJETIVO_RESULTADOS:
-                self.running = False
-                print(f"\n¡Objetivo alcanzado! {self.total_resultados:,} resultados recibidos.")
+        self.procesar_resultados(cliente_id, [resultado], colas_suscritas)
+    
+    def procesar_resultados(self, cliente_id: str, resultados: List[int], colas_suscritas: Set[str],
+                            colas_resultado: List[str] = None, fragmento: int = 0,
+                            tiempos: List[Tuple[int, int, int]] = None, llegada: int = 0):
+        """
+        Procesa un lote de resultados recibido de un cliente.
+        Solo se toma el lock del fragmento de la conexión; el lock global se
+        usa una única vez, al detectar que se alcanzó el objetivo.
+        """
+        inicio = time.perf_counter_ns()
+        self.agregador.registrar(fragmento, cliente_id, resultados, colas_suscritas, colas_resultado,
+                                 tiempos, llegada)
+        self.tiempos.sumar('registro_resultados', inicio)
+        self.comprobar_objetivo()
+    
+    def procesar_agregados(self, cliente_id: str, agregados: List[Tuple[str, int, int, int, int]],
+                           colas_suscritas: Set[str], fragmento: int = 0):
+        """
+        Procesa los resúmenes (cola, cantidad, suma, mínimo, máximo) de un
+        cliente con la opción de agregados. Cuentan para el objetivo como los
+        resultados que resumen.
+        """
+        inicio = time.perf_counter_ns()
+        self.agregador.registrar_agregados(fragmento, cliente_id, agregados, colas_suscritas)
+        self.tiempos.sumar('registro_resultados', inicio)
+        self.comprobar_objetivo()
+    
+    def comprobar_objetivo(self):
+        """Detiene el servidor si ya se recibieron `objetivo` resultados."""
+        if self.running and self.agregador.total() >= self.objetivo:
+            with self.lock:
+                if self.running:
+                    self.running = False
+                    print(f"\n¡Objetivo alcanzado! {self.total_resultados:,} resultados recibidos.")
+    
+    def reportar_progreso(self):
+        """Muestra el progreso cada 10,000 resultados (se llama fuera del camino caliente)."""
+        if not self.mostrar_progreso:
+            return
+        total = self.total_resultados
+        if total // 10000 > self.progreso_reportado // 10000:
+            print(f"Resultados recibidos: {total:,} / {self.objetivo:,}")
+            self.progreso_reportado = total
+    
+    def interpretar_suscripcion(self, datos: bytes):
+        """
+        Interpreta la trama de suscripción y negocia el formato de la conexión.
+        Los clientes antiguos envían un dict con pickle.
+        
+        Returns:
+            Tupla (versión del protocolo, cliente_id, colas suscritas)
+        """
+        if es_saludo_pickle(datos):
+            suscripcion = pickle.loads(datos)
+            return VERSION_PICKLE, suscripcion.get('cliente_id', 'unknown'), suscripcion.get('colas', set())
+        return decodificar_saludo(datos, self.topicos.nombres)
+    
+    def negociar_opciones(self, datos: bytes, version: int, local: bool = False):
+        """
+        Opciones que quedan activas para la conexión y ventana de crédito
+        aceptada (0 si no hay), o None si el cliente no anunció opciones en
+        el saludo (y por tanto no espera respuesta). La memoria compartida
+        solo se acepta si el cliente está en esta máquina (`local`).
+        """
+        if version != VERSION_BINARIO:
+            return None
+        anunciadas = decodificar_opciones_saludo(datos)
+        if anunciadas is None:
+            return None
+        opciones, ventana = anunciadas
+        activas = 0
+        if self.entrega == ENTREGA_AL_MENOS_UNA_VEZ:
+            activas |= opciones & OPCION_CONFIRMACIONES
+        activas |= opciones & (OPCION_LATENCIAS | OPCION_AGREGADOS)
+        if local and MEMORIA_COMPARTIDA_DISPONIBLE:
+            activas |= opciones & OPCION_MEMORIA_COMPARTIDA
+        if opciones & OPCION_VENTANA and ventana > 0:
+            # La ventana solo necesita las confirmaciones del cliente: se acepta en cualquier modo
+            activas |= OPCION_VENTANA
+        else:
+            ventana = 0
+        return activas, ventana
+    
+    def preparar_entrega(self, cliente_id: str, colas_suscritas: Set[str], opciones: int, ventana: int):
+        """
+        Suscribe al cliente con su ventana de crédito y crea, si el cliente
+        confirma mensajes, la tabla de mensajes en vuelo.
+        
+        Returns:
+            Tupla (suscripción, mensajes en vuelo o None)
+        """
+        suscripcion = self.despachador.suscribir(colas_suscritas, self.politica_despacho, self.pesos_despacho,
+                                                 ventana or None, cliente_id)
+        en_vuelo = None
+        if opciones & (OPCION_CONFIRMACIONES | OPCION_VENTANA):
+            # Solo con entrega al menos una vez lo no confirmado vuelve a la cola
+            en_vuelo = MensajesEnVuelo(reencolar=bool(opciones & OPCION_CONFIRMACIONES))
+        return suscripcion, en_vuelo
+    
+    def crear_anillo(self, opciones: int) -> Optional[AnilloMensajes]:
+        """Segmento de memoria compartida de la conexión, si se negoció ese transporte."""
+        if not opciones & OPCION_MEMORIA_COMPARTIDA:
+            return None
+        return AnilloMensajes.crear()
+    
+    @staticmethod
+    def describir_transporte(anillo: Optional[AnilloMensajes]) -> str:
+        return f" (memoria compartida {anillo.nombre})" if anillo is not None else ""
+    
+    def serializar_mensajes(self, version: int, mensajes: List[Dict], con_tiempos: bool = False) -> List[bytes]:
+        """
+        Serializa mensajes en el formato negociado: cuerpos de las tramas a
+        enviar. Con tiempos, la trama lleva el instante de envío.
+        """
+        if version == VERSION_BINARIO:
+            return [codificar_mensajes(mensajes, time.monotonic_ns() if con_tiempos else None, self.topicos.codigos)]
+        return [pickle.dumps(mensaje) for mensaje in mensajes]
+    
+    def nueva_conexion_resultados(self) -> Dict:
+        """Estado de una conexión de resultados recién aceptada."""
+        return {
+            'version': None,
+            'cliente_id': None,
+            'colas_suscritas': set(),
+            'fragmento': self.agregador.asignar_fragmento(),
+        }
+    
+    def procesar_trama_resultados(self, conexion: Dict, datos: bytes):
+        """
+        Procesa una trama recibida por el canal de resultados.
+        La primera trama de la conexión decide el formato; `conexion` guarda
+        ese estado entre tramas (version, cliente_id, colas_suscritas, fragmento).
+        """
+        if conexion['version'] is None:
+            if es_saludo_pickle(datos):
+                conexion['version'] = VERSION_PICKLE
+            else:
+                conexion['version'], conexion['cliente_id'], conexion['colas_suscritas'] = decodificar_saludo(
+                    datos, self.topicos.nombres)
+                return
+        
+        inicio = time.perf_counter_ns()
+        colas_resultado = None
+        tiempos = None
+        llegada = 0
+        if conexion['version'] == VERSION_BINARIO and es_trama_agregados(datos):
+            nombres = self.topicos.nombres
+            agregados = [(nombres[codigo], cantidad, suma, minimo, maximo)
+                         for codigo, cantidad, suma, minimo, maximo in decodificar_agregados(datos)]
+            self.tiempos.sumar('decodificacion_resultados', inicio)
+            self.procesar_agregados(conexion['cliente_id'], agregados, conexion['colas_suscritas'],
+                                    conexion['fragmento'])
+            return
+        if conexion['version'] == VERSION_BINARIO:
+            registros = decodificar_resultados(datos)
+            resultados = [registro[2] for registro in registros]
+            nombres = self.topicos.nombres
+            colas_resultado = [nombres[registro[1]] for registro in registros]
+            if registros and len(registros[0]) == 6:
+                # Resultados con tiempos: (id, cola, resultado, timestamp, envío, procesamiento)
+                llegada = time.monotonic_ns()
+                tiempos = [registro[3:] for registro in registros]
+        else:
+            resultado_data = pickle.loads(datos)
+            conexion['cliente_id'] = resultado_data['cliente_id']
+            conexion['colas_suscritas'] = resultado_data['colas_suscritas']
+            if 'resultados' in resultado_data:
+                resultados = resultado_data['resultados']
+            else:
+                # Clientes antiguos: un resultado por conexión
+                resultados = [resultado_data['resultado']]
+        self.tiempos.sumar('decodificacion_resultados', inicio)
+        
+        self.procesar_resultados(conexion['cliente_id'], resultados, conexion['colas_suscritas'],
+                                 colas_resultado, conexion['fragmento'], tiempos, llegada)
     
     def manejar_cliente_mensajes(self, cliente_socket, cliente_address):
         """
@@ -160,95 +468,153 @@ class PublisherServer:
         """
         try:
             # Recibir información de suscripción del cliente
-            tamaño_data = cliente_socket.recv(4)
-            if len(tamaño_data) < 4:
+            lector = LectorTramas(cliente_socket)
+            datos = lector.leer_trama()
+            if datos is None:
                 return
             
-            tamaño = struct.unpack('!I', tamaño_data)[0]
-            datos = b''
-            while len(datos) < tamaño:
-                chunk = cliente_socket.recv(tamaño - len(datos))
-                if not chunk:
-                    return
-                datos += chunk
-            
-            suscripcion = pickle.loads(datos)
-            cliente_id = suscripcion.get('cliente_id', 'unknown')
-            colas_suscritas = suscripcion.get('colas', set())
+            version, cliente_id, colas_suscritas = self.interpretar_suscripcion(datos)
+            negociadas = self.negociar_opciones(datos, version, cliente_local(cliente_socket))
+            opciones, ventana = negociadas or (0, 0)
+            anillo = self.crear_anillo(opciones)
+            if negociadas is not None:
+                enviar_tramas(cliente_socket, [codificar_aceptacion(opciones, anillo and anillo.nombre)])
             
-            print(f"Cliente {cliente_id} conectado desde {cliente_address}, suscrito a: {', '.join(sorted(colas_suscritas))}")
+            print(f"Cliente {cliente_id} conectado desde {cliente_address}, suscrito a: "
+                  f"{', '.join(sorted(colas_suscritas))}{self.describir_transporte(anillo)}")
             
-            # Enviar mensajes al cliente mientras esté conectado
-            while self.running:
-                mensaje_enviado = False
-                
-                # Si el cliente está suscrito a múltiples colas, seleccionar aleatoriamente
-                # Si está suscrito a una sola, usar esa
-                colas_lista = list(colas_suscritas)
-                if len(colas_lista) > 1:
-                    # Selección aleatoria cuando hay múltiples colas
-                    random.shuffle(colas_lista)
-                
-                # Intentar obtener un mensaje de cualquiera de las colas suscritas
-                for cola in colas_lista:
-                    try:
-                        mensaje = self.colas[cola].get(timeout=0.1)
-                        
-                        # Serializar y enviar mensaje
-                        datos_mensaje = pickle.dumps(mensaje)
-                        tamaño_mensaje = len(datos_mensaje)
-                        
-                        cliente_socket.sendall(struct.pack('!I', tamaño_mensaje))
-                        cliente_socket.sendall(datos_mensaje)
-                        
-                        mensaje_enviado = True
-                        break
-                    except Empty:
-                        continue
-                
-                if not mensaje_enviado:
-                    # No hay mensajes, enviar señal de espera
-                    time.sleep(0.01)
-                
-                # Verificar si el cliente sigue conectado
-                try:
-                    cliente_socket.settimeout(0.1)
-                    cliente_socket.recv(1, socket.MSG_PEEK)
-                except (socket.timeout, ConnectionResetError, BrokenPipeError):
-                    break
+            # Esperar sobre la unión de las colas suscritas y enviar en cuanto haya mensajes
+            suscripcion, en_vuelo = self.preparar_entrega(cliente_id, colas_suscritas, opciones, ventana)
+            if en_vuelo is not None:
+                # Con ventana, una trama pequeña retenida por Nagle retrasa todo el crédito del cliente
+                cliente_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                crear_hilo(self.perfilador, self.leer_confirmaciones, 'confirmaciones',
+                           (lector, en_vuelo, suscripcion)).start()
+            try:
+                self.entregar_mensajes(cliente_socket, version, suscripcion, en_vuelo,
+                                       bool(opciones & OPCION_LATENCIAS), anillo)
+            finally:
+                self.despachador.desuscribir(suscripcion)
+                if en_vuelo is not None and en_vuelo.reencolar:
+                    # Lo que el cliente no confirmó vuelve a la cola para otro suscriptor
+                    self.despachador.reencolar(en_vuelo.todos())
+                if anillo is not None:
+                    anillo.cerrar()
                     
         except Exception as e:
             print(f"Error manejando cliente {cliente_address}: {e}")
         finally:
             cliente_socket.close()
     
+    def leer_confirmaciones(self, lector: LectorTramas, en_vuelo: MensajesEnVuelo, suscripcion: Suscripcion):
+        """
+        Aplica las confirmaciones acumulativas que el cliente envía por el
+        canal de mensajes y le devuelve el crédito correspondiente.
+        """
+        try:
+            while True:
+                tramas = lector.leer_tramas()
+                if not tramas:
+                    break
+                # Las confirmaciones son acumulativas: basta con la última de la lectura
+                confirmados = en_vuelo.confirmar(decodificar_confirmacion(tramas[-1]))
+                self.despachador.liberar(suscripcion, confirmados)
+        except OSError:
+            pass
+        finally:
+            en_vuelo.desconectado = True
+    
+    def reencolar_vencidos(self, en_vuelo: MensajesEnVuelo, suscripcion: Suscripcion) -> List[Dict]:
+        """
+        Quita los mensajes entregados hace más de timeout_confirmacion sin
+        confirmar, devuelve su crédito y los reencola.
+        
+        Returns:
+            Los mensajes reencolados
+        """
+        if not en_vuelo.reencolar:
+            return []
+        vencidos = en_vuelo.vencidos(time.monotonic() - self.timeout_confirmacion)
+        if vencidos:
+            self.despachador.liberar(suscripcion, len(vencidos))
+            self.despachador.reencolar(vencidos)
+        return vencidos
+    
+    @staticmethod
+    def cliente_desconectado(cliente_socket) -> bool:
+        """Verifica sin bloquear si el cliente cerró la conexión (no envía nada por este canal)."""
+        try:
+            return not cliente_socket.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return False
+    
+    def entregar_mensajes(self, cliente_socket, version: int, suscripcion: Suscripcion,
+                          en_vuelo: MensajesEnVuelo = None, con_tiempos: bool = False,
+                          anillo: AnilloMensajes = None):
+        """
+        Envía mensajes al cliente hasta que se desconecte o se alcance el objetivo.
+        Con un anillo de memoria compartida los mensajes se copian al anillo y
+        por el socket solo sale un aviso cuando el cliente espera.
+        """
+        limite = MAX_MENSAJES_POR_TRAMA
+        tiempos = self.tiempos
+        while self.running:
+            if anillo is not None:
+                limite = min(anillo.libres(), MAX_MENSAJES_POR_ESCRITURA_ANILLO)
+                if not limite:
+                    # Anillo lleno: el cliente va atrasado, no tomar más mensajes de las colas
+                    time.sleep(ESPERA_ANILLO_LLENO)
+                    if en_vuelo is not None:
+                        desconectado = en_vuelo.desconectado
+                    else:
+                        desconectado = self.cliente_desconectado(cliente_socket)
+                    if desconectado:
+                        break
+                    continue
+            inicio = time.perf_counter_ns()
+            mensajes = self.despachador.obtener(suscripcion, limite, INTERVALO_VERIFICACION)
+            inicio = tiempos.sumar('obtener_colas', inicio)
+            if en_vuelo is not None:
+                if mensajes:
+                    en_vuelo.registrar(mensajes, time.monotonic())
+                if en_vuelo.desconectado:
+                    break
+                self.reencolar_vencidos(en_vuelo, suscripcion)
+            if mensajes:
+                if anillo is not None:
+                    if anillo.escribir(mensajes, time.monotonic_ns(), self.topicos.codigos):
+                        cliente_socket.sendall(AVISO)
+                    tiempos.sumar('escritura_anillo', inicio)
+                    continue
+                # Serializar y enviar en el formato negociado
+                cuerpos = self.serializar_mensajes(version, mensajes, con_tiempos)
+                inicio = tiempos.sumar('serializacion', inicio)
+                enviar_tramas(cliente_socket, cuerpos)
+                tiempos.sumar('envio', inicio)
+                continue
+            if en_vuelo is not None:
+                continue  # la desconexión la detecta el hilo de confirmaciones
+            
+            # Sin mensajes: verificar sin bloquear si el cliente sigue conectado
+            if self.cliente_desconectado(cliente_socket):
+                break
+    
     def manejar_resultados(self, cliente_socket, cliente_address):
         """
-        Maneja la recepción de resultados de los clientes.
+        Maneja el canal persistente de resultados de un cliente.
+        Cada trama contiene un lote de resultados; un único hilo lee todas
+        las tramas de la conexión hasta que el cliente la cierra.
         """
+        conexion = self.nueva_conexion_resultados()
+        lector = LectorTramas(cliente_socket)
         try:
             while self.running:
-                # Recibir tamaño
-                tamaño_data = cliente_socket.recv(4)
-                if len(tamaño_data) < 4:
+                # Todas las tramas completas de una misma lectura del socket
+                tramas = lector.leer_tramas()
+                if not tramas:
                     break
-                
-                tamaño = struct.unpack('!I', tamaño_data)[0]
-                
-                # Recibir datos
-                datos = b''
-                while len(datos) < tamaño:
-                    chunk = cliente_socket.recv(tamaño - len(datos))
-                    if not chunk:
-                        return
-                    datos += chunk
-                
-                resultado_data = pickle.loads(datos)
-                cliente_id = resultado_data['cliente_id']
-                resultado = resultado_data['resultado']
-                colas_suscritas = resultado_data['colas_suscritas']
-                
-                self.procesar_resultado(cliente_id, resultado, colas_suscritas)
+                for datos in tramas:
+                    self.procesar_trama_resultados(conexion, datos)
                 
         except Exception as e:
             print(f"Error recibiendo resultado de {cliente_address}: {e}")
@@ -261,8 +627,10 @@ class PublisherServer:
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reutilizar_puerto:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             sock.bind((self.host, self.port))
-            sock.listen(10)
+            sock.listen(BACKLOG_CONEXIONES)
             sock.settimeout(1.0)
             
             print(f"Servidor de mensajes escuchando en {self.host}:{self.port}")
@@ -284,11 +652,8 @@ class PublisherServer:
             while self.running:
                 try:
                     cliente_socket, cliente_address = sock.accept()
-                    thread = threading.Thread(
-                        target=self.manejar_cliente_mensajes,
-                        args=(cliente_socket, cliente_address),
-                        daemon=True
-                    )
+                    thread = crear_hilo(self.perfilador, self.manejar_cliente_mensajes, 'entrega',
+                                        (cliente_socket, cliente_address))
                     thread.start()
                 except socket.timeout:
                     continue
@@ -305,8 +670,10 @@ class PublisherServer:
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reutilizar_puerto:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             sock.bind((self.host, self.port + 1))
-            sock.listen(10)
+            sock.listen(BACKLOG_CONEXIONES)
             sock.settimeout(1.0)
             
             print(f"Servidor de resultados escuchando en {self.host}:{self.port + 1}")
@@ -328,11 +695,8 @@ class PublisherServer:
             while self.running:
                 try:
                     cliente_socket, cliente_address = sock.accept()
-                    thread = threading.Thread(
-                        target=self.manejar_resultados,
-                        args=(cliente_socket, cliente_address),
-                        daemon=True
-                    )
+                    thread = crear_hilo(self.perfilador, self.manejar_resultados, 'resultados',
+                                        (cliente_socket, cliente_address))
                     thread.start()
                 except socket.timeout:
                     continue
@@ -343,56 +707,202 @@ class PublisherServer:
             if sock:
                 sock.close()
     
+    def detener(self):
+        """Detiene el servidor desde otro hilo (p. ej., a pedido del coordinador)."""
+        self.running = False
+        self.despachador.cerrar()
+    
+    def estado_final(self) -> Dict:
+        """
+        Estado necesario para el reporte final: resultados agregados y estado
+        de las colas. Se puede serializar con pickle para combinarlo con el de
+        otros procesos.
+        """
+        despachador = self.despachador
+        return {
+            'agregador': self.agregador.combinar(),
+            'colas': list(self.topicos.nombres),
+            'capacidad': despachador.capacidad,
+            'politica_desborde': despachador.politica_desborde,
+            'pendientes': {cola: despachador.pendientes(cola) for cola in self.topicos.nombres},
+            'descartados': dict(despachador.descartados),
+            'reencolados': dict(despachador.reencolados),
+            'expirados': dict(despachador.expirados),
+            'ttl': dict(despachador.ttl),
+            'prioridades': dict(despachador.prioridades),
+            'tiempo_bloqueo': despachador.tiempo_bloqueo,
+            'tiempos': self.tiempos.resumen(),
+            'lock_colas': (despachador.lock.adquisiciones, despachador.lock.contenciones,
+                           despachador.lock.tiempo_espera, despachador.lock.tiempo_retencion),
+            'utilizacion': despachador.utilizacion_clientes(),
+        }
+    
     def generar_reporte_final(self):
         """Genera y muestra el reporte final."""
-        suma_total = sum(self.resultados)
-        
-        print("\n" + "="*80)
-        print("REPORTE FINAL DEL SERVIDOR PUBLISHER")
-        print("="*80)
-        print(f"\nTotal de resultados recibidos: {len(self.resultados):,}")
-        print(f"Suma total de resultados: {suma_total:,}")
-        print(f"\nNúmero de clientes únicos: {len(self.registro_clientes)}")
-        print("\nClientes y sus suscripciones:")
-        print("-"*80)
-        
-        for cliente_id in sorted(self.registro_clientes.keys()):
-            colas = self.suscripciones_clientes[cliente_id]
-            resultados_cliente = len(self.registro_clientes[cliente_id])
-            print(f"Cliente {cliente_id}:")
-            print(f"  - Colas suscritas: {', '.join(sorted(colas))}")
-            print(f"  - Resultados procesados: {resultados_cliente:,}")
-        
-        print("="*80)
+        imprimir_reporte_final(self.estado_final())
     
-    def iniciar(self):
-        """Inicia todos los servicios del servidor."""
+    def iniciar_metricas(self):
+        """Abre el endpoint de métricas en vivo, si se configuró una dirección."""
+        if self.direccion_metricas is None:
+            return
+        from metricas import ExportadorMetricas
+        self.exportador_metricas = ExportadorMetricas(self, self.direccion_metricas)
+        self.exportador_metricas.iniciar()
+    
+    def cerrar_metricas(self):
+        if self.exportador_metricas is not None:
+            self.exportador_metricas.cerrar()
+            self.exportador_metricas = None
+    
+    def servir(self):
+        """Atiende clientes hasta alcanzar el objetivo o hasta que se detenga el servidor."""
+        self.iniciar_metricas()
+        
         # Hilo de generación y publicación
-        generador_thread = threading.Thread(target=self.generar_y_publicar, daemon=True)
+        generador_thread = crear_hilo(self.perfilador, self.generar_y_publicar, 'generacion')
         generador_thread.start()
         
         # Hilo del servidor de mensajes
-        mensajes_thread = threading.Thread(target=self.servidor_mensajes, daemon=True)
+        mensajes_thread = crear_hilo(self.perfilador, self.servidor_mensajes, 'aceptacion')
         mensajes_thread.start()
         
         # Hilo del servidor de resultados
-        resultados_thread = threading.Thread(target=self.servidor_resultados, daemon=True)
+        resultados_thread = crear_hilo(self.perfilador, self.servidor_resultados, 'aceptacion')
         resultados_thread.start()
         
         # Esperar hasta alcanzar el objetivo
-        while self.running:
-            time.sleep(1)
-        
-        # Esperar a que terminen los hilos
-        generador_thread.join(timeout=2)
-        mensajes_thread.join(timeout=2)
-        resultados_thread.join(timeout=2)
+        try:
+            while self.running:
+                time.sleep(1)
+                self.reportar_progreso()
+                self.comprobar_fin_reproduccion()
+        finally:
+            # Esperar a que terminen los hilos; el registro en disco se cierra también con Ctrl+C
+            self.despachador.cerrar()
+            generador_thread.join(timeout=2)
+            mensajes_thread.join(timeout=2)
+            resultados_thread.join(timeout=2)
+            self.despachador.cerrar_persistencia()
+            self.cerrar_grabacion()
+            self.cerrar_metricas()
         
-        # Generar reporte final
         time.sleep(2)  # Dar tiempo para que lleguen los últimos resultados
+    
+    def guardar_perfiles(self):
+        """Escribe los perfiles de cProfile de los hilos que terminaron (con --perfilar)."""
+        if self.perfilador is not None:
+            self.perfilador.guardar()
+    
+    def iniciar(self):
+        """Inicia todos los servicios del servidor y genera el reporte final."""
+        try:
+            self.servir()
+        except KeyboardInterrupt:
+            # Detener los hilos para que sus perfiles terminen antes de guardarlos
+            self.detener()
+            raise
+        finally:
+            self.guardar_perfiles()
         self.generar_reporte_final()
 
 
+def imprimir_latencias(latencias, sangria: str):
+    """Muestra p50/p90/p99/p99.9/máx de cada etapa de latencia."""
+    for etapa, resumen in latencias.lineas():
+        print(f"{sangria}{etapa + ':':<15}{resumen}")
+
+
+def imprimir_reporte_final(estado: Dict):
+    """Muestra el reporte final a partir de `PublisherServer.estado_final()` (o de varios combinados)."""
+    agregador = estado['agregador']
+    
+    print("\n" + "="*80)
+    print("REPORTE FINAL DEL SERVIDOR PUBLISHER")
+    print("="*80)
+    print(f"\nTotal de resultados recibidos: {agregador.total.cantidad:,}")
+    print(f"Suma total de resultados: {agregador.total.suma:,}")
+    print(f"Distribución: {agregador.total.resumen()}")
+    if agregador.registros_agregados:
+        print(f"Resultados recibidos como agregados: {agregador.resultados_agregados:,} "
+              f"en {agregador.registros_agregados:,} registros")
+    if agregador.almacen is not None:
+        print(f"Resultados conservados: {len(agregador.almacen):,}")
+    latencias = agregador.latencias_totales()
+    if latencias.cantidad:
+        print(f"\nLatencias de {latencias.cantidad:,} resultados con tiempos:")
+        imprimir_latencias(latencias, "  ")
+    print(f"\nNúmero de clientes únicos: {len(agregador.por_cliente)}")
+    print("\nClientes y sus suscripciones:")
+    print("-"*80)
+    
+    for cliente_id in sorted(agregador.por_cliente.keys()):
+        colas = agregador.suscripciones[cliente_id]
+        estadisticas = agregador.por_cliente[cliente_id]
+        print(f"Cliente {cliente_id}:")
+        print(f"  - Colas suscritas: {', '.join(sorted(colas))}")
+        print(f"  - Resultados procesados: {estadisticas.cantidad:,}")
+        print(f"  - Distribución: {estadisticas.resumen()}")
+        if cliente_id in agregador.latencias_por_cliente:
+            print("  - Latencias:")
+            imprimir_latencias(agregador.latencias_por_cliente[cliente_id], "      ")
+    
+    if agregador.por_cola:
+        print("\nResultados por cola:")
+        print("-"*80)
+        for cola in sorted(agregador.por_cola):
+            estadisticas = agregador.por_cola[cola]
+            print(f"Cola {cola}: {estadisticas.cantidad:,} resultados, suma {estadisticas.suma:,}, "
+                  f"{estadisticas.resumen()}")
+            for linea in estadisticas.lineas_histograma():
+                print(f"  {linea}")
+            if cola in agregador.latencias_por_cola:
+                imprimir_latencias(agregador.latencias_por_cola[cola], "  ")
+    
+    print("\nColas (capacidad {:,}, desborde: {}):".format(
+        estado['capacidad'], estado['politica_desborde']))
+    print("-"*80)
+    for cola in estado['colas']:
+        configuracion = []
+        if cola in estado['ttl']:
+            configuracion.append(f"TTL {estado['ttl'][cola]:g} s")
+        if cola in estado['prioridades']:
+            configuracion.append(f"{estado['prioridades'][cola]} prioridades")
+        print(f"Cola {cola}{' (' + ', '.join(configuracion) + ')' if configuracion else ''}: "
+              f"{estado['pendientes'][cola]:,} pendientes, "
+              f"{estado['descartados'][cola]:,} descartados, {estado['expirados'][cola]:,} expirados, "
+              f"{estado['reencolados'][cola]:,} reencolados")
+    print(f"Tiempo detenido del productor: {estado['tiempo_bloqueo']:.2f} s")
+    
+    print("\nTiempos por etapa (suma de todos los hilos; obtener_colas y envio incluyen las esperas):")
+    print("-"*80)
+    for linea in lineas_tiempos(estado['tiempos']):
+        print(linea)
+    adquisiciones, contenciones, espera, retencion = estado['lock_colas']
+    print(f"Lock de las colas: {adquisiciones:,} adquisiciones, {contenciones:,} con contención, "
+          f"espera {espera:.3f} s, retenido {retencion:.3f} s")
+    
+    utilizacion = estado.get('utilizacion', {})
+    if any(datos['ventana'] for datos in utilizacion.values()):
+        print("\nUtilización de los clientes con ventana de crédito:")
+        print("-"*80)
+        for cliente_id in sorted(utilizacion):
+            datos = utilizacion[cliente_id]
+            if not datos['ventana'] or not datos['segundos']:
+                continue
+            print(f"Cliente {cliente_id}: {datos['entregados']:,} entregados, ventana {datos['ventana']:,}, "
+                  f"ocupado {datos['ocupado'] / datos['segundos']:.0%}, "
+                  f"ventana llena {datos['lleno'] / datos['segundos']:.0%}, "
+                  f"en vuelo medio {datos['area'] / datos['segundos']:,.1f}")
+    
+    if 'trabajadores' in estado:
+        print(f"\nProcesos trabajadores: {len(estado['trabajadores'])}")
+        print("-"*80)
+        for indice, (resultados, clientes) in enumerate(estado['trabajadores']):
+            print(f"Trabajador {indice}: {resultados:,} resultados de {clientes} clientes")
+    
+    print("="*80)
+
+
 def main():
     """Función principal del servidor."""
     parser = argparse.ArgumentParser(description='Servidor Publisher')
@@ -405,10 +915,165 @@ def main():
     )
     parser.add_argument('--host', type=str, default=SERVER_HOST, help='Dirección del servidor')
     parser.add_argument('--port', type=int, default=SERVER_PORT, help='Puerto del servidor')
+    parser.add_argument(
+        '--politica-despacho',
+        type=str,
+        choices=POLITICAS_DESPACHO,
+        default=POLITICA_ALEATORIA,
+        help='Equidad entre las colas de un cliente suscrito a varias (round_robin, ponderada, aleatoria)'
+    )
+    parser.add_argument(
+        '--pesos-despacho',
+        type=str,
+        default='',
+        help='Pesos para la política ponderada, p. ej. principal=5,secundaria=3,terciaria=2'
+    )
+    parser.add_argument('--capacidad-cola', type=int, default=CAPACIDAD_COLA,
+                        help='Máximo de mensajes en espera por cola')
+    parser.add_argument(
+        '--politica-desborde',
+        type=str,
+        choices=POLITICAS_DESBORDE,
+        default=DESBORDE_BLOQUEAR,
+        help='Qué hacer cuando una cola está llena (bloquear, descartar_antiguo, descartar_nuevo)'
+    )
+    parser.add_argument('--ttl', type=float, default=None, metavar='SEGUNDOS',
+                        help='Tiempo de vida de los mensajes en las colas sin TTL en el registro de tópicos; '
+                             'los expirados se descartan al desencolarlos')
+    parser.add_argument('--ttl-colas', type=str, default='', metavar='COLA=SEGUNDOS,...',
+                        help='Tiempo de vida por cola, por ejemplo principal=0.5,terciaria=2')
+    parser.add_argument('--objetivo', type=int, default=OBJETIVO_RESULTADOS,
+                        help='Resultados a recibir antes de detener el servidor')
+    parser.add_argument('--histograma', action='store_true',
+                        help='Mantener un histograma de resultados por cliente y por cola')
+    parser.add_argument('--guardar-resultados', action='store_true',
+                        help='Conservar cada resultado en un arreglo compacto (8 bytes por resultado)')
+    parser.add_argument(
+        '--engine',
+        type=str,
+        choices=[MOTOR_HILOS, MOTOR_ASYNCIO],
+        default=MOTOR_HILOS,
+        help='Motor de E/S: un hilo por conexión (hilos) o un único event loop (asyncio)'
+    )
+    parser.add_argument('--persistencia', type=str, default=None, metavar='DIRECTORIO',
+                        help='Registrar las colas en disco y recuperar los mensajes pendientes al reiniciar')
+    parser.add_argument('--intervalo-fsync', type=float, default=INTERVALO_FSYNC,
+                        help='Segundos entre confirmaciones en disco del registro de colas')
+    parser.add_argument(
+        '--entrega',
+        type=str,
+        choices=[ENTREGA_SIN_CONFIRMACION, ENTREGA_AL_MENOS_UNA_VEZ],
+        default=ENTREGA_SIN_CONFIRMACION,
+        help='Garantía de entrega: sin_confirmacion o al_menos_una_vez (reentrega lo no confirmado)'
+    )
+    parser.add_argument('--timeout-confirmacion', type=float, default=TIMEOUT_CONFIRMACION,
+                        help='Segundos antes de reencolar un mensaje entregado sin confirmar')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Procesos trabajadores que comparten los puertos (SO_REUSEPORT)')
+    parser.add_argument('--topicos', type=str, default=None, metavar='ARCHIVO',
+                        help='Registro de tópicos (JSON o TOML): colas, pesos y reglas condicionales')
+    parser.add_argument('--semilla', type=int, default=None,
+                        help='Semilla del generador de mensajes (misma semilla, misma carga)')
+    parser.add_argument('--metricas', type=str, default=None, metavar='DIRECCION',
+                        help='Endpoint de métricas en formato Prometheus: PUERTO, HOST:PUERTO o ruta '
+                             'de un socket Unix (con --workers, un puerto o ruta por trabajador)')
+    parser.add_argument('--perfilar', type=str, nargs='?', const=DIRECTORIO_PERFILES, default=None,
+                        metavar='DIRECTORIO',
+                        help='Perfilar cada hilo con cProfile y guardar un .prof por rol al terminar '
+                             f'(por defecto en {DIRECTORIO_PERFILES}/)')
+    parser.add_argument('--grabar', type=str, default=None, metavar='ARCHIVO',
+                        help='Grabar cada mensaje generado (id, cola, números, timestamp) en un registro binario')
+    parser.add_argument('--reproducir', type=str, default=None, metavar='ARCHIVO',
+                        help='Alimentar las colas con una grabación en lugar de generar mensajes')
+    parser.add_argument('--ritmo', type=str, choices=RITMOS, default=RITMO_MAXIMO,
+                        help='Ritmo de la reproducción: maximo (sin esperas) u original (el grabado)')
     
     args = parser.parse_args()
     
-    server = PublisherServer(args.criterio, args.host, args.port)
+    try:
+        topicos = cargar_registro(args.topicos)
+    except (OSError, ValueError) as e:
+        parser.error(f"No se pudo cargar el registro de tópicos: {e}")
+    
+    if args.grabar and args.reproducir:
+        parser.error("--grabar y --reproducir no se pueden combinar")
+    if args.grabar and args.workers > 1:
+        parser.error("--grabar requiere un único proceso (sin --workers)")
+    if args.reproducir and topicos.prioridades:
+        parser.error("--reproducir no admite colas con prioridades (la grabación no guarda el nivel de cada mensaje)")
+    if args.reproducir:
+        try:
+            _, colas_grabadas, mensajes_grabados = describir_grabacion(args.reproducir)
+        except (OSError, ValueError) as e:
+            parser.error(f"No se pudo abrir la grabación: {e}")
+        desconocidas = [cola for cola in colas_grabadas if cola not in topicos.codigos]
+        if desconocidas:
+            parser.error(f"La grabación usa colas que no están en el registro de tópicos: {', '.join(desconocidas)}")
+        if mensajes_grabados == 0:
+            parser.error(f"La grabación {args.reproducir} no tiene mensajes")
+        if args.objetivo > mensajes_grabados:
+            # Cada mensaje produce un resultado: con más objetivo el servidor no terminaría nunca
+            print(f"Objetivo reducido a {mensajes_grabados:,} resultados (los mensajes de la grabación)")
+            args.objetivo = mensajes_grabados
+    
+    pesos_despacho = {}
+    for par in filter(None, args.pesos_despacho.split(',')):
+        cola, _, peso = par.partition('=')
+        if cola not in topicos.codigos:
+            parser.error(f"Cola desconocida en --pesos-despacho: {cola}")
+        try:
+            pesos_despacho[cola] = float(peso)
+        except ValueError:
+            parser.error(f"Peso inválido para {cola} en --pesos-despacho: '{peso}'")
+        if pesos_despacho[cola] <= 0:
+            parser.error(f"El peso de {cola} en --pesos-despacho debe ser positivo")
+    
+    if args.ttl is not None and args.ttl <= 0:
+        parser.error("--ttl debe ser positivo")
+    ttl_colas = {}
+    for par in filter(None, args.ttl_colas.split(',')):
+        cola, _, segundos = par.partition('=')
+        if cola not in topicos.codigos:
+            parser.error(f"Cola desconocida en --ttl-colas: {cola}")
+        try:
+            ttl_colas[cola] = float(segundos)
+        except ValueError:
+            parser.error(f"TTL inválido para {cola} en --ttl-colas: '{segundos}'")
+        if ttl_colas[cola] <= 0:
+            parser.error(f"El TTL de {cola} debe ser positivo")
+    if topicos.prioridades and args.persistencia:
+        parser.error("--persistencia no admite colas con prioridades (el registro en disco es FIFO)")
+    
+    opciones = dict(
+        politica_despacho=args.politica_despacho,
+        pesos_despacho=pesos_despacho,
+        capacidad_cola=args.capacidad_cola,
+        politica_desborde=args.politica_desborde,
+        objetivo=args.objetivo,
+        con_histograma=args.histograma,
+        guardar_resultados=args.guardar_resultados,
+        directorio_persistencia=args.persistencia,
+        intervalo_fsync=args.intervalo_fsync,
+        entrega=args.entrega,
+        timeout_confirmacion=args.timeout_confirmacion,
+        direccion_metricas=args.metricas,
+        semilla=args.semilla,
+        topicos=topicos,
+        grabar=args.grabar,
+        reproducir=args.reproducir,
+        ritmo=args.ritmo,
+        ttl=args.ttl,
+        ttl_colas=ttl_colas,
+        perfilar=args.perfilar,
+    )
+    if args.workers > 1:
+        from trabajadores import CoordinadorTrabajadores
+        server = CoordinadorTrabajadores(args.workers, args.engine, args.criterio, args.host, args.port, opciones)
+    elif args.engine == MOTOR_ASYNCIO:
+        from servidor_asyncio import PublisherServerAsyncio
+        server = PublisherServerAsyncio(args.criterio, args.host, args.port, **opciones)
+    else:
+        server = PublisherServer(args.criterio, args.host, args.port, **opciones)
     
     print("Servidor iniciado. Presiona Ctrl+C para detener.")
     
@@ -416,7 +1081,7 @@ def main():
         server.iniciar()
     except KeyboardInterrupt:
         print("\nDeteniendo servidor...")
-        server.running = False
+        server.detener()
         server.generar_reporte_final()
 
 
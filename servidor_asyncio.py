@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Motor asyncio del Servidor Publisher - Modelo Publisher-Subscriber
+Atiende suscripciones, entrega de mensajes y recepción de resultados como
+corrutinas sobre un único event loop, sin un hilo por conexión ni esperas
+con timeout fijo.
+"""
+
+import asyncio
+import socket
+import time
+
+from despachador import Suscripcion, MensajesEnVuelo
+from memoria_compartida import AnilloMensajes, AVISO, cliente_local
+from protocolo import CABECERA, OPCION_LATENCIAS, partes_tramas, codificar_aceptacion, decodificar_confirmacion
+from server_integrated import (
+    PublisherServer, MAX_MENSAJES_POR_TRAMA, MAX_MENSAJES_POR_ESCRITURA_ANILLO, TAMAÑO_LOTE_GENERACION,
+    INTERVALO_VERIFICACION, ESPERA_ANILLO_LLENO, BACKLOG_CONEXIONES,
+)
+
+
+class PublisherServerAsyncio(PublisherServer):
+    """
+    Servidor Publisher con E/S dirigida por eventos (asyncio).
+    Reutiliza la generación, la selección de cola y la agregación de
+    resultados de PublisherServer.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.evento_demanda = None  # se activa cuando un consumidor libera espacio
+        self.evento_fin = None
+        self.loop = None
+
+    async def leer_trama(self, reader: asyncio.StreamReader) -> bytes:
+        """Lee una trama completa (cabecera de tamaño + cuerpo)."""
+        tamaño = CABECERA.unpack(await reader.readexactly(CABECERA.size))[0]
+        return await reader.readexactly(tamaño)
+
+    async def esperar_demanda(self, hay_demanda):
+        """Suspende al generador hasta que `hay_demanda()` se cumpla, midiendo el tiempo detenido."""
+        inicio = time.perf_counter()
+        while self.running and not hay_demanda():
+            self.evento_demanda.clear()
+            await self.evento_demanda.wait()
+        self.despachador.tiempo_bloqueo += time.perf_counter() - inicio
+
+    async def generar_y_publicar_async(self):
+        """
+        Genera mensajes por lotes al ritmo de los consumidores. Publicar
+        despierta solo a los suscriptores que esperan en las colas que
+        recibieron mensajes (el despachador los elige por crédito libre).
+        Nunca bloquea el event loop: una cola llena con política bloquear
+        suspende la corrutina hasta que haya espacio.
+        """
+        despachador = self.despachador
+        mensaje_id = self.primer_mensaje_id
+        while self.running:
+            if not despachador.hay_demanda():
+                await self.esperar_demanda(despachador.hay_demanda)
+                continue
+            demora = self.demora_reproduccion()
+            if demora is None:
+                break
+            if demora > 0:
+                await asyncio.sleep(demora)
+                continue
+
+            inicio = time.perf_counter_ns()
+            lote = self.generar_lote(mensaje_id)
+            inicio = self.tiempos.sumar('generacion', inicio)
+            for cola, mensajes in lote.items():
+                while mensajes and self.running:
+                    aceptados = despachador.publicar_lote(cola, mensajes, bloquear=False)
+                    mensajes = mensajes[aceptados:]
+                    if mensajes:
+                        # publicar_lote ya despertó a los suscriptores en espera de esta cola
+                        await self.esperar_demanda(
+                            lambda: despachador.pendientes(cola) < despachador.capacidad
+                            or despachador.consumidores[cola] == 0
+                        )
+            self.tiempos.sumar('publicacion', inicio)
+            mensaje_id += TAMAÑO_LOTE_GENERACION
+            await asyncio.sleep(0)
+
+    async def leer_confirmaciones(self, reader: asyncio.StreamReader, en_vuelo: MensajesEnVuelo,
+                                  suscripcion: Suscripcion, credito: asyncio.Event):
+        """
+        Aplica las confirmaciones acumulativas del cliente hasta que cierre la
+        conexión, devolviéndole el crédito y despertando su entrega.
+        """
+        try:
+            while True:
+                confirmados = en_vuelo.confirmar(decodificar_confirmacion(await self.leer_trama(reader)))
+                if confirmados:
+                    self.despachador.liberar(suscripcion, confirmados)
+                    credito.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def entregar_mensajes(self, writer: asyncio.StreamWriter, version: int, suscripcion: Suscripcion,
+                                en_vuelo: MensajesEnVuelo = None, credito: asyncio.Event = None,
+                                con_tiempos: bool = False, anillo: AnilloMensajes = None):
+        """
+        Envía mensajes al cliente en cuanto alguna de sus colas tiene datos.
+        Sin crédito, espera a que el cliente confirme (evento `credito`).
+        Con un anillo de memoria compartida escribe en él y solo avisa por el
+        socket si el cliente espera.
+        """
+        limite = MAX_MENSAJES_POR_TRAMA
+        tiempos = self.tiempos
+        while self.running:
+            if en_vuelo is not None:
+                # Devuelve el crédito de los vencidos y los reencola (despertando a quien los espere)
+                self.reencolar_vencidos(en_vuelo, suscripcion)
+            if credito is not None and suscripcion.credito() == 0:
+                credito.clear()
+                try:
+                    await asyncio.wait_for(credito.wait(), INTERVALO_VERIFICACION)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if anillo is not None:
+                limite = min(anillo.libres(), MAX_MENSAJES_POR_ESCRITURA_ANILLO)
+                if not limite:
+                    # Anillo lleno: el cliente va atrasado, no tomar más mensajes de las colas
+                    await asyncio.sleep(ESPERA_ANILLO_LLENO)
+                    continue
+            inicio = time.perf_counter_ns()
+            mensajes = self.despachador.tomar(suscripcion, limite)
+            inicio = tiempos.sumar('obtener_colas', inicio)
+            if suscripcion.liberados:
+                # También si todo lo tomado había expirado: el generador puede volver a llenar las colas
+                self.evento_demanda.set()
+            if not mensajes:
+                evento = suscripcion.evento
+                evento.clear()
+                if self.despachador.esperar_mensajes(suscripcion):
+                    try:
+                        # Con mensajes en vuelo, despertar periódicamente para reencolar los vencidos
+                        await asyncio.wait_for(evento.wait(), None if en_vuelo is None else INTERVALO_VERIFICACION)
+                    except asyncio.TimeoutError:
+                        pass
+                    finally:
+                        self.despachador.dejar_de_esperar(suscripcion)
+                continue
+
+            if en_vuelo is not None:
+                en_vuelo.registrar(mensajes, time.monotonic())
+            if anillo is not None:
+                avisar = anillo.escribir(mensajes, time.monotonic_ns(), self.topicos.codigos)
+                tiempos.sumar('escritura_anillo', inicio)
+                if avisar:
+                    writer.write(AVISO)
+                    await writer.drain()
+                else:
+                    await asyncio.sleep(0)  # ceder el loop: sin drain() la entrega no se suspendería nunca
+                continue
+            cuerpos = self.serializar_mensajes(version, mensajes, con_tiempos)
+            inicio = tiempos.sumar('serializacion', inicio)
+            writer.writelines(partes_tramas(cuerpos))
+            await writer.drain()
+            tiempos.sumar('envio', inicio)
+
+    async def manejar_cliente_mensajes_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Maneja la suscripción y la entrega de mensajes de un cliente.
+        La desconexión se detecta por fin de flujo en el lector, sin sondeo.
+        """
+        cliente_address = writer.get_extra_info('peername')
+        tareas = []
+        anillo = None
+        try:
+            datos = await self.leer_trama(reader)
+            version, cliente_id, colas_suscritas = self.interpretar_suscripcion(datos)
+            negociadas = self.negociar_opciones(datos, version, cliente_local(writer.get_extra_info('socket')))
+            opciones, ventana = negociadas or (0, 0)
+            anillo = self.crear_anillo(opciones)
+            if negociadas is not None:
+                writer.writelines(partes_tramas([codificar_aceptacion(opciones, anillo and anillo.nombre)]))
+
+            print(f"Cliente {cliente_id} conectado desde {cliente_address}, suscrito a: "
+                  f"{', '.join(sorted(colas_suscritas))}{self.describir_transporte(anillo)}")
+
+            suscripcion, en_vuelo = self.preparar_entrega(cliente_id, colas_suscritas, opciones, ventana)
+            suscripcion.evento = asyncio.Event()
+            credito = None
+            if en_vuelo is not None:
+                # Con ventana, una trama pequeña retenida por Nagle retrasa todo el crédito del cliente
+                writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                credito = asyncio.Event()
+                lectura = self.leer_confirmaciones(reader, en_vuelo, suscripcion, credito)
+            else:
+                lectura = reader.read()
+
+            self.evento_demanda.set()
+            tareas = [
+                asyncio.create_task(self.entregar_mensajes(writer, version, suscripcion, en_vuelo, credito,
+                                                           bool(opciones & OPCION_LATENCIAS), anillo)),
+                asyncio.create_task(lectura),
+            ]
+            try:
+                await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.despachador.desuscribir(suscripcion)
+                if en_vuelo is not None and en_vuelo.reencolar:
+                    # Lo que el cliente no confirmó vuelve a la cola para otro suscriptor
+                    self.despachador.reencolar(en_vuelo.todos())
+                self.evento_demanda.set()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            print(f"Error manejando cliente {cliente_address}: {e}")
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+            if anillo is not None:
+                anillo.cerrar()
+            writer.close()
+
+    async def manejar_resultados_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Lee las tramas del canal persistente de resultados de un cliente."""
+        cliente_address = writer.get_extra_info('peername')
+        conexion = self.nueva_conexion_resultados()
+        try:
+            while self.running:
+                datos = await self.leer_trama(reader)
+                self.procesar_trama_resultados(conexion, datos)
+
+            self.evento_fin.set()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            print(f"Error recibiendo resultado de {cliente_address}: {e}")
+        finally:
+            writer.close()
+
+    async def reportar_progreso_periodicamente(self):
+        """Muestra el progreso una vez por segundo, fuera del camino de los resultados."""
+        while self.running:
+            await asyncio.sleep(1)
+            self.reportar_progreso()
+            self.comprobar_fin_reproduccion()
+
+    async def ejecutar(self):
+        """Abre ambos puertos y ejecuta el servidor hasta alcanzar el objetivo."""
+        self.evento_demanda = asyncio.Event()
+        self.evento_fin = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+
+        try:
+            servidor_mensajes = await asyncio.start_server(
+                self.manejar_cliente_mensajes_async, self.host, self.port,
+                reuse_address=True, reuse_port=self.reutilizar_puerto or None, backlog=BACKLOG_CONEXIONES
+            )
+            servidor_resultados = await asyncio.start_server(
+                self.manejar_resultados_async, self.host, self.port + 1,
+                reuse_address=True, reuse_port=self.reutilizar_puerto or None, backlog=BACKLOG_CONEXIONES
+            )
+        except OSError as e:
+            print(f"ERROR: No se pudieron abrir los puertos {self.port}/{self.port + 1}: {e}")
+            print(f"Por favor, detén el proceso anterior o usa otro puerto con --port")
+            self.running = False
+            return
+
+        print(f"Servidor de mensajes escuchando en {self.host}:{self.port} (asyncio)")
+        print(f"Servidor de resultados escuchando en {self.host}:{self.port + 1} (asyncio)")
+
+        tareas = [
+            asyncio.create_task(self.generar_y_publicar_async()),
+            asyncio.create_task(self.reportar_progreso_periodicamente()),
+        ]
+        try:
+            await self.evento_fin.wait()
+        finally:
+            self.running = False
+            self.despachador.cerrar()
+            for tarea in tareas:
+                tarea.cancel()
+            servidor_mensajes.close()
+            servidor_resultados.close()
+
+    def detener(self):
+        """Detiene el servidor desde otro hilo despertando al event loop."""
+        self.running = False
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.evento_fin.set)
+            except RuntimeError:  # el loop terminó entre la comprobación y la llamada
+                pass
+
+    def servir(self):
+        """Ejecuta el event loop hasta alcanzar el objetivo o hasta que se detenga el servidor."""
+        self.iniciar_metricas()
+        try:
+            if self.perfilador is not None:
+                # Las corrutinas comparten el hilo del loop: un solo perfil para todas
+                self.perfilador.ejecutar(asyncio.run, 'event_loop', self.ejecutar())
+            else:
+                asyncio.run(self.ejecutar())
+        finally:
+            self.despachador.cerrar_persistencia()
+            self.cerrar_grabacion()
+            self.cerrar_metricas()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks de extremo a extremo - Modelo Publisher-Subscriber
+Levanta un PublisherServer en el propio proceso y muchos SubscriberClient
+(hilos del mismo proceso, procesos aparte o ambos) y ejecuta escenarios de
+tamaño fijo (N resultados) o de duración fija para cada criterio y mezcla de
+suscripciones. Cada ejecución produce un registro JSON con mensajes/s,
+resultados/s, percentiles de latencia, CPU y memoria, para comparar commits:
+
+    python3 suite_benchmark.py --salida antes.json
+    python3 suite_benchmark.py --salida despues.json --comparar antes.json
+
+Los mensajes generados y las suscripciones salen de una semilla (--semilla),
+así que dos ejecuciones reciben la misma carga. El orden entre hilos y el
+reparto del sistema operativo no son deterministas: conviene repetir cada
+escenario (--repeticiones) y comparar medianas.
+
+Con clientes en hilos, servidor y clientes comparten el GIL y la CPU del
+proceso; con clientes en procesos, su CPU se mide aparte (cpu_hijos).
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+try:
+    import resource
+except ImportError:  # solo en sistemas Unix
+    resource = None
+
+from generador import CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL, np
+from latencias import ETAPAS, PERCENTILES
+from protocolo import COLAS
+
+CRITERIOS = (CRITERIO_ALEATORIO, CRITERIO_PONDERADO, CRITERIO_CONDICIONAL)
+
+# Mezclas de suscripciones de los clientes
+MEZCLA_TODAS = "todas"              # cada cliente suscrito a las tres colas
+MEZCLA_UNA_POR_COLA = "una_por_cola"  # una cola por cliente, repartidas por turnos
+MEZCLA_ALEATORIA = "aleatoria"      # una o dos colas al azar, como SubscriberClient
+MEZCLAS = (MEZCLA_TODAS, MEZCLA_UNA_POR_COLA, MEZCLA_ALEATORIA)
+
+# Dónde se ejecutan los clientes
+CLIENTES_HILOS = "hilos"
+CLIENTES_PROCESOS = "procesos"
+CLIENTES_MIXTO = "mixto"  # la mitad en hilos y la mitad en procesos
+
+# Objetivo del servidor en escenarios de duración fija (nunca se alcanza)
+OBJETIVO_ILIMITADO = 1 << 62
+
+VERSION_SUITE = 1
+
+
+def puerto_libre() -> int:
+    """Puerto TCP libre en localhost (y el siguiente, para resultados, casi siempre también)."""
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def suscripciones_mezcla(mezcla: str, clientes: int, rng: random.Random) -> List[Set[str]]:
+    """Colas de cada cliente según la mezcla."""
+    if mezcla == MEZCLA_TODAS:
+        return [set(COLAS) for _ in range(clientes)]
+    if mezcla == MEZCLA_UNA_POR_COLA:
+        return [{COLAS[i % len(COLAS)]} for i in range(clientes)]
+    if mezcla == MEZCLA_ALEATORIA:
+        return [{rng.choice(COLAS)} if rng.random() < 0.5 else set(rng.sample(COLAS, 2))
+                for _ in range(clientes)]
+    raise ValueError(f"Mezcla desconocida: {mezcla}")
+
+
+def ejecutar_cliente(cliente_id: str, puerto: int, colas: List[str], opciones: Dict):
+    """Punto de entrada de un cliente en un proceso aparte (salida descartada)."""
+    from client_integrated import SubscriberClient
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo), contextlib.redirect_stderr(nulo):
+        cliente = SubscriberClient(cliente_id, 'localhost', puerto, **opciones)
+        cliente.colas_suscritas = set(colas)
+        cliente.ejecutar()
+
+
+def rss_actual_kb() -> Optional[int]:
+    """Memoria residente actual del proceso en KB (None si no se puede medir)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def uso_hijos():
+    """(CPU en segundos, RSS máximo en KB) de los procesos hijos ya terminados."""
+    if resource is None:
+        return 0.0, None
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return uso.ru_utime + uso.ru_stime, uso.ru_maxrss
+
+
+def rss_maximo_kb() -> Optional[int]:
+    """Pico de memoria residente del proceso en KB desde que se inició."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def resumen_latencias(latencias) -> Dict[str, Dict[str, int]]:
+    """Percentiles y máximo (ns) de cada etapa de latencia."""
+    resumen = {}
+    for etapa in ETAPAS:
+        histograma = getattr(latencias, etapa)
+        valores = {f"p{p:g}": valor for p, valor in zip(PERCENTILES, histograma.percentiles())}
+        valores['max'] = histograma.maximo
+        resumen[etapa] = valores
+    return resumen
+
+
+def commit_actual() -> Optional[str]:
+    """Commit de git del árbol de trabajo, si lo hay."""
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+class Escenario:
+    """Un criterio, una mezcla de suscripciones y un número de clientes."""
+
+    def __init__(self, criterio: str, mezcla: str, clientes: int, modo_clientes: str, semilla: int):
+        self.criterio = criterio
+        self.mezcla = mezcla
+        self.clientes = clientes
+        self.modo_clientes = modo_clientes
+        self.semilla = semilla
+
+    @property
+    def nombre(self) -> str:
+        return f"{self.criterio}/{self.mezcla}/{self.clientes} {self.modo_clientes}"
+
+    def ejecutar(self, args, repeticion: int) -> Dict:
+        """Ejecuta el escenario una vez y devuelve su registro de resultados."""
+        from trabajadores import crear_servidor
+
+        # La misma semilla en cada repetición: misma carga y mismas suscripciones
+        random.seed(self.semilla)
+        rng = random.Random(self.semilla)
+        suscripciones = suscripciones_mezcla(self.mezcla, self.clientes, rng)
+        en_procesos = {
+            CLIENTES_HILOS: 0, CLIENTES_PROCESOS: self.clientes, CLIENTES_MIXTO: self.clientes // 2,
+        }[self.modo_clientes]
+        opciones_cliente = {'ventana': args.ventana}
+
+        puerto = puerto_libre()
+        objetivo = OBJETIVO_ILIMITADO if args.duracion else args.objetivo
+        contexto = multiprocessing.get_context('spawn')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = crear_servidor(args.engine, self.criterio, 'localhost', puerto,
+                                    {'objetivo': objetivo, 'semilla': self.semilla})
+            server.mostrar_progreso = False
+            hilo_servidor = threading.Thread(target=server.servir, daemon=True)
+            hilo_servidor.start()
+            time.sleep(0.3)
+
+            procesos = [
+                contexto.Process(target=ejecutar_cliente, daemon=True,
+                                 args=(f"suite-{i}", puerto, sorted(suscripciones[i]), opciones_cliente))
+                for i in range(en_procesos)
+            ]
+            from client_integrated import SubscriberClient
+            clientes = []
+            for i in range(en_procesos, self.clientes):
+                cliente = SubscriberClient(f"suite-{i}", 'localhost', puerto, **opciones_cliente)
+                cliente.colas_suscritas = suscripciones[i]
+                clientes.append(cliente)
+            hilos = [threading.Thread(target=cliente.ejecutar, daemon=True) for cliente in clientes]
+
+            cpu_hijos_inicio, _ = uso_hijos()
+            inicio = time.perf_counter()
+            cpu_inicio = time.process_time()
+            for proceso in procesos:
+                proceso.start()
+            for hilo in hilos:
+                hilo.start()
+
+            limite = inicio + args.duracion if args.duracion else None
+            while (server.running and server.total_resultados < objetivo
+                   and (limite is None or time.perf_counter() < limite)
+                   and (any(h.is_alive() for h in hilos) or any(p.is_alive() for p in procesos))):
+                time.sleep(0.01)
+
+            segundos = time.perf_counter() - inicio
+            cpu = time.process_time() - cpu_inicio
+            resultados = server.total_resultados
+            mensajes = sum(server.despachador.metricas()['desencolados'].values())
+            rss = rss_actual_kb()
+
+            server.detener()
+            hilo_servidor.join(10)
+            for hilo in hilos:
+                hilo.join(5)
+            for proceso in procesos:
+                proceso.join(5)
+                if proceso.is_alive():
+                    proceso.terminate()
+                    proceso.join()
+            cpu_hijos, rss_hijos = uso_hijos()
+            latencias = server.agregador.combinar().latencias_totales()
+
+        return {
+            'escenario': self.nombre,
+            'criterio': self.criterio,
+            'mezcla': self.mezcla,
+            'clientes': self.clientes,
+            'clientes_en_procesos': en_procesos,
+            'suscripciones': [sorted(colas) for colas in suscripciones],
+            'engine': args.engine,
+            'semilla': self.semilla,
+            'repeticion': repeticion,
+            'segundos': segundos,
+            'resultados': resultados,
+            'mensajes': mensajes,
+            'resultados_por_segundo': resultados / segundos,
+            'mensajes_por_segundo': mensajes / segundos,
+            'latencias_ns': resumen_latencias(latencias) if latencias.cantidad else None,
+            'cpu_segundos': cpu,
+            'cpu_hijos_segundos': cpu_hijos - cpu_hijos_inicio,
+            'rss_kb': rss,
+            'rss_max_kb': rss_maximo_kb(),
+            'rss_max_hijos_kb': rss_hijos if en_procesos else None,
+        }
+
+
+def crear_escenarios(args) -> List[Escenario]:
+    """Un escenario por cada combinación de criterio y mezcla, con semillas derivadas de --semilla."""
+    return [
+        Escenario(criterio, mezcla, args.clientes, args.modo_clientes, args.semilla + indice)
+        for indice, (criterio, mezcla) in enumerate(itertools.product(args.criterios, args.mezclas))
+    ]
+
+
+def medianas(ejecuciones: List[Dict]) -> Dict[str, Dict]:
+    """Mediana de resultados/s, mensajes/s y latencia total p99 de cada escenario."""
+    por_escenario: Dict[str, List[Dict]] = {}
+    for ejecucion in ejecuciones:
+        por_escenario.setdefault(ejecucion['escenario'], []).append(ejecucion)
+    tabla = {}
+    for nombre, registros in por_escenario.items():
+        p99 = [r['latencias_ns']['total']['p99'] for r in registros if r['latencias_ns']]
+        tabla[nombre] = {
+            'resultados_por_segundo': statistics.median(r['resultados_por_segundo'] for r in registros),
+            'mensajes_por_segundo': statistics.median(r['mensajes_por_segundo'] for r in registros),
+            'p99_total_ns': statistics.median(p99) if p99 else None,
+        }
+    return tabla
+
+
+def imprimir_tabla(tabla: Dict[str, Dict], anterior: Optional[Dict[str, Dict]] = None):
+    """Resumen legible de las medianas, con la variación respecto a una ejecución anterior."""
+    print(f"{'Escenario':<40}{'resultados/s':>14}{'mensajes/s':>14}{'p99 total':>12}"
+          + (f"{'vs. anterior':>14}" if anterior else ""))
+    print("-" * (80 + (14 if anterior else 0)))
+    for nombre, fila in tabla.items():
+        p99 = f"{fila['p99_total_ns'] / 1e6:.1f} ms" if fila['p99_total_ns'] is not None else "-"
+        linea = f"{nombre:<40}{fila['resultados_por_segundo']:>14,.0f}{fila['mensajes_por_segundo']:>14,.0f}{p99:>12}"
+        if anterior:
+            previo = anterior.get(nombre)
+            if previo and previo['resultados_por_segundo']:
+                cambio = fila['resultados_por_segundo'] / previo['resultados_por_segundo'] - 1
+                linea += f"{cambio:>+14.1%}"
+            else:
+                linea += f"{'-':>14}"
+        print(linea)
+
+
+def main():
+    """Función principal de la suite."""
+    parser = argparse.ArgumentParser(description='Suite de benchmarks de extremo a extremo')
+    parser.add_argument('--criterios', type=str, default=','.join(CRITERIOS),
+                        help='Criterios a medir, separados por comas')
+    parser.add_argument('--mezclas', type=str, default=','.join(MEZCLAS),
+                        help='Mezclas de suscripciones (todas, una_por_cola, aleatoria), separadas por comas')
+    parser.add_argument('--clientes', type=int, default=4, help='Clientes por escenario')
+    parser.add_argument('--modo-clientes', type=str, choices=[CLIENTES_HILOS, CLIENTES_PROCESOS, CLIENTES_MIXTO],
+                        default=CLIENTES_HILOS, help='Clientes en hilos, en procesos o la mitad en cada uno')
+    parser.add_argument('--engine', type=str, choices=['hilos', 'asyncio'], default='hilos',
+                        help='Motor de E/S del servidor')
+    parser.add_argument('--objetivo', type=int, default=200_000, help='Resultados por ejecución (tamaño fijo)')
+    parser.add_argument('--duracion', type=float, default=None,
+                        help='Segundos por ejecución (duración fija; ignora --objetivo)')
+    parser.add_argument('--repeticiones', type=int, default=1, help='Ejecuciones de cada escenario')
+    parser.add_argument('--ventana', type=int, default=0, help='Ventana de crédito de los clientes')
+    parser.add_argument('--semilla', type=int, default=1, help='Semilla base de la carga y las suscripciones')
+    parser.add_argument('--salida', type=str, default=None, help='Archivo JSON con todas las ejecuciones')
+    parser.add_argument('--comparar', type=str, default=None, metavar='JSON',
+                        help='Salida de una ejecución anterior de la suite con la que comparar')
+    args = parser.parse_args()
+
+    args.criterios = args.criterios.split(',')
+    args.mezclas = args.mezclas.split(',')
+    for criterio in args.criterios:
+        if criterio not in CRITERIOS:
+            parser.error(f"Criterio desconocido: {criterio}")
+    for mezcla in args.mezclas:
+        if mezcla not in MEZCLAS:
+            parser.error(f"Mezcla desconocida: {mezcla}")
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            anterior = medianas(json.load(archivo)['ejecuciones'])
+
+    escenarios = crear_escenarios(args)
+    ejecuciones = []
+    for escenario in escenarios:
+        for repeticion in range(args.repeticiones):
+            registro = escenario.ejecutar(args, repeticion)
+            ejecuciones.append(registro)
+            print(f"{escenario.nombre} #{repeticion + 1}: {registro['resultados_por_segundo']:,.0f} resultados/s "
+                  f"en {registro['segundos']:.2f} s", file=sys.stderr)
+
+    documento = {
+        'version': VERSION_SUITE,
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit_actual(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'numpy': np is not None,
+        'cpus': os.cpu_count(),
+        'parametros': vars(args),
+        'ejecuciones': ejecuciones,
+    }
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump(documento, archivo, indent=2)
+    else:
+        json.dump(documento, sys.stdout, indent=2)
+        print()
+
+    print(file=sys.stderr)
+    with contextlib.redirect_stdout(sys.stderr if not args.salida else sys.stdout):
+        imprimir_tabla(medianas(ejecuciones), anterior)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Pruebas de regresión del despachador de colas.
+Se ejecutan con: python -m unittest discover tests (o pytest)
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from despachador import Despachador
+
+
+class PruebaPublicarLote(unittest.TestCase):
+
+    def test_lote_mayor_que_la_capacidad_despierta_al_suscriptor_en_espera(self):
+        """
+        Si la cola se llena a mitad del lote, el suscriptor que ya esperaba debe
+        despertar antes de que el productor se bloquee, sin agotar su timeout.
+        """
+        despachador = Despachador(['a'], capacidad=10)
+        suscripcion = despachador.suscribir(['a'])
+        recibidos = []
+
+        def consumir():
+            while len(recibidos) < 100:
+                recibidos.extend(despachador.obtener(suscripcion, 10, timeout=0.5))
+
+        consumidor = threading.Thread(target=consumir, daemon=True)
+        consumidor.start()
+        time.sleep(0.1)  # el suscriptor ya está esperando
+
+        inicio = time.perf_counter()
+        aceptados = despachador.publicar_lote('a', [{'id': i, 'cola': 'a'} for i in range(100)])
+        consumidor.join(5)
+        segundos = time.perf_counter() - inicio
+
+        self.assertEqual(aceptados, 100)
+        self.assertEqual([mensaje['id'] for mensaje in recibidos], list(range(100)))
+        self.assertLess(segundos, 0.5)
+
+
+class EventoEsperando:
+    """Sustituto de asyncio.Event: cuenta las veces que se activa."""
+
+    def __init__(self):
+        self.activaciones = 0
+
+    def set(self):
+        self.activaciones += 1
+
+
+class PruebaEsperaSinBloqueo(unittest.TestCase):
+
+    def test_publicar_despierta_solo_a_los_suscriptores_de_esa_cola(self):
+        despachador = Despachador(['a', 'b'])
+        en_a = despachador.suscribir(['a'])
+        en_b = despachador.suscribir(['b'])
+        for suscripcion in (en_a, en_b):
+            suscripcion.evento = EventoEsperando()
+            self.assertTrue(despachador.esperar_mensajes(suscripcion))
+
+        despachador.publicar_lote('a', [{'id': 1, 'cola': 'a'}])
+
+        self.assertEqual(en_a.evento.activaciones, 1)
+        self.assertEqual(en_b.evento.activaciones, 0)
+        self.assertFalse(despachador.esperar_mensajes(en_a))  # ya hay mensajes: no hace falta esperar
+
+    def test_una_toma_parcial_pasa_el_aviso_a_otro_suscriptor(self):
+        despachador = Despachador(['a'])
+        suscripciones = [despachador.suscribir(['a']) for _ in range(3)]
+        for suscripcion in suscripciones:
+            suscripcion.evento = EventoEsperando()
+            despachador.esperar_mensajes(suscripcion)
+
+        # Dos mensajes despiertan a dos de los tres suscriptores
+        despachador.publicar_lote('a', [{'id': 1, 'cola': 'a'}, {'id': 2, 'cola': 'a'}])
+        despiertos = [s for s in suscripciones if s.evento.activaciones]
+        dormido, = [s for s in suscripciones if not s.evento.activaciones]
+        self.assertEqual(len(despiertos), 2)
+
+        despachador.tomar(despiertos[0], 1)  # queda un mensaje en la cola
+
+        self.assertEqual(dormido.evento.activaciones, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Pruebas de regresión del motor asyncio del servidor.
+Se ejecutan con: python -m unittest discover tests (o pytest)
+"""
+
+import contextlib
+import io
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_integrated import SubscriberClient
+from generador import CRITERIO_ALEATORIO
+from servidor_asyncio import PublisherServerAsyncio
+
+# Segundos por mensaje del cliente lento
+DEMORA_LENTO = 0.0005
+
+
+class ClienteLento(SubscriberClient):
+    def procesar_mensajes(self, mensajes):
+        time.sleep(DEMORA_LENTO * len(mensajes))
+        return super().procesar_mensajes(mensajes)
+
+
+def puerto_libre() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class PruebaTTLAsyncio(unittest.TestCase):
+
+    def test_consumidor_lento_con_ttl_corto_no_detiene_el_generador(self):
+        """
+        Si una toma solo descarta mensajes expirados, libera espacio en la cola:
+        el generador debe despertar y seguir publicando.
+        """
+        objetivo = 2000
+        puerto = puerto_libre()
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            server = PublisherServerAsyncio(CRITERIO_ALEATORIO, 'localhost', puerto, objetivo=objetivo,
+                                            capacidad_cola=500, ttl=0.005)
+            server.mostrar_progreso = False
+            hilo_servidor = threading.Thread(target=server.servir, daemon=True)
+            hilo_servidor.start()
+            time.sleep(0.3)
+
+            cliente = ClienteLento('lento', 'localhost', puerto, ventana=64, suscripciones=['principal'])
+            hilo_cliente = threading.Thread(target=cliente.ejecutar, daemon=True)
+            hilo_cliente.start()
+
+            limite = time.monotonic() + 30
+            while server.running and server.total_resultados < objetivo and time.monotonic() < limite:
+                time.sleep(0.05)
+            total = server.total_resultados
+            expirados = server.despachador.expirados['principal']
+            server.detener()
+            hilo_servidor.join(10)
+            hilo_cliente.join(10)
+
+        self.assertGreaterEqual(total, objetivo)
+        self.assertGreater(expirados, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,283 @@
+"""
+Registro de tópicos - Modelo Publisher-Subscriber
+Define las colas (tópicos) del sistema, sus pesos y las reglas del criterio
+condicional, y los compila al iniciar en una tabla de enrutamiento:
+
+    - cada tópico tiene un código entero (su posición), el que viaja en las tramas
+    - los pesos se guardan acumulados: el criterio ponderado es una búsqueda
+      binaria sobre ellos (O(log n))
+    - las reglas condicionales se evalúan de antemano para cada combinación
+      de (cantidad de números, cantidad de pares): enrutar un mensaje es
+      indexar una tabla (O(1)), con el criterio ponderado como respaldo
+
+Sin archivo de configuración el registro tiene las tres colas clásicas con
+pesos 50/30/20 y las reglas condicionales originales. La configuración es un
+archivo JSON (o TOML, si la extensión es .toml):
+
+    {
+      "colas": [
+        {"nombre": "pedidos.alta", "peso": 3},
+        {"nombre": "pedidos.baja", "peso": 1},
+        {"nombre": "alertas"}
+      ],
+      "reglas": [
+        {"cantidad": 2, "pares": 2, "cola": "pedidos.alta"},
+        {"impares": 3, "cola": "alertas"}
+      ]
+    }
+
+El peso por defecto es 1. Una regla puede fijar `cantidad` (2 o 3), `pares`
+o `impares`; la primera regla que coincide decide la cola. Servidor y
+clientes deben usar el mismo archivo, porque el código de cada tópico es su
+posición en `colas`.
+
+Cada cola puede fijar además, solo para el servidor, un tiempo de vida en
+segundos (`ttl`: los mensajes más viejos se descartan al desencolarlos) y
+niveles de prioridad (`prioridades`: una lista con el peso y el TTL opcional
+de cada nivel, el primero es el más urgente, o solo el número de niveles,
+todos con el mismo peso):
+
+    {"nombre": "alertas", "ttl": 2.0,
+     "prioridades": [{"peso": 1, "ttl": 0.1}, {"peso": 4}]}
+
+Los clientes se suscriben con patrones de estilo shell ('pedidos.*', '*',
+'alertas'), que se resuelven contra el registro (ver resolver).
+"""
+
+import bisect
+import fnmatch
+import json
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from protocolo import COLAS, COLA_PRINCIPAL, COLA_SECUNDARIA, COLA_TERCIARIA, MAX_NUMEROS
+
+# El código de tópico y el número de colas del saludo ocupan un byte cada uno
+MAX_TOPICOS = 255
+
+# El nivel de prioridad de un mensaje se guarda en un byte
+MAX_PRIORIDADES = 255
+
+# Marca de la tabla condicional: ninguna regla coincide, se usa el ponderado
+SIN_REGLA = -1
+
+PESOS_PREDETERMINADOS = (0.5, 0.3, 0.2)
+REGLAS_PREDETERMINADAS = (
+    {'cantidad': 2, 'pares': 2, 'cola': COLA_PRINCIPAL},
+    {'cantidad': 2, 'impares': 2, 'cola': COLA_SECUNDARIA},
+    {'cantidad': 3, 'pares': 3, 'cola': COLA_TERCIARIA},
+    {'cantidad': 3, 'impares': 3, 'cola': COLA_TERCIARIA},
+)
+
+CRITERIO_ALEATORIO = "aleatorio"
+CRITERIO_PONDERADO = "ponderado"
+CRITERIO_CONDICIONAL = "condicional"
+
+
+def validar_ttl(ttl, descripcion: str) -> Optional[float]:
+    """TTL en segundos (None: sin TTL); debe ser positivo."""
+    if ttl is None:
+        return None
+    ttl = float(ttl)
+    if ttl <= 0:
+        raise ValueError(f"El TTL de {descripcion} debe ser positivo")
+    return ttl
+
+
+class NivelesPrioridad:
+    """
+    Niveles de prioridad de una cola: el generador sortea el nivel de cada
+    mensaje según los pesos, y el nivel 0 es el primero en entregarse. Un
+    nivel con TTL lo impone a cada uno de sus mensajes (campo 'ttl').
+    """
+
+    def __init__(self, pesos: Sequence[float], ttl: Optional[Sequence[Optional[float]]] = None):
+        """
+        Args:
+            pesos: Peso de cada nivel, del más urgente al menos urgente
+            ttl: Tiempo de vida en segundos de los mensajes de cada nivel (None: el de la cola)
+        """
+        self.pesos = tuple(float(peso) for peso in pesos)
+        if not 1 <= len(self.pesos) <= MAX_PRIORIDADES:
+            raise ValueError(f"Una cola admite de 1 a {MAX_PRIORIDADES} niveles de prioridad")
+        if any(peso < 0 for peso in self.pesos) or not sum(self.pesos):
+            raise ValueError("Los pesos de las prioridades deben ser no negativos y no todos cero")
+        self.acumulados = tuple(accumulate(self.pesos))
+        self.total = self.acumulados[-1]
+        ttl = tuple(ttl) if ttl is not None else (None,) * len(self.pesos)
+        if len(ttl) != len(self.pesos):
+            raise ValueError("Se necesita un TTL (o None) por nivel de prioridad")
+        self.ttl = tuple(validar_ttl(valor, f"la prioridad {nivel}") for nivel, valor in enumerate(ttl))
+        # En nanosegundos, como los timestamps (0: sin TTL propio)
+        self.ttl_ns = tuple(int(valor * 1e9) if valor else 0 for valor in self.ttl)
+
+    def __len__(self):
+        return len(self.pesos)
+
+
+class RegistroTopicos:
+    """Tópicos con sus códigos, pesos acumulados y tabla condicional precalculada."""
+
+    def __init__(self, nombres: Sequence[str], pesos: Optional[Sequence[float]] = None,
+                 reglas: Iterable[Dict] = (), ttl: Optional[Dict[str, float]] = None,
+                 prioridades: Optional[Dict[str, NivelesPrioridad]] = None):
+        """
+        Args:
+            nombres: Nombre de cada tópico; su posición es su código
+            pesos: Peso de cada tópico para el criterio ponderado (por defecto, todos 1)
+            reglas: Reglas del criterio condicional, en orden de prioridad
+            ttl: Tiempo de vida en segundos de los mensajes de cada cola que lo tenga
+            prioridades: Niveles de prioridad de cada cola que los tenga
+        """
+        self.nombres = tuple(nombres)
+        if not self.nombres:
+            raise ValueError("El registro de tópicos no tiene colas")
+        if len(self.nombres) > MAX_TOPICOS:
+            raise ValueError(f"Demasiados tópicos: {len(self.nombres)} (máximo {MAX_TOPICOS})")
+        if len(set(self.nombres)) != len(self.nombres):
+            raise ValueError("Hay tópicos con el nombre repetido")
+        if not all(isinstance(nombre, str) and nombre for nombre in self.nombres):
+            raise ValueError("Cada tópico necesita un nombre")
+        self.codigos: Dict[str, int] = {nombre: codigo for codigo, nombre in enumerate(self.nombres)}
+
+        self.pesos = tuple(float(peso) for peso in pesos) if pesos is not None else (1.0,) * len(self.nombres)
+        if len(self.pesos) != len(self.nombres):
+            raise ValueError("Se necesita un peso por tópico")
+        if any(peso < 0 for peso in self.pesos) or not sum(self.pesos):
+            raise ValueError("Los pesos deben ser no negativos y no todos cero")
+        self.acumulados = tuple(accumulate(self.pesos))
+        self.total = self.acumulados[-1]
+
+        self.tabla_condicional = self._compilar_reglas(list(reglas))
+
+        self.ttl: Dict[str, float] = {}
+        for cola, valor in (ttl or {}).items():
+            if cola not in self.codigos:
+                raise ValueError(f"TTL de una cola desconocida: {cola}")
+            if valor is not None:
+                self.ttl[cola] = validar_ttl(valor, f"la cola {cola}")
+        self.prioridades: Dict[str, NivelesPrioridad] = {}
+        for cola, niveles in (prioridades or {}).items():
+            if cola not in self.codigos:
+                raise ValueError(f"Prioridades de una cola desconocida: {cola}")
+            if len(niveles) > 1 or niveles.ttl[0] is not None:
+                self.prioridades[cola] = niveles
+        # Métodos y no lambdas: el registro viaja por pickle a los procesos trabajadores
+        self.enrutadores = {
+            CRITERIO_ALEATORIO: self._enrutar_aleatorio,
+            CRITERIO_PONDERADO: self._enrutar_ponderado,
+            CRITERIO_CONDICIONAL: self._enrutar_condicional,
+        }
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def _compilar_reglas(self, reglas: List[Dict]) -> List[List[int]]:
+        """
+        Tabla [cantidad][pares] -> código de tópico (o SIN_REGLA) con la
+        primera regla que coincide en cada celda.
+        """
+        tabla = [[SIN_REGLA] * (MAX_NUMEROS + 1) for _ in range(MAX_NUMEROS + 1)]
+        for regla in reglas:
+            desconocidas = set(regla) - {'cantidad', 'pares', 'impares', 'cola'}
+            if desconocidas:
+                raise ValueError(f"Campos desconocidos en una regla: {', '.join(sorted(desconocidas))}")
+            if regla.get('cola') not in self.codigos:
+                raise ValueError(f"Regla con una cola desconocida: {regla.get('cola')}")
+            codigo = self.codigos[regla['cola']]
+            for cantidad in range(2, MAX_NUMEROS + 1):
+                if regla.get('cantidad', cantidad) != cantidad:
+                    continue
+                for pares in range(cantidad + 1):
+                    if (regla.get('pares', pares) == pares and regla.get('impares', cantidad - pares) == cantidad - pares
+                            and tabla[cantidad][pares] == SIN_REGLA):
+                        tabla[cantidad][pares] = codigo
+        return tabla
+
+    def codigo_ponderado(self, azar: float) -> int:
+        """Tópico del criterio ponderado para un número uniforme en [0, 1)."""
+        return bisect.bisect(self.acumulados, azar * self.total, 0, len(self.nombres) - 1)
+
+    def codigo_condicional(self, numeros: List[int], azar: float) -> int:
+        """Tópico del criterio condicional; sin regla que coincida, el ponderado de `azar`."""
+        pares = sum(1 for n in numeros if n % 2 == 0)
+        codigo = self.tabla_condicional[len(numeros)][pares]
+        return codigo if codigo != SIN_REGLA else self.codigo_ponderado(azar)
+
+    def _enrutar_aleatorio(self, numeros: List[int], rng) -> int:
+        return rng.randrange(len(self.nombres))
+
+    def _enrutar_ponderado(self, numeros: List[int], rng) -> int:
+        return self.codigo_ponderado(rng.random())
+
+    def _enrutar_condicional(self, numeros: List[int], rng) -> int:
+        return self.codigo_condicional(numeros, rng.random())
+
+    def enrutar(self, criterio: str, numeros: List[int], rng) -> int:
+        """Código del tópico de un mensaje según el criterio (rng: un random.Random o el módulo random)."""
+        try:
+            enrutador = self.enrutadores[criterio]
+        except KeyError:
+            raise ValueError(f"Criterio desconocido: {criterio}") from None
+        return enrutador(numeros, rng)
+
+    def resolver(self, patrones: Iterable[str]) -> Set[str]:
+        """
+        Tópicos que coinciden con alguno de los patrones (estilo shell:
+        '*', '?', '[...]'). Un patrón que no coincide con ningún tópico es un error.
+        """
+        colas = set()
+        for patron in patrones:
+            coincidencias = [nombre for nombre in self.nombres if fnmatch.fnmatchcase(nombre, patron)]
+            if not coincidencias:
+                raise ValueError(f"Ningún tópico coincide con '{patron}'")
+            colas.update(coincidencias)
+        return colas
+
+
+REGISTRO_PREDETERMINADO = RegistroTopicos(COLAS, PESOS_PREDETERMINADOS, REGLAS_PREDETERMINADAS)
+
+
+def registro_desde_config(config: Dict) -> RegistroTopicos:
+    """Compila el registro a partir de la configuración ya leída (ver el formato arriba)."""
+    colas = config.get('colas')
+    if not isinstance(colas, list):
+        raise ValueError("La configuración de tópicos necesita una lista 'colas'")
+    nombres = []
+    pesos = []
+    ttl = {}
+    prioridades = {}
+    for cola in colas:
+        if isinstance(cola, str):
+            cola = {'nombre': cola}
+        elif not isinstance(cola, dict):
+            raise ValueError(f"Cada cola debe ser un nombre o una tabla con 'nombre': {cola!r}")
+        nombre = cola.get('nombre')
+        nombres.append(nombre)
+        pesos.append(cola.get('peso', 1.0))
+        if cola.get('ttl') is not None:
+            ttl[nombre] = cola['ttl']
+        niveles = cola.get('prioridades')
+        if isinstance(niveles, int):
+            prioridades[nombre] = NivelesPrioridad([1.0] * niveles)
+        elif niveles is not None:
+            if not isinstance(niveles, list):
+                raise ValueError(f"'prioridades' de {nombre} debe ser un número o una lista de niveles")
+            niveles = [nivel if isinstance(nivel, dict) else {'peso': nivel} for nivel in niveles]
+            prioridades[nombre] = NivelesPrioridad([nivel.get('peso', 1.0) for nivel in niveles],
+                                                   [nivel.get('ttl') for nivel in niveles])
+    return RegistroTopicos(nombres, pesos, config.get('reglas', ()), ttl, prioridades)
+
+
+def cargar_registro(ruta: Optional[str]) -> RegistroTopicos:
+    """Registro de tópicos del archivo (JSON o TOML), o el predeterminado si no hay archivo."""
+    if ruta is None:
+        return REGISTRO_PREDETERMINADO
+    if ruta.endswith('.toml'):
+        import tomllib  # Python 3.11+
+        with open(ruta, 'rb') as archivo:
+            config = tomllib.load(archivo)
+    else:
+        with open(ruta) as archivo:
+            config = json.load(archivo)
+    return registro_desde_config(config)
@@ -0,0 +1,235 @@
+"""
+Modo multiproceso del Servidor Publisher - Modelo Publisher-Subscriber
+Reparte el servidor entre varios procesos trabajadores para usar más de un
+núcleo. Cada trabajador es un PublisherServer completo (generación,
+despacho, ambos puertos y agregación) que comparte los puertos con los demás
+mediante SO_REUSEPORT: el kernel reparte las conexiones entrantes entre
+ellos, y cada trabajador genera mensajes solo para sus propios clientes,
+con un rango de IDs propio.
+
+El coordinador (el proceso principal) suma los conteos que cada trabajador
+publica en un arreglo de memoria compartida (una posición por trabajador,
+sin locks), detiene a todos al alcanzar el objetivo y combina el estado
+final de cada uno en un único reporte.
+"""
+
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from queue import Empty
+from typing import Dict, List
+
+from agregacion import AgregadorResultados
+from despachador import combinar_utilizacion
+from metricas import desplazar_direccion
+from perfilado import combinar_tiempos
+
+# Cada cuánto publica un trabajador su conteo y comprueba si debe detenerse
+INTERVALO_COORDINACION = 0.05
+
+# Separación entre los rangos de IDs de mensaje de cada trabajador
+SEPARACION_IDS = 1 << 48
+
+# Tiempo máximo para recibir el estado final de un trabajador
+ESPERA_ESTADO_FINAL = 30.0
+
+
+def crear_servidor(motor: str, criterio: str, host: str, port: int, opciones: Dict):
+    """Crea el servidor del motor indicado ('hilos' o 'asyncio')."""
+    from server_integrated import PublisherServer, MOTOR_ASYNCIO
+    if motor == MOTOR_ASYNCIO:
+        from servidor_asyncio import PublisherServerAsyncio
+        return PublisherServerAsyncio(criterio, host, port, **opciones)
+    return PublisherServer(criterio, host, port, **opciones)
+
+
+def ejecutar_trabajador(indice: int, motor: str, criterio: str, host: str, port: int, opciones: Dict,
+                        contadores, fin, estados):
+    """
+    Punto de entrada de un proceso trabajador.
+
+    Args:
+        indice: Posición del trabajador en `contadores`
+        contadores: Arreglo compartido con los resultados de cada trabajador
+        fin: Evento que el coordinador activa para detener a todos
+        estados: Cola por la que se devuelve el estado final al coordinador
+    """
+    if opciones.get('directorio_persistencia'):
+        # Cada trabajador registra sus colas en su propio subdirectorio
+        opciones = dict(opciones, directorio_persistencia=os.path.join(
+            opciones['directorio_persistencia'], f"trabajador-{indice}"))
+    if opciones.get('semilla') is not None:
+        # Cargas distintas pero reproducibles en cada trabajador
+        opciones = dict(opciones, semilla=opciones['semilla'] + indice)
+    if opciones.get('reproducir'):
+        # Cada trabajador reproduce un tramo contiguo de la grabación
+        opciones = dict(opciones, tramo_reproduccion=(indice, len(contadores)))
+    if opciones.get('direccion_metricas'):
+        # Un endpoint por trabajador: puerto + índice o ruta con sufijo
+        opciones = dict(opciones, direccion_metricas=desplazar_direccion(opciones['direccion_metricas'], indice))
+    server = crear_servidor(motor, criterio, host, port, opciones)
+    server.reutilizar_puerto = True
+    server.primer_mensaje_id = max(server.primer_mensaje_id, indice * SEPARACION_IDS)
+    server.mostrar_progreso = False
+
+    def vigilar():
+        while server.running and not fin.is_set():
+            contadores[indice] = server.total_resultados
+            fin.wait(INTERVALO_COORDINACION)
+        contadores[indice] = server.total_resultados
+        server.detener()
+
+    threading.Thread(target=vigilar, daemon=True).start()
+
+    try:
+        server.servir()
+    except KeyboardInterrupt:
+        server.detener()
+    server.guardar_perfiles()
+
+    contadores[indice] = server.total_resultados
+    estados.put((indice, server.estado_final()))
+
+
+def combinar_estados(estados: List[Dict]) -> Dict:
+    """Combina los estados finales de varios trabajadores en uno solo para el reporte."""
+    agregador = AgregadorResultados(estados[0]['agregador'].con_histograma,
+                                    estados[0]['agregador'].almacen is not None)
+    utilizacion = {}
+    for estado in estados:
+        agregador.combinar(estado['agregador'])
+        for cliente_id, datos in estado['utilizacion'].items():
+            anterior = utilizacion.get(cliente_id)
+            utilizacion[cliente_id] = datos if anterior is None else combinar_utilizacion(anterior, datos)
+
+    colas = estados[0]['colas']
+    return {
+        'agregador': agregador,
+        'colas': colas,
+        'capacidad': estados[0]['capacidad'],
+        'politica_desborde': estados[0]['politica_desborde'],
+        'pendientes': {cola: sum(e['pendientes'][cola] for e in estados) for cola in colas},
+        'descartados': {cola: sum(e['descartados'][cola] for e in estados) for cola in colas},
+        'reencolados': {cola: sum(e['reencolados'][cola] for e in estados) for cola in colas},
+        'expirados': {cola: sum(e['expirados'][cola] for e in estados) for cola in colas},
+        'ttl': estados[0]['ttl'],
+        'prioridades': estados[0]['prioridades'],
+        'tiempo_bloqueo': sum(e['tiempo_bloqueo'] for e in estados),
+        'tiempos': functools.reduce(combinar_tiempos, (e['tiempos'] for e in estados)),
+        'lock_colas': tuple(map(sum, zip(*(e['lock_colas'] for e in estados)))),
+        'utilizacion': utilizacion,
+        'trabajadores': [
+            (e['agregador'].total.cantidad, len(e['agregador'].por_cliente)) for e in estados
+        ],
+    }
+
+
+class CoordinadorTrabajadores:
+    """Lanza los procesos trabajadores, vigila el objetivo global y genera el reporte combinado."""
+
+    def __init__(self, trabajadores: int, motor: str, criterio: str, host: str, port: int, opciones: Dict):
+        """
+        Args:
+            trabajadores: Número de procesos trabajadores
+            motor: Motor de E/S de cada trabajador ('hilos' o 'asyncio')
+            criterio: Criterio de selección de cola
+            host: Dirección del servidor
+            port: Puerto de mensajes (resultados en port + 1)
+            opciones: Argumentos adicionales de PublisherServer
+        """
+        self.trabajadores = trabajadores
+        self.motor = motor
+        self.criterio = criterio
+        self.host = host
+        self.port = port
+        self.opciones = opciones
+        self.objetivo = opciones['objetivo']
+
+        contexto = multiprocessing.get_context('spawn')
+        self.contexto = contexto
+        self.contadores = contexto.Array('q', trabajadores, lock=False)
+        self.fin = contexto.Event()
+        self.estados = contexto.Queue()
+        self.procesos = []
+        self.estado = None
+
+        print(f"Servidor Publisher iniciado con criterio: {criterio} ({trabajadores} procesos)")
+
+    @property
+    def total_resultados(self) -> int:
+        """Suma de los conteos publicados por los trabajadores."""
+        return sum(self.contadores)
+
+    def vigilar_objetivo(self):
+        """Espera hasta alcanzar el objetivo global (o hasta que terminen todos los trabajadores)."""
+        reportado = 0
+        ultimo_reporte = time.monotonic()
+        while not self.fin.is_set():
+            time.sleep(INTERVALO_COORDINACION)
+            total = self.total_resultados
+
+            if total >= self.objetivo:
+                print(f"\n¡Objetivo alcanzado! {total:,} resultados recibidos.")
+                break
+            if not any(proceso.is_alive() for proceso in self.procesos):
+                print("Todos los trabajadores terminaron antes de alcanzar el objetivo.")
+                break
+
+            if time.monotonic() - ultimo_reporte >= 1 and total // 10000 > reportado // 10000:
+                print(f"Resultados recibidos: {total:,} / {self.objetivo:,}")
+                reportado = total
+                ultimo_reporte = time.monotonic()
+        self.fin.set()
+
+    def detener(self):
+        """Pide a todos los trabajadores que se detengan."""
+        self.fin.set()
+
+    def recoger_estados(self) -> List[Dict]:
+        """Recibe el estado final de cada trabajador, ordenado por índice."""
+        recibidos = {}
+        while len(recibidos) < len(self.procesos):
+            try:
+                indice, estado = self.estados.get(timeout=ESPERA_ESTADO_FINAL)
+            except Empty:
+                print("ERROR: Algún trabajador no devolvió su estado final.")
+                break
+            recibidos[indice] = estado
+        return [recibidos[indice] for indice in sorted(recibidos)]
+
+    def iniciar(self):
+        """Ejecuta los trabajadores hasta alcanzar el objetivo y muestra el reporte combinado."""
+        for indice in range(self.trabajadores):
+            proceso = self.contexto.Process(
+                target=ejecutar_trabajador,
+                args=(indice, self.motor, self.criterio, self.host, self.port, self.opciones,
+                      self.contadores, self.fin, self.estados),
+                name=f"trabajador-{indice}"
+            )
+            proceso.start()
+            self.procesos.append(proceso)
+
+        try:
+            self.vigilar_objetivo()
+        except KeyboardInterrupt:
+            print("\nDeteniendo trabajadores...")
+        finally:
+            self.fin.set()
+            # Recoger los estados antes de join: un proceso no termina hasta vaciar su cola
+            estados = self.recoger_estados()
+            for proceso in self.procesos:
+                proceso.join(timeout=5)
+
+        if estados:
+            self.estado = combinar_estados(estados)
+        self.generar_reporte_final()
+
+    def generar_reporte_final(self):
+        """Muestra el reporte combinado de todos los trabajadores."""
+        from server_integrated import imprimir_reporte_final
+        if self.estado is None:
+            print("No hay estado de los trabajadores para generar el reporte.")
+            return
+        imprimir_reporte_final(self.estado)